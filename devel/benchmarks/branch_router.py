@@ -0,0 +1,69 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Microbenchmark picking the branch for a subject from a forge's branch rules.
+
+Builds ``--rules`` subject match rules, one per branch, like
+``\\[.*TAG<n>.*\\]``, and times finding the branch for subjects that match a
+rule near the start, the middle, and the end of the list, and no rule at all.
+Each is timed with :class:`patchlab.routing.BranchRouter` and with
+``re.search`` on each rule in turn, as :meth:`patchlab.models.GitForge.branch`
+used to. Building the router is timed as well; it happens once per forge.
+"""
+
+import re
+
+import common
+
+
+def rules(count):
+    return [(rf"\[.*TAG{index}\b.*\]", f"branch-{index}") for index in range(count)]
+
+
+def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument(
+        "--rules", type=int, default=2000, help="Branch rules (default: 2000)"
+    )
+    args = parser.parse_args()
+
+    common.setup_django()
+    from patchlab.routing import BranchRouter
+
+    branch_rules = rules(args.rules)
+    subjects = {
+        "first": "[TAG0 PATCH v2 1/3] Bring balance to the equals signs",
+        "middle": f"[TAG{args.rules // 2} PATCH v2 1/3] Bring balance to the equals signs",
+        "last": f"[TAG{args.rules - 1} PATCH v2 1/3] Bring balance to the equals signs",
+        "none": "[PATCH v2 1/3] Bring balance to the equals signs",
+    }
+
+    def search(subject):
+        for subject_match, name in branch_rules:
+            if re.search(subject_match, subject, flags=re.MULTILINE | re.IGNORECASE):
+                return name
+        return None
+
+    router = BranchRouter(branch_rules)
+    results = {
+        "benchmark": "branch_router",
+        "rules": args.rules,
+        "build_seconds": common.summarize(
+            common.time_calls(lambda: BranchRouter(branch_rules), args.repeat)
+        ),
+        "seconds": {},
+    }
+    for position, subject in subjects.items():
+        assert router.match(subject) == search(subject)
+        results["seconds"][position] = {
+            "router": common.summarize(
+                common.time_calls(lambda: router.match(subject), args.repeat)
+            ),
+            "re_search": common.summarize(
+                common.time_calls(lambda: search(subject), args.repeat)
+            ),
+        }
+    common.write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Microbenchmark for resolving the Ccs of a merge request series.
+
+Builds a synthetic series with realistic trailers and times resolving the Ccs
+of every patch plus the cover letter with :class:`patchlab.gitlab2email.CcResolver`.
+"""
+
+from unittest import mock
+
+import common
+
+
+def synthetic_series(num_commits, num_people=50):
+    people = [f"Developer {i} <dev{i}@example.com>" for i in range(num_people)]
+    commits = []
+    for i in range(num_commits):
+        trailers = "\n".join(
+            [
+                f"Cc: {people[(i + 1) % num_people]}",
+                f"Reviewed-by: {people[(i + 2) % num_people]}",
+                f"Acked-by: {people[(i + 3) % num_people]}",
+                f"Signed-off-by: {people[i % num_people]}",
+            ]
+        )
+        commits.append(
+            mock.Mock(
+                author_email=f"dev{i % num_people}@example.com",
+                message=f"Commit {i}\n\nA description of the change.\n\n{trailers}\n",
+            )
+        )
+    merge_request = mock.Mock(
+        description="A series.\n\nCc: Maintainer <maintainer@example.com>\n",
+        labels=["Cc: list@example.com", "Needs review"],
+    )
+    return merge_request, commits
+
+
+def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument(
+        "--commits", type=int, default=500, help="Commits in the series (default: 500)"
+    )
+    args = parser.parse_args()
+
+    common.setup_django()
+    from patchlab.gitlab2email import CcResolver
+
+    merge_request, commits = synthetic_series(args.commits)
+
+    def resolve():
+        resolver = CcResolver(merge_request)
+        for commit in commits:
+            resolver.commit(commit)
+        return resolver.series_ccs
+
+    results = {
+        "benchmark": "ccs",
+        "commits": args.commits,
+        "seconds": common.summarize(common.time_calls(resolve, args.repeat)),
+    }
+    common.write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
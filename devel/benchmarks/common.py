@@ -0,0 +1,98 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""Helpers shared by the benchmark scripts."""
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def setup_django(settings_module="patchlab.settings.ci"):
+    """Configure Django so Patchlab can be imported outside of manage.py."""
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+
+    import django
+
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database():
+    """
+    Create a test database, with the unit test fixtures loaded, for the duration.
+
+    Django must already be set up with :func:`setup_django`.
+    """
+    from django.core.management import call_command
+    from django.test.utils import setup_databases, teardown_databases
+
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        call_command("loaddata", "unittest.json", verbosity=0)
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+
+def argument_parser(description, repeat=True):
+    """
+    Create an argument parser with the options every benchmark supports.
+
+    Args:
+        repeat: Whether to add the ``--repeat`` option for benchmarks that time
+            a number of identical runs.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    if repeat:
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Number of timed runs (default: 20)"
+        )
+    parser.add_argument(
+        "--output", help="Write the results as JSON to this file instead of stdout"
+    )
+    return parser
+
+
+def time_calls(func, repeat):
+    """Call ``func`` ``repeat`` times and return the duration of each call."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Summarize a list of durations, in seconds."""
+    return {
+        "runs": len(samples),
+        "min": min(samples),
+        "mean": statistics.mean(samples),
+        "p50": percentile(samples, 50),
+        "p99": percentile(samples, 99),
+        "max": max(samples),
+    }
+
+
+def write_results(results, output=None):
+    """Write benchmark results as JSON to ``output`` or stdout."""
+    document = json.dumps(results, indent=2, sort_keys=True)
+    if output:
+        with open(output, "w") as fd:
+            fd.write(document + "\n")
+    else:
+        print(document)
@@ -0,0 +1,132 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Microbenchmark the post_save handlers run for every patch and comment saved.
+
+Times :func:`patchlab.events.patch_event_handler` and
+:func:`patchlab.events.comment_event_handler` for headers like those of mail
+from a busy mailing list, of mail Patchlab sent itself, and while Patchlab is
+recording its own mail. Patch saves are for a series that isn't complete, and
+looking up the bridged submission and dispatching comments are replaced with
+no-ops, so no database is needed. For comparison, parsing the same headers
+with :func:`email.message_from_string` is timed as well. Times are per save,
+for a batch of ``--saves`` saves.
+"""
+
+import email
+import types
+from unittest import mock
+
+import common
+
+
+class NotBridged:
+    """Stands in for ``BridgedSubmission.objects``; nothing was bridged."""
+
+    def filter(self, **kwargs):
+        return self
+
+    def values_list(self, *fields, **kwargs):
+        return self
+
+    def first(self):
+        return None
+
+
+def list_headers(hops):
+    """Headers like those Patchwork stores for mail from a mailing list."""
+    received = "".join(
+        f"Received: from relay{hop}.example.com (relay{hop}.example.com "
+        f"[192.0.2.{hop}])\n\tby mx.example.com with ESMTPS id {hop:08x};\n"
+        "\tMon, 04 Nov 2019 23:00:00 -0000\n"
+        for hop in range(hops)
+    )
+    return (
+        f"{received}"
+        'Content-Type: text/plain; charset="utf-8"\n'
+        "MIME-Version: 1.0\n"
+        "Content-Transfer-Encoding: 7bit\n"
+        "Subject: [TEST PATCH 1/2] Bring balance to the equals signs\n"
+        "From: Jeremy Cline <jcline@redhat.com>\n"
+        "To: kernel@lists.fedoraproject.org\n"
+        "Cc: Developer One <dev1@example.com>,\n"
+        "\tDeveloper Two <dev2@example.com>\n"
+        "Date: Mon, 04 Nov 2019 23:00:00 -0000\n"
+        "Message-ID: <4@localhost.localdomain>\n"
+        "In-Reply-To: <3@localhost.localdomain>\n"
+        "List-Id: kernel.lists.fedoraproject.org\n"
+        "List-Unsubscribe: <mailto:kernel-leave@lists.fedoraproject.org>\n"
+        "List-Archive: <https://lists.fedoraproject.org/archives/list/kernel/>\n"
+        "X-Mailer: git-send-email 2.23.0\n"
+    )
+
+
+def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument(
+        "--saves", type=int, default=10000, help="Saves per timed run (default: 10000)"
+    )
+    parser.add_argument(
+        "--hops",
+        type=int,
+        default=8,
+        help="Received headers on mailing list mail (default: 8)",
+    )
+    args = parser.parse_args()
+
+    common.setup_django()
+    from patchlab import events, gitlab2email
+
+    headers = {
+        "list": list_headers(args.hops),
+        "bridged": list_headers(args.hops)
+        + "X-Patchlab-Merge-Request: https://gitlab/root/kernel/merge_requests/1\n"
+        + "X-Patchlab-Comment: https://gitlab/root/kernel/merge_requests/1#note_1\n",
+    }
+    series = types.SimpleNamespace(received_all=False)
+
+    def timed(func, instance, recording=False):
+        def run():
+            for _ in range(args.saves):
+                func(None, instance=instance)
+
+        if recording:
+            with gitlab2email._recording():
+                samples = common.time_calls(run, args.repeat)
+        else:
+            samples = common.time_calls(run, args.repeat)
+        return common.summarize([sample / args.saves for sample in samples])
+
+    results = {
+        "benchmark": "event_handlers",
+        "saves": args.saves,
+        "hops": args.hops,
+        "seconds_per_save": {},
+    }
+    with mock.patch.object(events, "dispatch", lambda *args: None), mock.patch.object(
+        events, "BridgedSubmission", types.SimpleNamespace(objects=NotBridged())
+    ), mock.patch.object(events._log, "disabled", True):
+        for origin, mail_headers in headers.items():
+            patch = types.SimpleNamespace(id=1, series=series, headers=mail_headers)
+            comment = types.SimpleNamespace(id=1, submission_id=1, headers=mail_headers)
+            results["seconds_per_save"][origin] = {
+                "patch": timed(events.patch_event_handler, patch),
+                "comment": timed(events.comment_event_handler, comment),
+                "message_from_string": timed(
+                    lambda sender, instance: email.message_from_string(
+                        instance.headers
+                    ),
+                    patch,
+                ),
+            }
+        patch = types.SimpleNamespace(id=1, series=series, headers=headers["list"])
+        comment = types.SimpleNamespace(id=1, submission_id=1, headers=headers["list"])
+        results["seconds_per_save"]["recording"] = {
+            "patch": timed(events.patch_event_handler, patch, recording=True),
+            "comment": timed(events.comment_event_handler, comment, recording=True),
+        }
+
+    common.write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Local stand-ins for GitLab and an SMTP server.
+
+Both run in background threads on an ephemeral port on 127.0.0.1 so
+benchmarks can exercise the full bridging path without touching a real forge
+or mail server.
+"""
+
+import collections
+import email
+import http.server
+import json
+import os
+import re
+import socketserver
+import tempfile
+import threading
+import time
+import urllib.parse
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class FakeGitLab:
+    """
+    A GitLab API server that makes up merge requests on demand.
+
+    Every project and merge request ID exists, and every merge request has
+    ``commits`` commits. Commit messages have Cc, Reviewed-by, Acked-by, and
+    Signed-off-by trailers drawn from ``people`` developers, and each patch
+    adds ``patch_lines`` lines. Each response is delayed by ``latency`` seconds.
+    Commits are paginated like GitLab does, honoring ``per_page`` up to 100.
+
+    Attributes:
+        url: The base URL of the server, e.g. ``http://127.0.0.1:1234``.
+        host: The hostname Patchlab uses to find the server's configuration.
+        requests: A counter of the requests served, by path pattern.
+    """
+
+    username = "patchlab-bot"
+
+    def __init__(self, commits=3, latency=0.0, patch_lines=1, people=50):
+        self.commits = commits
+        self.latency = latency
+        self.patch_lines = patch_lines
+        self.people = people
+        self.requests = collections.Counter()
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake._handle(self)
+
+            def do_POST(self):
+                fake._handle(self)
+
+            def do_PUT(self):
+                fake._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = _ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.host = "127.0.0.1"
+        self.url = f"http://{self.host}:{self._server.server_port}"
+        self._routes = [
+            (re.compile(r"/api/v4/user$"), "user", self._user),
+            (re.compile(r"/api/v4/projects/(\d+)$"), "project", self._project),
+            (
+                re.compile(r"/api/v4/projects/(\d+)/merge_requests/(\d+)$"),
+                "merge_request",
+                self._merge_request,
+            ),
+            (
+                re.compile(r"/api/v4/projects/(\d+)/merge_requests/(\d+)/commits$"),
+                "commits",
+                self._commits,
+            ),
+            (
+                re.compile(r"/api/v4/projects/(\d+)/merge_requests/(\d+)/notes$"),
+                "notes",
+                self._note,
+            ),
+            (re.compile(r"/root/project-(\d+)/commit/(\w+)\.patch$"), "patch", None),
+        ]
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def python_gitlab_config(self):
+        """
+        Write a python-gitlab configuration file for this server.
+
+        Returns:
+            str: The path to the file; point ``PYTHON_GITLAB_CFG`` at it.
+        """
+        fd, path = tempfile.mkstemp(suffix=".cfg")
+        with os.fdopen(fd, "w") as config:
+            config.write(
+                f"[global]\ndefault = {self.host}\n\n"
+                f"[{self.host}]\nurl = {self.url}\nprivate_token = benchmark\n"
+                "api_version = 4\n"
+            )
+        return path
+
+    def web_url(self, project_id, merge_id=None):
+        url = f"{self.url}/root/project-{project_id}"
+        if merge_id is not None:
+            url += f"/merge_requests/{merge_id}"
+        return url
+
+    def sha(self, project_id, merge_id, commit=0):
+        """The sha of a commit; the head of a merge request is commit 0."""
+        return f"{project_id:08x}{merge_id:016x}{commit:016x}"
+
+    def _handle(self, request):
+        if self.latency:
+            time.sleep(self.latency)
+        path, _, query = request.path.partition("?")
+        query = dict(urllib.parse.parse_qsl(query))
+        for pattern, name, view in self._routes:
+            match = pattern.match(path)
+            if match:
+                with self._lock:
+                    self.requests[name] += 1
+                if view is None:
+                    return self._send(
+                        request, self._patch(*match.groups()), "text/plain"
+                    )
+                body, headers = view(query, *match.groups())
+                return self._send(
+                    request, json.dumps(body), "application/json", headers
+                )
+        self._send(request, json.dumps({"message": "404 Not found"}), status=404)
+
+    def _send(
+        self, request, body, content_type="application/json", headers=None, status=200
+    ):
+        data = body.encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+    def _person(self, number):
+        number %= self.people
+        return f"Developer {number}", f"dev{number}@example.com"
+
+    def _user(self, query=None):
+        return {"id": 1, "username": self.username, "name": "Patchlab"}, {}
+
+    def _project(self, query, project_id):
+        project_id = int(project_id)
+        return (
+            {
+                "id": project_id,
+                "name": f"project-{project_id}",
+                "path_with_namespace": f"root/project-{project_id}",
+                "web_url": self.web_url(project_id),
+                "http_url_to_repo": f"{self.web_url(project_id)}.git",
+            },
+            {},
+        )
+
+    def _merge_request(self, query, project_id, merge_id):
+        project_id, merge_id = int(project_id), int(merge_id)
+        return (
+            {
+                "id": merge_id,
+                "iid": merge_id,
+                "project_id": project_id,
+                "title": f"Merge request {merge_id}",
+                "description": "A benchmark merge request.\n\nCc: list@example.com\n",
+                "author": {"username": "developer", "name": "Developer"},
+                "labels": [],
+                "work_in_progress": False,
+                "merge_status": "can_be_merged",
+                "head_pipeline": {"status": "success"},
+                "target_branch": "master",
+                "source_branch": f"feature-{merge_id}",
+                "sha": self.sha(project_id, merge_id),
+                "web_url": self.web_url(project_id, merge_id),
+            },
+            {},
+        )
+
+    def _commits(self, query, project_id, merge_id):
+        project_id, merge_id = int(project_id), int(merge_id)
+        per_page = min(int(query.get("per_page", 20)), 100)
+        page = int(query.get("page", 1))
+        pages = max((self.commits + per_page - 1) // per_page, 1)
+        # GitLab lists the newest commit first
+        first = (page - 1) * per_page
+        commits = []
+        for commit in range(first, min(first + per_page, self.commits)):
+            name, address = self._person(commit)
+            trailers = "\n".join(
+                [
+                    "Cc: {} <{}>".format(*self._person(commit + 1)),
+                    "Reviewed-by: {} <{}>".format(*self._person(commit + 2)),
+                    "Acked-by: {} <{}>".format(*self._person(commit + 3)),
+                    f"Signed-off-by: {name} <{address}>",
+                ]
+            )
+            commits.append(
+                {
+                    "id": self.sha(project_id, merge_id, commit),
+                    "short_id": self.sha(project_id, merge_id, commit)[:8],
+                    "title": f"Change number {commit}",
+                    "message": (
+                        f"Change number {commit}\n\nA benchmark commit.\n\n{trailers}\n"
+                    ),
+                    "author_name": name,
+                    "author_email": address,
+                }
+            )
+        headers = {
+            "X-Total": str(self.commits),
+            "X-Total-Pages": str(pages),
+            "X-Page": str(page),
+            "X-Per-Page": str(per_page),
+        }
+        if page < pages:
+            next_query = urllib.parse.urlencode(dict(query, page=page + 1))
+            next_url = (
+                f"{self.url}/api/v4/projects/{project_id}/merge_requests/"
+                f"{merge_id}/commits?{next_query}"
+            )
+            headers["X-Next-Page"] = str(page + 1)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return commits, headers
+
+    def _note(self, query, project_id, merge_id):
+        return {"id": 1, "body": "", "author": self._user()[0]}, {}
+
+    def _patch(self, project_id, sha):
+        name, address = self._person(int(sha[-16:], 16))
+        added = "".join(f"+{sha} line {n}\n" for n in range(self.patch_lines))
+        return (
+            f"From {sha} Mon Sep 17 00:00:00 2001\n"
+            f"From: {name} <{address}>\n"
+            "Date: Mon, 4 Nov 2019 23:00:00 +0000\n"
+            f"Subject: [PATCH] Change {sha[-4:]}\n\n"
+            "A benchmark commit.\n\n"
+            f"Signed-off-by: {name} <{address}>\n"
+            "---\n"
+            f" README | {self.patch_lines} +\n"
+            f" 1 file changed, {self.patch_lines} insertions(+)\n\n"
+            "diff --git a/README b/README\n"
+            "index 669ac7c32292..a0cc9c082916 100644\n"
+            "--- a/README\n"
+            "+++ b/README\n"
+            f"@@ -1,1 +1,{self.patch_lines + 1} @@\n"
+            " Hello\n"
+            f"{added}"
+            "-- \n"
+            "2.23.0\n\n"
+        )
+
+
+class SmtpSink:
+    """
+    An SMTP server that accepts every message and remembers when it arrived.
+
+    Attributes:
+        port: The port the server listens on.
+        messages: A list of (arrival time, message) tuples, where the time is
+            from :func:`time.perf_counter` and the message is an
+            :class:`email.message.Message`.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+            def handle(self):
+                self.reply("220 localhost SMTP sink")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode("ascii", "replace").strip().upper()
+                    if command.startswith(("EHLO", "HELO")):
+                        self.reply("250 localhost")
+                    elif command == "DATA":
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        lines = []
+                        for data in iter(self.rfile.readline, b""):
+                            if data in (b".\r\n", b".\n"):
+                                break
+                            lines.append(data[1:] if data.startswith(b"..") else data)
+                        sink._received(b"".join(lines))
+                        self.reply("250 OK")
+                    elif command == "QUIT":
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        # MAIL, RCPT, RSET, NOOP, ...
+                        self.reply("250 OK")
+
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _received(self, data):
+        message = email.message_from_bytes(data)
+        with self._lock:
+            self.messages.append((time.perf_counter(), message))
@@ -0,0 +1,174 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Benchmark applying a patch series and pushing it, as done for email to GitLab.
+
+Builds a synthetic repository and patch series, then times each git command
+:func:`patchlab.bridge._create_remote_branch` runs: adding the worktree,
+fetching, checking out the target branch, applying the series with git-am,
+and pushing to a local bare repository standing in for GitLab.
+
+The worktree is only created on the first run, just as a worker reuses its
+worktree between series, so the first run is reported separately as "cold".
+"""
+
+import collections
+import os
+import subprocess
+import tempfile
+import time
+from unittest import mock
+
+import common
+
+
+def git(*args, cwd=None, **kwargs):
+    return subprocess.run(
+        ["git", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+        **kwargs,
+    ).stdout
+
+
+def build_repository(root, num_files, history, file_lines):
+    """
+    Create a bare "remote" repository and a clone of it, like the clone command.
+
+    Returns:
+        tuple: The path to the repository used to create the history, and the
+            path to the clone.
+    """
+    remote = os.path.join(root, "remote.git")
+    seed = os.path.join(root, "seed")
+    clone = os.path.join(root, "clone")
+    git("-c", "init.defaultBranch=master", "init", "-q", "--bare", remote)
+    git("-c", "init.defaultBranch=master", "init", "-q", seed)
+    git("config", "user.name", "Benchmark", cwd=seed)
+    git("config", "user.email", "bench@example.com", cwd=seed)
+
+    for i in range(num_files):
+        path = os.path.join(seed, "src", f"dir{i % 50}", f"file{i}.c")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as fd:
+            fd.writelines(f"int line_{i}_{n} = {n};\n" for n in range(file_lines))
+    git("add", "-A", cwd=seed)
+    git("commit", "-q", "-m", "Initial commit", cwd=seed)
+    for commit in range(1, history):
+        path = os.path.join(seed, "src", "dir0", "history.c")
+        with open(path, "a") as fd:
+            fd.write(f"int history_{commit};\n")
+        git("add", path, cwd=seed)
+        git("commit", "-q", "-m", f"History commit {commit}", cwd=seed)
+
+    git("remote", "add", "origin", remote, cwd=seed)
+    git("push", "-q", "origin", "master", cwd=seed)
+    git("clone", "-q", remote, clone)
+    git("config", "user.name", "Patchlab", cwd=clone)
+    git("config", "user.email", "patchlab@example.com", cwd=clone)
+    return seed, clone
+
+
+def build_series(seed, num_patches, patch_lines, num_files):
+    """Create an mbox of a series that applies to the master branch."""
+    git("checkout", "-q", "-b", "series", cwd=seed)
+    for patch in range(num_patches):
+        i = patch % num_files
+        path = os.path.join(seed, "src", f"dir{i % 50}", f"file{i}.c")
+        with open(path, "a") as fd:
+            fd.writelines(f"int patch_{patch}_{n} = {n};\n" for n in range(patch_lines))
+        git("add", path, cwd=seed)
+        git(
+            "commit",
+            "-q",
+            "-m",
+            f"Patch {patch}\n\nA synthetic change.\n\n"
+            "Signed-off-by: Benchmark <bench@example.com>",
+            cwd=seed,
+        )
+    mbox = git("format-patch", "--stdout", "master", cwd=seed)
+    git("checkout", "-q", "master", cwd=seed)
+    return mbox
+
+
+def main():
+    parser = common.argument_parser(__doc__)
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=1000,
+        help="Files in the repository (default: 1000)",
+    )
+    parser.add_argument(
+        "--file-lines", type=int, default=100, help="Lines per file (default: 100)"
+    )
+    parser.add_argument(
+        "--history", type=int, default=100, help="Commits of history (default: 100)"
+    )
+    parser.add_argument(
+        "--patches", type=int, default=10, help="Patches in the series (default: 10)"
+    )
+    parser.add_argument(
+        "--patch-lines",
+        type=int,
+        default=50,
+        help="Lines added per patch (default: 50)",
+    )
+    args = parser.parse_args()
+
+    common.setup_django()
+    from patchlab import bridge
+
+    run = subprocess.run
+    timings = []
+
+    def timed_run(command, *run_args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return run(command, *run_args, **kwargs)
+        finally:
+            # Commands are "git -C <path> <subcommand> ..."
+            timings[-1][command[3]] += time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as root:
+        seed, clone = build_repository(root, args.files, args.history, args.file_lines)
+        mbox = build_series(seed, args.patches, args.patch_lines, args.files)
+        working_dir = os.path.join(root, "worker")
+        os.mkdir(working_dir)
+        git_forge = mock.Mock(host="benchmark", forge_id=1, repo_path=clone)
+        project = mock.Mock(git_forge=git_forge)
+
+        with mock.patch.object(bridge, "series_to_mbox", return_value=mbox):
+            with mock.patch.object(bridge.subprocess, "run", timed_run):
+                for series_id in range(args.repeat + 1):
+                    timings.append(collections.Counter())
+                    bridge._create_remote_branch(
+                        project,
+                        mock.Mock(id=series_id),
+                        f"emails/series-{series_id}",
+                        "master",
+                        working_dir,
+                    )
+
+    cold, warm = timings[0], timings[1:]
+    results = {
+        "benchmark": "git_pipeline",
+        "files": args.files,
+        "history": args.history,
+        "patches": args.patches,
+        "patch_lines": args.patch_lines,
+        "cold_seconds": dict(cold, total=sum(cold.values())),
+        "warm_seconds": {
+            stage: common.summarize([timing[stage] for timing in warm])
+            for stage in ("fetch", "checkout", "am", "push")
+        },
+    }
+    results["warm_seconds"]["total"] = common.summarize(
+        [sum(timing.values()) for timing in warm]
+    )
+    common.write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
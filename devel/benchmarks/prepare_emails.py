@@ -0,0 +1,124 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Benchmark turning a merge request into emails.
+
+For each merge request size, times :func:`patchlab.gitlab2email._prepare_emails`
+followed by :func:`patchlab.gitlab2email._record_bridging` for every email,
+against the fake GitLab in ``fakes.py``. Each run happens in a transaction
+that is rolled back, so every run bridges the merge request for the first
+time. Alongside wall time, each run records the database queries made, the
+peak memory allocated (with tracemalloc, which slows the run down somewhat),
+and the HTTP requests made to GitLab. Resolving the Ccs of the series with
+:class:`patchlab.gitlab2email.CcResolver` is timed on its own as well.
+"""
+
+import time
+import tracemalloc
+
+import common
+import fakes
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(",")]
+
+
+def main():
+    parser = common.argument_parser(__doc__)
+    parser.set_defaults(repeat=5)
+    parser.add_argument(
+        "--sizes",
+        type=parse_sizes,
+        default="1,10,100,1000",
+        help="Comma-separated commit counts to benchmark (default: 1,10,100,1000)",
+    )
+    parser.add_argument(
+        "--patch-lines",
+        type=int,
+        default=200,
+        help="Lines added by each patch (default: 200)",
+    )
+    parser.add_argument(
+        "--max-emails",
+        type=int,
+        help="PATCHLAB_MAX_EMAILS for the run; by default every size is emailed "
+        "in full rather than as a single 'too big' email",
+    )
+    args = parser.parse_args()
+
+    common.setup_django()
+    from django.db import connection, transaction
+    from django.test import override_settings
+    from django.test.utils import CaptureQueriesContext
+    import gitlab as gitlab_module
+
+    from patchlab import gitlab2email
+    from patchlab.models import GitForge
+
+    max_emails = args.max_emails or max(args.sizes)
+    results = {
+        "benchmark": "prepare_emails",
+        "patch_lines": args.patch_lines,
+        "max_emails": max_emails,
+        "sizes": {},
+    }
+    with fakes.FakeGitLab(
+        patch_lines=args.patch_lines
+    ) as fake, common.test_database(), override_settings(
+        DEBUG=False, PATCHLAB_MAX_EMAILS=max_emails
+    ):
+        gitlab = gitlab_module.Gitlab(fake.url, private_token="benchmark")
+        git_forge = GitForge.objects.get(pk=1)
+        git_forge.host = fake.host
+        git_forge.save()
+        project = gitlab.projects.get(1)
+
+        for size in args.sizes:
+            fake.commits = size
+            merge_request = project.mergerequests.get(size)
+            runs = {"seconds": [], "queries": [], "peak_bytes": [], "http_requests": []}
+
+            for _ in range(args.repeat):
+                requests_before = sum(fake.requests.values())
+                with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+                    tracemalloc.start()
+                    start = time.perf_counter()
+                    state = gitlab2email._bridging_state(git_forge, merge_request)
+                    for email in gitlab2email._prepare_emails(
+                        gitlab, git_forge, project, merge_request, state
+                    ):
+                        gitlab2email._record_bridging(
+                            git_forge.project.listid, merge_request.iid, email
+                        )
+                    runs["seconds"].append(time.perf_counter() - start)
+                    runs["peak_bytes"].append(tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                    transaction.set_rollback(True)
+                runs["queries"].append(len(queries))
+                runs["http_requests"].append(
+                    sum(fake.requests.values()) - requests_before
+                )
+
+            commits = list(merge_request.commits())
+
+            def resolve_ccs():
+                resolver = gitlab2email.CcResolver(merge_request)
+                for commit in commits:
+                    resolver.commit(commit)
+                return resolver.series_ccs
+
+            results["sizes"][size] = {
+                "seconds": common.summarize(runs["seconds"]),
+                "queries": max(runs["queries"]),
+                "peak_bytes": max(runs["peak_bytes"]),
+                "http_requests": max(runs["http_requests"]),
+                "cc_seconds": common.summarize(
+                    common.time_calls(resolve_ccs, args.repeat)
+                ),
+            }
+
+    common.write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Benchmark the bridging tasks by replaying the recorded GitLab interactions.
+
+The VCR cassettes the unit tests use are played back, optionally with a delay
+before each response, while these flows run many times:
+
+* ``merge_request``: :func:`patchlab.tasks.merge_request_hook` emailing a
+  merge request with a cover letter and two patches.
+* ``email_comment``: :func:`patchlab.tasks.email_comment` emailing a comment
+  made on that merge request.
+* ``submit_gitlab_comment``: :func:`patchlab.tasks.submit_gitlab_comment`
+  posting an emailed comment with an Acked-by tag to GitLab.
+
+No cassette records the request :func:`patchlab.tasks.email_comment` makes
+to look up the bridge's own GitLab user, so that request is answered
+in-process. Each run happens in a transaction that is rolled back, and emails
+are kept in memory. Patches are fetched one at a time, rather than prefetched
+in background threads, so the time spent in the database, in HTTP requests,
+and everything else ("cpu") add up to the wall time.
+"""
+
+import collections
+from email import message_from_string
+import json
+import os
+import tempfile
+import time
+import types
+from unittest import mock
+
+import common
+
+CASSETTES = os.path.join(common.REPO_ROOT, "patchlab", "tests", "fixtures", "VCR")
+FIXTURES = os.path.dirname(CASSETTES)
+
+#: The Django settings used for the duration of the benchmark.
+SETTINGS = {
+    "DEBUG": False,
+    "EMAIL_BACKEND": "django.core.mail.backends.locmem.EmailBackend",
+    "PATCHLAB_PATCH_PREFETCH": 0,
+    "PATCHLAB_PIPELINE_SUCCESS_REQUIRED": False,
+    "PATCHLAB_COMMENT_DIGEST_DELAY": 0,
+    "PATCHLAB_GITLAB_COMMENT_WINDOW": 0,
+}
+
+#: The cassette each flow replays.
+FLOWS = {
+    "merge_request": (
+        "patchlab.tests.test_gitlab2email.PrepareEmailsTests.test_multi_commit_mr"
+    ),
+    "email_comment": (
+        "patchlab.tests.test_gitlab2email.PrepareEmailsTests.test_multi_commit_mr"
+    ),
+    "submit_gitlab_comment": (
+        "patchlab.tests.test_bridge.SubmitGitlabCommentTests.test_ack_bridged"
+    ),
+}
+
+EMAILED_COMMENT = """Content-Type: text/plain; charset="utf-8"
+MIME-Version: 1.0
+Content-Transfer-Encoding: 7bit
+Subject: Re: [TEST PATCH] Bring balance to the equals signs
+From: Jeremy Cline <jcline@redhat.com>
+To: patchlab@patchlab.example.com
+Date: Mon, 04 Nov 2019 23:00:00 -0000
+Message-ID: <6@localhost.localdomain>
+X-Patchlab-Patch-Author: Jeremy Cline <jcline@redhat.com>
+X-Patchlab-Merge-Request: https://gitlab/root/patchlab_test/merge_requests/1
+X-Patchlab-Commit: a958a0dff5e3c433eb99bc5f18cbcfad77433b0d
+In-Reply-To: <4@localhost.localdomain>
+List-Id: patchlab.example.com
+
+Hi,
+
+> From: Jeremy Cline <jcline@redhat.com>
+>
+> This is a silly change so I can write a test.
+>
+> Signed-off-by: Jeremy Cline <jcline@redhat.com>
+
+Incredible work.
+
+Acked-by: Jeremy Cline <jcline@redhat.com>
+"""
+
+
+class Clock:
+    """
+    Accumulates the time spent in database queries and HTTP requests.
+
+    Each HTTP request is delayed by ``latency`` seconds before it is replayed.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.spent = collections.Counter()
+
+    def database(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.spent["db"] += time.perf_counter() - start
+
+    def http(self, send):
+        def timed_send(session, *args, **kwargs):
+            start = time.perf_counter()
+            if self.latency:
+                time.sleep(self.latency)
+            try:
+                return send(session, *args, **kwargs)
+            finally:
+                self.spent["http"] += time.perf_counter() - start
+
+        return timed_send
+
+
+def python_gitlab_config():
+    """Write a python-gitlab configuration for the host the cassettes use."""
+    fd, path = tempfile.mkstemp(suffix=".cfg")
+    with os.fdopen(fd, "w") as config:
+        config.write(
+            "[global]\ndefault = gitlab\n\n"
+            "[gitlab]\nurl = https://gitlab\nprivate_token = benchmark\n"
+            "api_version = 4\nssl_verify = false\n"
+        )
+    return path
+
+
+def main():
+    parser = common.argument_parser(__doc__, repeat=False)
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=200,
+        help="Times to run each flow (default: 200)",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds to wait before replaying each response (default: 0)",
+    )
+    parser.add_argument(
+        "--flows",
+        type=lambda value: value.split(","),
+        default=list(FLOWS),
+        help="Comma-separated flows to run (default: all of them)",
+    )
+    args = parser.parse_args()
+    for flow in args.flows:
+        if flow not in FLOWS:
+            parser.error(f"Unknown flow {flow}; choose from {', '.join(FLOWS)}")
+
+    common.setup_django()
+    from django.core import mail
+    from django.db import connection, transaction
+    from django.test import override_settings
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    import gitlab as gitlab_module
+    from patchwork import models as pw_models
+    from patchwork.parser import parse_mail
+    import requests
+    import vcr
+
+    from patchlab import models, tasks
+
+    replayer = vcr.VCR(cassette_library_dir=CASSETTES, record_mode="none")
+    with open(os.path.join(FIXTURES, "comment_on_mr.json")) as fd:
+        comment_payload = json.load(fd)
+
+    def bot_auth(gitlab):
+        gitlab.user = types.SimpleNamespace(username="patchlab-bot")
+
+    def merge_request():
+        tasks.merge_request_hook("gitlab", 1, 2)
+
+    def email_comment():
+        tasks.email_comment(
+            "gitlab",
+            1,
+            comment_payload["user"],
+            comment_payload["object_attributes"],
+            2,
+        )
+
+    def setup_flow(flow):
+        """Create what a flow needs in the database, returning the flow to time."""
+        # The recorded merge request targets the "internal" branch
+        models.Branch.objects.create(
+            git_forge=models.GitForge.objects.get(pk=1),
+            subject_prefix="TEST",
+            name="internal",
+        )
+        if flow == "merge_request":
+            return merge_request
+        if flow == "email_comment":
+            merge_request()
+            return email_comment
+
+        parse_mail(message_from_string(EMAILED_COMMENT), "patchlab.example.com")
+        comment = pw_models.Comment.objects.get(msgid="<6@localhost.localdomain>")
+        models.BridgedSubmission.objects.create(
+            git_forge=models.GitForge.objects.get(pk=1),
+            submission=comment.submission,
+            merge_request=2,
+        )
+        return lambda: tasks.submit_gitlab_comment(comment.id)
+
+    results = {
+        "benchmark": "vcr_replay",
+        "iterations": args.iterations,
+        "latency": args.latency,
+        "flows": {},
+    }
+    gitlab_config = python_gitlab_config()
+    os.environ["PYTHON_GITLAB_CFG"] = gitlab_config
+    setup_test_environment()
+    clock = Clock(args.latency)
+    try:
+        with common.test_database(), override_settings(**SETTINGS), mock.patch.object(
+            gitlab_module.Gitlab, "auth", bot_auth
+        ), mock.patch.object(
+            requests.Session, "send", clock.http(requests.Session.send)
+        ), connection.execute_wrapper(
+            clock.database
+        ):
+            for flow in args.flows:
+                with replayer.use_cassette(
+                    FLOWS[flow], allow_playback_repeats=True
+                ), transaction.atomic():
+                    run = setup_flow(flow)
+                    mail.outbox.clear()
+                    clock.spent.clear()
+                    samples = collections.defaultdict(list)
+                    start = time.perf_counter()
+                    for _ in range(args.iterations):
+                        before = clock.spent.copy()
+                        with transaction.atomic():
+                            run_start = time.perf_counter()
+                            run()
+                            wall = time.perf_counter() - run_start
+                            transaction.set_rollback(True)
+                        db = clock.spent["db"] - before["db"]
+                        http = clock.spent["http"] - before["http"]
+                        samples["wall"].append(wall)
+                        samples["db"].append(db)
+                        samples["http"].append(http)
+                        samples["cpu"].append(max(wall - db - http, 0.0))
+                    elapsed = time.perf_counter() - start
+                    transaction.set_rollback(True)
+
+                if flow != "submit_gitlab_comment" and not mail.outbox:
+                    raise SystemExit(f"The {flow} flow did not send any email")
+                total = sum(samples["wall"])
+                results["flows"][flow] = {
+                    "runs_per_second": args.iterations / elapsed,
+                    "emails": len(mail.outbox),
+                    "seconds": {
+                        part: common.summarize(part_samples)
+                        for part, part_samples in samples.items()
+                    },
+                    "share": {
+                        part: sum(samples[part]) / total
+                        for part in ("cpu", "db", "http")
+                    },
+                }
+    finally:
+        teardown_test_environment()
+        os.remove(gitlab_config)
+
+    common.write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
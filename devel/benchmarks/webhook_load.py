@@ -0,0 +1,311 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Load test the web hook endpoint end to end.
+
+Sends a mix of merge request, note, and pipeline web hooks at a fixed rate to
+:func:`patchlab.views.gitlab.web_hook` and measures how long each takes to
+turn into email. GitLab and the mail server are replaced with the local
+stand-ins in ``fakes.py``; every merge request and pipeline hook is for a new
+merge request, and notes are made on merge requests sent earlier in the run.
+
+With ``--celery eager`` tasks run inside the web hook request, so latency
+includes all of the bridging work. With ``--celery worker`` a threaded Celery
+worker is started in-process against the broker configured in the Django
+settings, so the broker must be running.
+"""
+
+from concurrent import futures
+import json
+import os
+import random
+import threading
+import time
+
+import common
+import fakes
+
+#: The Django settings used for the duration of the benchmark.
+SETTINGS = {
+    "DEBUG": False,
+    "EMAIL_BACKEND": "django.core.mail.backends.smtp.EmailBackend",
+    "EMAIL_HOST": "127.0.0.1",
+    "EMAIL_USE_TLS": False,
+    "EMAIL_USE_SSL": False,
+}
+
+
+def parse_mix(value):
+    """Parse a mix like ``merge_request=1,note=2,pipeline=1`` into weights."""
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("merge_request", "note", "pipeline"):
+            raise ValueError(f"Unknown event kind {kind}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+class Traffic:
+    """Builds web hook payloads and the email header that identifies their emails."""
+
+    def __init__(self, gitlab, seed):
+        self.gitlab = gitlab
+        self.random = random.Random(seed)
+        self.merge_ids = []
+        self._next_merge_id = 1000
+        self._next_note_id = 1
+        self._lock = threading.Lock()
+
+    def project(self):
+        return {"id": 1, "web_url": self.gitlab.web_url(1)}
+
+    def event(self, kind):
+        """
+        Build a web hook.
+
+        Returns:
+            tuple: The X-Gitlab-Event header, the payload, and the (header,
+                value) pair that identifies emails caused by the web hook.
+        """
+        with self._lock:
+            if kind == "note" and not self.merge_ids:
+                kind = "merge_request"
+            if kind == "note":
+                merge_id = self.random.choice(self.merge_ids)
+                note_id = self._next_note_id
+                self._next_note_id += 1
+            else:
+                merge_id = self._next_merge_id
+                self._next_merge_id += 1
+                self.merge_ids.append(merge_id)
+
+        merge_url = self.gitlab.web_url(1, merge_id)
+        sha = self.gitlab.sha(1, merge_id)
+        if kind == "merge_request":
+            payload = {
+                "object_kind": "merge_request",
+                "project": self.project(),
+                "object_attributes": {
+                    "iid": merge_id,
+                    "action": "open",
+                    "target_branch": "master",
+                    "work_in_progress": False,
+                    "merge_status": "can_be_merged",
+                    "last_commit": {"id": sha},
+                    "url": merge_url,
+                },
+                "labels": [],
+            }
+            return (
+                "Merge Request Hook",
+                payload,
+                ("X-Patchlab-Merge-Request", merge_url),
+            )
+        if kind == "pipeline":
+            payload = {
+                "object_kind": "pipeline",
+                "project": self.project(),
+                "object_attributes": {
+                    "status": "success",
+                    "source": "merge_request_event",
+                    "sha": sha,
+                },
+                "merge_request": {
+                    "iid": merge_id,
+                    "target_branch": "master",
+                    "merge_status": "can_be_merged",
+                },
+            }
+            return "Pipeline Hook", payload, ("X-Patchlab-Merge-Request", merge_url)
+        note_url = f"{merge_url}#note_{note_id}"
+        payload = {
+            "object_kind": "note",
+            "user": {"name": "Reviewer", "username": "reviewer"},
+            "project": self.project(),
+            "object_attributes": {
+                "project_id": 1,
+                "noteable_type": "MergeRequest",
+                "note": f"Comment {note_id} looks like a good change to me.",
+                "url": note_url,
+            },
+            "merge_request": {"iid": merge_id, "target_branch": "master"},
+        }
+        return "Note Hook", payload, ("X-Patchlab-Comment", note_url)
+
+
+def main():
+    parser = common.argument_parser(__doc__, repeat=False)
+    parser.add_argument(
+        "--events", type=int, default=200, help="Web hooks to send (default: 200)"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=10.0,
+        help="Web hooks to send per second (default: 10)",
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default="merge_request=1,note=2,pipeline=1",
+        help="Relative weights of each kind of web hook "
+        "(default: merge_request=1,note=2,pipeline=1)",
+    )
+    parser.add_argument(
+        "--commits", type=int, default=3, help="Commits per merge request (default: 3)"
+    )
+    parser.add_argument(
+        "--celery",
+        choices=("eager", "worker"),
+        default="eager",
+        help="Run tasks in the web hook request or in a worker (default: eager)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Celery worker threads (default: 4)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Web hook requests in flight at once (default: 8)",
+    )
+    parser.add_argument(
+        "--gitlab-latency",
+        type=float,
+        default=0.0,
+        help="Seconds the fake GitLab waits before each response (default: 0)",
+    )
+    parser.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=60.0,
+        help="Seconds to wait for email after the last web hook (default: 60)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    common.setup_django()
+    from django.conf import settings
+    from django.test import RequestFactory, override_settings
+
+    from patchlab.celery import app
+    from patchlab.models import GitForge
+    from patchlab.views.gitlab import web_hook
+
+    with fakes.FakeGitLab(
+        commits=args.commits, latency=args.gitlab_latency
+    ) as gitlab, fakes.SmtpSink() as sink, common.test_database():
+        gitlab_config = gitlab.python_gitlab_config()
+        os.environ["PYTHON_GITLAB_CFG"] = gitlab_config
+        overrides = override_settings(EMAIL_PORT=sink.port, **SETTINGS)
+        overrides.enable()
+        git_forge = GitForge.objects.get(pk=1)
+        git_forge.host = gitlab.host
+        git_forge.save()
+
+        if args.celery == "eager":
+            app.conf.task_always_eager = True
+            worker = None
+        else:
+            from celery.contrib.testing.worker import start_worker
+
+            worker = start_worker(
+                app,
+                pool="threads",
+                concurrency=args.workers,
+                perform_ping_check=False,
+            )
+            worker.__enter__()
+
+        traffic = Traffic(gitlab, args.seed)
+        kinds = list(args.mix)
+        weights = [args.mix[kind] for kind in kinds]
+        sent = {}
+        response_times = []
+        lock = threading.Lock()
+
+        def send(kind, scheduled):
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            event, payload, key = traffic.event(kind)
+            request = RequestFactory().post(
+                "/patchlab/gitlab/",
+                data=json.dumps(payload),
+                content_type="application/json",
+                HTTP_X_GITLAB_TOKEN=settings.PATCHLAB_GITLAB_WEBHOOK_SECRET,
+                HTTP_X_GITLAB_EVENT=event,
+            )
+            start = time.perf_counter()
+            web_hook(request)
+            finished = time.perf_counter()
+            with lock:
+                sent.setdefault(key, start)
+                response_times.append(finished - start)
+
+        start = time.perf_counter()
+        try:
+            with futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                for i in range(args.events):
+                    kind = traffic.random.choices(kinds, weights)[0]
+                    executor.submit(send, kind, start + i / args.rate)
+            sending_done = time.perf_counter()
+
+            # Wait for every web hook to produce email and for the rest of each
+            # series to arrive; in eager mode everything was sent already.
+            if args.celery == "worker":
+                deadline = time.monotonic() + args.drain_timeout
+                emails = -1
+                while time.monotonic() < deadline:
+                    delivered = _deliveries(sink)
+                    if emails == len(sink.messages) and all(
+                        key in delivered for key in sent
+                    ):
+                        break
+                    emails = len(sink.messages)
+                    time.sleep(1)
+        finally:
+            if worker is not None:
+                worker.__exit__(None, None, None)
+            overrides.disable()
+            os.remove(gitlab_config)
+
+        delivered = _deliveries(sink)
+        latencies = [
+            delivered[key] - sent_at
+            for key, sent_at in sent.items()
+            if key in delivered
+        ]
+        last_delivery = max(delivered.values(), default=start)
+        results = {
+            "benchmark": "webhook_load",
+            "celery": args.celery,
+            "events": args.events,
+            "offered_rate": args.rate,
+            "hook_rate": args.events / (sending_done - start),
+            "delivery_rate": (
+                len(latencies) / (last_delivery - start) if latencies else 0.0
+            ),
+            "undelivered": len(sent) - len(latencies),
+            "emails": len(sink.messages),
+            "gitlab_requests": dict(gitlab.requests),
+            "hook_response_seconds": common.summarize(response_times),
+            "hook_to_email_seconds": common.summarize(latencies) if latencies else None,
+        }
+        common.write_results(results, args.output)
+
+
+def _deliveries(sink):
+    """Map each identifying header to the time its last email arrived."""
+    delivered = {}
+    for arrived, message in list(sink.messages):
+        for header in ("X-Patchlab-Comment", "X-Patchlab-Merge-Request"):
+            if message[header]:
+                key = (header, "".join(message[header].split()))
+                delivered[key] = max(arrived, delivered.get(key, arrived))
+                break
+    return delivered
+
+
+if __name__ == "__main__":
+    main()
@@ -24,7 +24,8 @@ class PatchlabConfig(AppConfig):
         from patchwork import urls
 
         from . import urls as our_urls
-        from . import events  # noqa: F401
+        # Tasks queued from this process are routed by Patchlab's Celery app
+        from . import celery, events, routing  # noqa: F401
 
         urls.urlpatterns.append(path("patchlab/", include(our_urls.urlpatterns)))
 
@@ -34,3 +35,11 @@ class PatchlabConfig(AppConfig):
                 "Using the default GitLab web hook secret; this is not safe"
                 " for production deployments!"
             )
+
+        # The cache holds locks shared between worker processes
+        if settings.CACHES["default"]["BACKEND"].endswith(".LocMemCache"):
+            _log.warning(
+                "Django's cache is the local-memory cache, which isn't shared"
+                " between processes; configure a shared cache so Celery workers"
+                " don't bridge the same merge request at once"
+            )
@@ -15,13 +15,15 @@ import subprocess
 
 from celery import exceptions as celery_exceptions
 from django.core.mail import EmailMessage
+from django.db import transaction
 from patchwork.models import Comment, Project, Series
 from patchwork.views.utils import series_to_mbox
 import backoff
 import gitlab as gitlab_module
 import requests
 
-from .models import BridgedSubmission, GitForge
+from . import routing
+from .models import BridgedSubmission, GitForge, PendingGitlabComment
 
 
 _log = logging.Logger(__name__)
@@ -47,33 +49,124 @@ def submit_gitlab_comment(gitlab: gitlab_module.Gitlab, comment: Comment) -> Non
     """Bridge Patchwork comments to Gitlab."""
     try:
         bridged_submission = BridgedSubmission.objects.get(
-            submission=comment.submission
+            submission_id=comment.submission_id
         )
     except BridgedSubmission.DoesNotExist:
         _log.info("Unable to find a bridged submission for %s", str(comment.submission))
         return
 
-    project = gitlab.projects.get(comment.submission.project.git_forge.forge_id)
-    merge_request = project.mergerequests.get(bridged_submission.merge_request)
+    return submit_gitlab_comments(
+        gitlab,
+        routing.git_forge_by_id(bridged_submission.git_forge_id),
+        bridged_submission.merge_request,
+        [comment],
+    )
+
+
+def submit_gitlab_comments(
+    gitlab: gitlab_module.Gitlab, git_forge: GitForge, merge_id: int, comments: list
+) -> None:
+    """
+    Bridge one or more Patchwork comments on the same merge request to Gitlab.
+
+    All the comments are posted as a single note and any new Acked-by/Nacked-by
+    labels are applied with a single update; the merge request is not updated
+    at all if there are no new labels.
+    """
+    project = gitlab.projects.get(git_forge.forge_id, lazy=True)
+    merge_request = project.mergerequests.get(merge_id)
 
     # Turn Ack-by/Nack-by into Gitlab tags. This doesn't attempt to undo any
     # previous tags so if someone Acks and then Nacks the merge request will
     # have both tags.
-    for match in comment.response_re.finditer(comment.content):
-        tag, name_and_address = match.group(0).split(":")
-        _, address = email.utils.parseaddr(name_and_address)
-        merge_request.labels.append(f"{tag}: {address}")
-    merge_request.save()
+    labels = list(merge_request.labels)
+    for comment in comments:
+        for match in comment.response_re.finditer(comment.content):
+            tag, name_and_address = match.group(0).split(":")
+            _, address = email.utils.parseaddr(name_and_address)
+            label = f"{tag}: {address}"
+            if label not in labels:
+                labels.append(label)
+    if labels != merge_request.labels:
+        merge_request.labels = labels
+        merge_request.save()
 
     note = merge_request.notes.create(
         {
-            "body": f"{comment.submitter} commented via email:\n```\n{comment.content}\n```"
+            "body": "\n\n".join(
+                f"{comment.submitter} commented via email:\n```\n{comment.content}\n```"
+                for comment in comments
+            )
         }
     )
 
     return merge_request, note
 
 
+def buffer_gitlab_comment(comment: Comment):
+    """
+    Buffer a Patchwork comment so it can be posted to Gitlab in a batch by
+    :func:`submit_pending_gitlab_comments`.
+
+    Returns:
+        PendingGitlabComment: The buffered comment if it's the only one waiting
+            on its merge request, so a batch needs to be scheduled; otherwise
+            None, including if the comment isn't on a bridged submission.
+    """
+    try:
+        bridged_submission = BridgedSubmission.objects.get(
+            submission=comment.submission
+        )
+    except BridgedSubmission.DoesNotExist:
+        _log.info("Unable to find a bridged submission for %s", str(comment.submission))
+        return None
+
+    with transaction.atomic():
+        # A batch being posted holds these rows until it commits, after which
+        # they're gone and this comment needs a batch of its own
+        first = not (
+            PendingGitlabComment.objects.select_for_update()
+            .filter(
+                git_forge_id=bridged_submission.git_forge_id,
+                merge_request=bridged_submission.merge_request,
+            )
+            .exists()
+        )
+        pending, created = PendingGitlabComment.objects.get_or_create(
+            comment=comment,
+            defaults={
+                "git_forge_id": bridged_submission.git_forge_id,
+                "merge_request": bridged_submission.merge_request,
+            },
+        )
+    return pending if created and first else None
+
+
+def submit_pending_gitlab_comments(
+    gitlab: gitlab_module.Gitlab, git_forge: GitForge, merge_id: int
+) -> None:
+    """Post every comment buffered for a merge request to Gitlab as one note."""
+    with transaction.atomic():
+        pending = list(
+            # Only the buffered comments are locked; Patchwork's comments and
+            # people mustn't be held up while GitLab is contacted
+            PendingGitlabComment.objects.select_for_update(of=("self",))
+            .filter(git_forge=git_forge, merge_request=merge_id)
+            .select_related("comment", "comment__submitter")
+            .order_by("comment__date")
+        )
+        if not pending:
+            # Another task already posted them
+            return
+
+        # The rows stay locked, and are restored if GitLab fails, until the
+        # note is posted.
+        PendingGitlabComment.objects.filter(pk__in=[p.pk for p in pending]).delete()
+        submit_gitlab_comments(
+            gitlab, git_forge, merge_id, [p.comment for p in pending]
+        )
+
+
 @backoff.on_exception(
     backoff.expo,
     (
@@ -142,7 +235,7 @@ def open_merge_request(
             patchwork_project, series, branch_name, target_branch, working_dir
         )
     except ValueError:
-        _notify_am_failure(patchwork_project.git_forge, series)
+        _notify_am_failure(patchwork_project.git_forge, series, target_branch)
         return
 
     merge_request = gitlab_project.mergerequests.create(
@@ -246,9 +339,8 @@ def _create_remote_branch(
     )
 
 
-def _notify_am_failure(git_forge: GitForge, series: Series) -> None:
+def _notify_am_failure(git_forge: GitForge, series: Series, target_branch: str) -> None:
     """Notify a developer that the series could not be applied to a project."""
-    target_branch = git_forge.branch(series.patches.first())
     commit = subprocess.run(
         ["git", "-C", git_forge.repo_path, "rev-parse", f"origin/{target_branch}"],
         check=True,
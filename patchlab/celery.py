@@ -1,7 +1,24 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
+"""
+The Celery application, and the queues Patchlab's tasks are sent to.
+
+Patchlab's tasks are sent to a queue for the kind of work they do, so a few
+large series being applied with Git can't hold up comments, and workers for
+each kind can be scaled independently:
+
+* ``git``: applying emailed series to a Git repository and pushing them, which
+  can take minutes per series.
+* ``api``: bridging merge requests to email, which makes many GitLab API
+  requests and may wait for a pipeline to finish.
+* ``mail``: delivering comments between GitLab and email, which is quick.
+
+The queue names, and how tasks of each kind are acknowledged and prefetched,
+are set by :data:`settings.PATCHLAB_CELERY_QUEUES`. Routes, annotations, and
+queues set in the Celery configuration take precedence over Patchlab's.
+"""
 import os
 
-from celery import Celery
+from celery import Celery, signals
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "patchlab.settings")
 
@@ -9,3 +26,95 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "patchlab.settings")
 app = Celery("patchlab")
 app.config_from_object("django.conf.settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+#: The kind of work, a key of :data:`settings.PATCHLAB_CELERY_QUEUES`, each
+#: task does.
+TASK_KINDS = {
+    "patchlab.tasks.open_merge_request": "git",
+    "patchlab.tasks.merge_request_hook": "api",
+    "patchlab.tasks.reconcile_import": "api",
+    "patchlab.tasks.email_comment": "mail",
+    "patchlab.tasks.email_comment_digest": "mail",
+    "patchlab.tasks.submit_gitlab_comment": "mail",
+    "patchlab.tasks.submit_gitlab_comment_batch": "mail",
+    "patchlab.tasks.finish_work": "mail",
+}
+
+
+def queues() -> dict:
+    """
+    Get the configuration of each kind of task's queue.
+
+    Kinds, or options of a kind, missing from
+    :data:`settings.PATCHLAB_CELERY_QUEUES` take their default values.
+    """
+    from django.conf import settings
+    from patchlab.settings import base
+
+    configured = getattr(settings, "PATCHLAB_CELERY_QUEUES", {})
+    return {
+        kind: {**defaults, **configured.get(kind, {})}
+        for kind, defaults in base.PATCHLAB_CELERY_QUEUES.items()
+    }
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """A Celery router sending each of Patchlab's tasks to its kind's queue."""
+    kind = TASK_KINDS.get(name)
+    if kind is None:
+        return None
+    return {"queue": queues()[kind]["queue"]}
+
+
+class TaskAnnotations:
+    """Celery task annotations setting ``acks_late`` for each kind of task."""
+
+    def annotate(self, task):
+        kind = TASK_KINDS.get(task.name)
+        if kind is None:
+            return None
+        return {"acks_late": queues()[kind]["acks_late"]}
+
+
+def _as_tuple(value) -> tuple:
+    if value is None:
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return (value,)
+
+
+@app.on_after_configure.connect
+def _configure(sender, source, **kwargs):
+    """Add Patchlab's routes, annotations, and queues to the configuration."""
+    source.task_routes = _as_tuple(source.task_routes) + (route_task,)
+    source.task_annotations = _as_tuple(source.task_annotations) + (TaskAnnotations(),)
+    if source.task_queues is None:
+        # Workers started without --queues consume from every queue
+        names = [source.task_default_queue] + [
+            config["queue"] for config in queues().values()
+        ]
+        source.task_queues = {name: {} for name in dict.fromkeys(names)}
+
+
+@signals.worker_init.connect
+def _set_prefetch_multiplier(sender, **kwargs):
+    """
+    Use the prefetch multiplier of the queues a worker consumes from.
+
+    A worker's prefetch multiplier applies to every queue it consumes from, so
+    the lowest of them is used. Queues that aren't Patchlab's count with the
+    configured multiplier, and a multiplier given on the command line is left
+    alone.
+    """
+    if sender.app is not app:
+        return
+    default = app.conf.worker_prefetch_multiplier
+    if sender.prefetch_multiplier != default:
+        return
+    multipliers = {
+        config["queue"]: config["prefetch_multiplier"] for config in queues().values()
+    }
+    sender.prefetch_multiplier = min(
+        multipliers.get(name, default) for name in app.amqp.queues.consume_from
+    )
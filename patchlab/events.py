@@ -1,15 +1,162 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
-import email
+import contextlib
+import functools
 import logging
+import threading
 
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
 from django.db.models.signals import post_save
 from patchwork.models import Comment, Patch
 
-from .tasks import open_merge_request, submit_gitlab_comment
+from . import gitlab2email, routing, scheduler, transactions
+from .headers import has_header
+from .models import BridgedSubmission, DispatchedSeries
+from .tasks import open_merge_request, reconcile_import, submit_gitlab_comment
 
 _log = logging.getLogger(__name__)
 
+#: Per-thread dispatch state: ``importing`` counts the :func:`bulk_import`
+#: blocks the thread is in and ``comment_ids`` lists the comments it saved
+#: while importing.
+_local = threading.local()
+
+
+def dispatch(task, args: tuple, failed=None) -> None:
+    """
+    Queue a Celery task once the current transaction commits.
+
+    Tasks dispatched within the same transaction are published together once
+    it commits, over a single broker connection, so workers never look for
+    rows that haven't been committed yet and importing a large thread doesn't
+    cost a broker round trip per row. Outside a transaction the task is
+    published immediately.
+
+    Args:
+        task: The Celery task to queue.
+        args: The positional arguments for the task.
+        failed: A callable to call, from an exception handler, if the task
+            could not be queued.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        _publish([(task, args, failed)])
+        return
+
+    # Commit callbacks are discarded along with the transaction or savepoint
+    # they were registered in, so each savepoint gets its own batch and the
+    # tasks of a rolled back savepoint are never published. Only a batch whose
+    # callback is still registered is joined.
+    for callback in transactions.on_commit_callbacks(innermost=True):
+        if isinstance(callback, functools.partial) and callback.func is _flush:
+            callback.args[0].append((task, args, failed))
+            return
+
+    batch = [(task, args, failed)]
+    transaction.on_commit(functools.partial(_flush, batch))
+
+
+def _flush(batch: list) -> None:
+    if not batch:
+        return
+    _publish(batch)
+
+
+def _publish(batch: list) -> None:
+    """Publish a list of (task, args, failed) tuples with a single producer."""
+    try:
+        with batch[0][0].app.producer_or_acquire() as producer:
+            for task, args, failed in batch:
+                try:
+                    task.apply_async(args, producer=producer)
+                except Exception:
+                    if failed is None:
+                        _log.exception("Failed to dispatch %s%r", task.name, args)
+                    else:
+                        failed()
+    except Exception:
+        _log.exception("Unable to reach the broker to dispatch %d tasks", len(batch))
+        for task, args, failed in batch:
+            if failed is not None:
+                failed()
+
+
+@contextlib.contextmanager
+def bulk_import():
+    """
+    Suspend bridging of each patch and comment saved while importing mail.
+
+    This is intended for backfills, such as Patchwork's ``parsearchive``
+    command, that would otherwise dispatch a task for every row. When the
+    outermost block exits, a single :func:`patchlab.tasks.reconcile_import`
+    task is queued to bridge the series completed and the comments saved
+    during the import. This only affects the current thread; comments saved
+    by other threads are bridged as usual, so they aren't reconciled again.
+    """
+    outermost = not getattr(_local, "importing", 0)
+    if outermost:
+        patch_id = Patch.objects.aggregate(Max("pk"))["pk__max"] or 0
+        _local.comment_ids = []
+    _local.importing = getattr(_local, "importing", 0) + 1
+    try:
+        yield
+    finally:
+        _local.importing -= 1
+        if outermost:
+            comment_ids, _local.comment_ids = _local.comment_ids, []
+            dispatch(reconcile_import, (patch_id, comment_ids))
+
+
+def _importing() -> bool:
+    return bool(getattr(_local, "importing", 0))
+
+
+def dispatch_series(series) -> None:
+    """
+    Dispatch a complete series to be opened as a merge request.
+
+    A series is only dispatched once; later saves of its patches, such as
+    state or delegate changes, don't queue it again. With fair-share
+    scheduling, its size is the number of patches in the series.
+    """
+    dispatched, created = DispatchedSeries.objects.get_or_create(series=series)
+    if not created:
+        return
+
+    if settings.PATCHLAB_FAIR_SHARE_LIMIT:
+        git_forge = routing.project_git_forge(series.project_id)
+        if git_forge is not None:
+            scheduler.submit(
+                open_merge_request, (series.id,), git_forge.pk, size=series.total
+            )
+            return
+
+    def failed():
+        _log.exception(
+            "Failed to open merge request for series id %i in %s",
+            series.pk,
+            str(series.project),
+        )
+        # Let the next save of a patch in the series try again
+        DispatchedSeries.objects.filter(series=series).delete()
+
+    dispatch(open_merge_request, (series.id,), failed)
+
+
+def dispatch_comment(comment_id: int, git_forge_id: int) -> None:
+    """
+    Dispatch an emailed comment to be posted to the merge request it's on.
+
+    Args:
+        comment_id: The primary key of the comment.
+        git_forge_id: The primary key of the Git forge the comment's
+            submission was bridged to.
+    """
+    if settings.PATCHLAB_FAIR_SHARE_LIMIT:
+        scheduler.submit(submit_gitlab_comment, (comment_id,), git_forge_id)
+    else:
+        dispatch(submit_gitlab_comment, (comment_id,))
+
 
 def patch_event_handler(sender, **kwargs):
     """
@@ -19,46 +166,54 @@ def patch_event_handler(sender, **kwargs):
     Args:
         sender (Patch): The model class that was saved.
     """
-    instance = kwargs["instance"]
-
-    if not (instance.series and instance.series.received_all):
+    if gitlab2email.recording() or _importing():
         return
 
     # Make sure we don't bridge merge requests back to merge requests
-    mail_headers = email.message_from_string(instance.headers)
-    if "X-Patchlab-Merge-Request" in mail_headers:
+    instance = kwargs["instance"]
+    if has_header(instance.headers, "X-Patchlab-Merge-Request"):
         _log.info("Ignoring instance %d as it originated from the bridge.", instance.id)
         return
 
-    try:
-        open_merge_request.apply_async((instance.series.id,))
-    except Exception:
-        _log.exception(
-            "Failed to open merge request for series id %i in %s",
-            instance.series.pk,
-            str(instance.series.project),
-        )
+    if not (instance.series and instance.series.received_all):
         return
 
+    dispatch_series(instance.series)
+
 
 def comment_event_handler(sender, **kwargs):
     """
     A signal handler that bridges emailed comments to a merge request, if one
     exists.
+
+    Most comments are on submissions that were never bridged, so those are
+    filtered out here rather than by the task. A bridged submission always
+    belongs to a project with a Git forge.
     """
+    if gitlab2email.recording():
+        return
+    if _importing():
+        if kwargs.get("created"):
+            _local.comment_ids.append(kwargs["instance"].id)
+        return
+
     # Make sure we don't bridge comments back to GitLab
-    mail_headers = email.message_from_string(kwargs["instance"].headers)
-    if "X-Patchlab-Comment" in mail_headers:
+    if has_header(kwargs["instance"].headers, "X-Patchlab-Comment"):
         _log.info(
             "Ignoring instance %d as it originated from the bridge.",
             kwargs["instance"].id,
         )
         return
 
-    try:
-        submit_gitlab_comment.apply_async((kwargs["instance"].id,))
-    except Exception:
-        _log.exception("Failed to dispatch task for comment %d", kwargs["instance"].id)
+    git_forge_id = (
+        BridgedSubmission.objects.filter(submission_id=kwargs["instance"].submission_id)
+        .values_list("git_forge", flat=True)
+        .first()
+    )
+    if git_forge_id is None:
+        return
+
+    dispatch_comment(kwargs["instance"].id, git_forge_id)
 
 
 if settings.PATCHLAB_EMAIL_TO_GITLAB_MR:
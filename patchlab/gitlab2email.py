@@ -3,27 +3,54 @@
 This module deals with turning Gitlab objects (merge requests, comments) into
 emails.
 """
+from concurrent import futures
 from email import message_from_string, utils as email_utils
+import collections
+import contextlib
+import functools
+import itertools
+import json
 import logging
 import re
 import textwrap
+import threading
 import time
+import typing
 import urllib
 
 from django.conf import settings
 from django.core.mail import EmailMessage, get_connection
 from django.core.mail.utils import DNS_NAME
+from django.db import transaction
+from django.utils import timezone
 from patchwork import parser as patchwork_parser
 from patchwork.models import Submission
 import gitlab as gitlab_module
+import requests
 
-from patchlab.models import GitForge, BridgedSubmission, Branch
+from patchlab import routing
+from patchlab.models import (
+    BridgedSubmission,
+    Branch,
+    PendingComment,
+    normalize_subject,
+)
 
 
 _log = logging.getLogger(__name__)
 
 PREFIX_RE = re.compile(r"^\[.*\]")
 
+#: Per-thread state; ``recording`` is set while Patchwork saves the emails
+#: Patchlab creates so the event handlers know not to bridge them back.
+_local = threading.local()
+
+#: Matches Cc lines in a merge request description.
+MR_CC_RE = re.compile(r"^\s*Cc:\s+(.*)$")
+
+#: Matches the commit message trailers whose addresses are Cc'd on a patch.
+COMMIT_CC_RE = re.compile(r"^\s*(?:Cc|Signed-off-by|Reviewed-by):\s+(.*)$")
+
 #: The template used when the number of commits in a merge request exceed
 #: :data:`settings.PATCHLAB_MAX_EMAILS`. Instead of sending the patches, send
 #: instructions on how to get the git branch.
@@ -48,15 +75,78 @@ It is also possible to review the merge request on GitLab at:
 """  # noqa: E501
 
 
+class MergeRequestSnapshot(typing.NamedTuple):
+    """
+    The parts of a merge request used to decide whether to bridge it.
+
+    GitLab web hooks include most of this, so a snapshot built from a web hook
+    payload lets a merge request that won't be bridged be skipped without any
+    API calls. Any attribute the payload lacks is None, which is never a reason
+    to skip the merge request.
+    """
+
+    iid: int
+    sha: typing.Optional[str] = None
+    target_branch: typing.Optional[str] = None
+    labels: typing.Optional[typing.List[str]] = None
+    work_in_progress: typing.Optional[bool] = None
+    merge_status: typing.Optional[str] = None
+    pipeline_status: typing.Optional[str] = None
+
+    @classmethod
+    def from_merge_request(cls, merge_request):
+        """Create a snapshot from a python-gitlab merge request object."""
+        return cls(
+            iid=merge_request.iid,
+            sha=merge_request.sha,
+            target_branch=merge_request.target_branch,
+            labels=list(merge_request.labels),
+            work_in_progress=merge_request.work_in_progress,
+            merge_status=merge_request.merge_status,
+            pipeline_status=(merge_request.head_pipeline or {}).get("status"),
+        )
+
+    @classmethod
+    def from_merge_request_hook(cls, payload: dict):
+        """Create a snapshot from a "Merge Request Hook" web hook payload."""
+        attributes = payload["object_attributes"]
+        return cls(
+            iid=attributes["iid"],
+            sha=attributes.get("last_commit", {}).get("id"),
+            target_branch=attributes.get("target_branch"),
+            labels=[label["title"] for label in payload.get("labels", [])],
+            work_in_progress=attributes.get("work_in_progress"),
+            merge_status=attributes.get("merge_status"),
+        )
+
+    @classmethod
+    def from_pipeline_hook(cls, payload: dict):
+        """Create a snapshot from a "Pipeline Hook" web hook payload."""
+        merge_request = payload["merge_request"]
+        return cls(
+            iid=merge_request["iid"],
+            sha=payload["object_attributes"].get("sha"),
+            target_branch=merge_request.get("target_branch"),
+            merge_status=merge_request.get("merge_status"),
+            pipeline_status=payload["object_attributes"].get("status"),
+        )
+
+
 def email_merge_request(
-    gitlab: gitlab_module.Gitlab, forge_id: int, merge_id: int
+    gitlab: gitlab_module.Gitlab, forge_id: int, merge_id: int, snapshot=None
 ) -> None:
-    """Email a merge request to a mailing list."""
-    try:
-        git_forge = GitForge.objects.get(
-            host=urllib.parse.urlsplit(gitlab.url).hostname, forge_id=forge_id
-        )
-    except GitForge.DoesNotExist:
+    """
+    Email a merge request to a mailing list.
+
+    Args:
+        snapshot: The merge request as described by the web hook that triggered
+            this, as a dictionary of :class:`MergeRequestSnapshot` fields. If it
+            is provided and shows the merge request won't be bridged, GitLab is
+            never contacted; otherwise the merge request is fetched and checked
+            again before anything is sent.
+    """
+    git_forge = routing.git_forge(urllib.parse.urlsplit(gitlab.url).hostname, forge_id)
+    if git_forge is None:
         _log.error(
             "Request to bridge merge id %d from project id %d on %s cannot "
             "be handled as no git forge is configured in Patchlab's database.",
@@ -65,15 +155,34 @@ def email_merge_request(
             urllib.parse.urlsplit(gitlab.url).hostname,
         )
         return
+
+    state = None
+    if snapshot is not None:
+        snapshot = MergeRequestSnapshot(**snapshot)
+        if snapshot.target_branch is not None:
+            state = _bridging_state(git_forge, snapshot)
+            if _ignore(snapshot, state):
+                return
+
     project = gitlab.projects.get(forge_id)
     merge_request = project.mergerequests.get(merge_id)
+    if snapshot is not None and snapshot.sha and snapshot.sha != merge_request.sha:
+        _log.info(
+            "A new revision for %r has been pushed, skipping emailing revision %s",
+            merge_request,
+            snapshot.sha,
+        )
+        return
 
-    if _ignore(git_forge, merge_request):
+    if state is None or state.branch is None:
+        state = _bridging_state(git_forge, merge_request)
+    if _ignore(MergeRequestSnapshot.from_merge_request(merge_request), state):
         return
 
     # This is all pretty hacky, but works for now. Just hang out until the
     # pipeline is completed.
     initial_head = merge_request.sha
+    waited = False
     if settings.PATCHLAB_PIPELINE_SUCCESS_REQUIRED:
         for _ in range(settings.PATCHLAB_PIPELINE_MAX_WAIT):
             if merge_request.head_pipeline["status"] not in ("failed", "success"):
@@ -83,30 +192,33 @@ def email_merge_request(
                     merge_request.head_pipeline["status"],
                 )
                 time.sleep(60)
+                waited = True
             else:
                 break
             merge_request = project.mergerequests.get(merge_id)
         else:
             _log.warn(
                 "Pipeline failed to complete after %d minutes; not emailing %r",
-                settings.PATCHLAB_PIPELINE_WAIT,
+                settings.PATCHLAB_PIPELINE_MAX_WAIT,
                 merge_request,
             )
             return
+    if waited:
+        # The merge request was fetched again after the last wait, but another
+        # revision may have been bridged while waiting for the pipeline.
+        state = _bridging_state(git_forge, merge_request)
+        if initial_head != merge_request.sha:
+            _log.info(
+                "A new revision for %r has been pushed, skipping emailing revision %s",
+                merge_request,
+                initial_head,
+            )
+            return
+        if _ignore(MergeRequestSnapshot.from_merge_request(merge_request), state):
+            # A label might have been added or something while we waited for CI.
+            return
 
-    merge_request = project.mergerequests.get(merge_id)
-    if initial_head != merge_request.sha:
-        _log.info(
-            "A new revision for %r has been pushed, skipping emailing revision %s",
-            merge_request,
-            initial_head,
-        )
-        return
-    if _ignore(git_forge, merge_request):
-        # A label might have been added or something while we waited for CI.
-        return
-
-    emails = _prepare_emails(gitlab, git_forge, project, merge_request)
+    emails = _prepare_emails(gitlab, git_forge, project, merge_request, state)
     with get_connection(fail_silently=False) as conn:
         for email in emails:
             try:
@@ -124,7 +236,8 @@ def email_merge_request(
                 raise e
 
 
-def _ignore(git_forge, merge_request):
+def _ignore(merge_request: MergeRequestSnapshot, state) -> bool:
+    """Decide whether a merge request should not be bridged."""
     if merge_request.work_in_progress:
         _log.info("Not emailing %r because it's a work in progress", merge_request)
         return True
@@ -133,24 +246,23 @@ def _ignore(git_forge, merge_request):
         return True
     if (
         settings.PATCHLAB_PIPELINE_SUCCESS_REQUIRED
-        and merge_request.head_pipeline["status"] == "failed"
+        and merge_request.pipeline_status == "failed"
     ):
         _log.info("Not emailing %r as the test pipeline failed", merge_request)
         return True
-    if "From email" in merge_request.labels:
+    labels = merge_request.labels or []
+    if "From email" in labels:
         _log.info("Not emailing %r as it's from email to start with", merge_request)
         return True
     for label in settings.PATCHLAB_IGNORE_GITLAB_LABELS:
-        if label in merge_request.labels:
+        if label in labels:
             _log.info(
                 "Not emailing %r as it is labeled with the %s label, which is ignored.",
                 merge_request,
                 label,
             )
             return True
-    if BridgedSubmission.objects.filter(
-        git_forge=git_forge, merge_request=merge_request.iid, commit=merge_request.sha
-    ).first():
+    if merge_request.sha in state.bridged_commits:
         _log.info(
             "Not emailing %r as the head sha is %s, which we already bridged.",
             merge_request,
@@ -161,89 +273,233 @@ def _ignore(git_forge, merge_request):
     return False
 
 
-def _reroll(git_forge, merge_request):
-    """Determine the patch reroll count based on previous submissions."""
-    prior_submissions = BridgedSubmission.objects.filter(
-        git_forge=git_forge, merge_request=merge_request.iid
-    )
-    latest_submission = prior_submissions.order_by("-series_version").first()
-    if latest_submission is None:
-        version = 1
-        in_reply_to = None
-    else:
-        if latest_submission.series_version:
-            version = latest_submission.series_version + 1
-        else:
-            version = 1
-        in_reply_to = latest_submission.submission.msgid
+class PartialSeries(typing.NamedTuple):
+    """
+    A series version whose cover letter was sent but not all of its patches.
 
-    return version, in_reply_to
+    Attributes:
+        version: The version of the series.
+        msgid: The Message-ID of the series' cover letter.
+        total: The number of patches the cover letter announced.
+        commits: The commit hashes of the patches that were sent.
+    """
 
+    version: int
+    msgid: str
+    total: int
+    commits: typing.FrozenSet[str]
 
-def _merge_request_ccs(git_forge, merge_request):
-    """Collect merge request Ccs"""
-    ccs = []
-    if merge_request.description is not None:
-        for line in merge_request.description.splitlines():
-            cc_match = re.search(r"^\s*Cc:\s+(.*)$", line)
-            if cc_match:
-                ccs += cc_match.groups()
 
-    ccs += [line[3:].strip() for line in merge_request.labels if line.startswith("Cc:")]
-    return _clean_ccs(ccs)
+class BridgingState(typing.NamedTuple):
+    """
+    Everything Patchlab knows about a merge request it might bridge.
+
+    Attributes:
+        version: The series version to use for the next submission.
+        in_reply_to: The Message-ID of the first email of the most recent
+            series version, or None if the merge request hasn't been bridged.
+        bridged_commits: The commit hashes that have already been bridged.
+        branch: The :class:`Branch` the merge request targets, or None if the
+            branch isn't configured to be bridged.
+        partial: The most recent series version if sending it failed part way
+            through, or None.
+    """
 
+    version: int
+    in_reply_to: typing.Optional[str]
+    bridged_commits: typing.FrozenSet[str]
+    branch: typing.Optional[Branch]
+    partial: typing.Optional[PartialSeries] = None
 
-def _commit_ccs(commit):
-    ccs = [commit.author_email]
-    for line in commit.message.splitlines():
-        cc_match = re.search(r"^\s*(Cc|Signed-off-by|Reviewed-by):\s+(.*)$", line)
-        if cc_match and cc_match.group(2).strip():
-            ccs.append(cc_match.group(2).strip())
 
-    return _clean_ccs(ccs)
+# Matches the patch count in a cover letter's subject, "[PREFIX PATCHv2 0/3]"
+_COVER_LETTER_TOTAL = re.compile(r"^\[[^\]]* 0/(\d+)\]")
 
 
-def _clean_ccs(ccs):
-    ccs = [email_utils.parseaddr(cc)[1] for cc in ccs if email_utils.parseaddr(cc)[1]]
-    ccs = list(
-        set(
-            [
-                cc
-                for cc in ccs
-                if re.search(settings.PATCHLAB_CC_FILTER, cc, flags=re.IGNORECASE)
-            ]
+def _bridging_state(git_forge, merge_request):
+    """
+    Load the bridging state of a merge request.
+
+    Every prior bridged submission is read in one query, joined with its
+    Patchwork submission for the Message-ID; the target branch comes from
+    :mod:`patchlab.routing`.
+    """
+    prior_submissions = (
+        BridgedSubmission.objects.filter(
+            git_forge=git_forge, merge_request=merge_request.iid
+        )
+        .order_by("submission_id")
+        .values_list("series_version", "commit", "submission__msgid", "subject")
+    )
+    latest_version, in_reply_to, bridged_commits = None, None, set()
+    latest_subject, latest_commits = None, set()
+    for series_version, commit, msgid, subject in prior_submissions:
+        if commit:
+            bridged_commits.add(commit)
+        if latest_version is None or (series_version or 0) > latest_version:
+            latest_version, in_reply_to = series_version or 0, msgid
+            latest_subject, latest_commits = subject, set()
+        if commit and (series_version or 0) == latest_version:
+            latest_commits.add(commit)
+
+    partial = None
+    match = _COVER_LETTER_TOTAL.match(latest_subject or "")
+    if match and len(latest_commits) < int(match.group(1)):
+        partial = PartialSeries(
+            version=latest_version,
+            msgid=in_reply_to,
+            total=int(match.group(1)),
+            commits=frozenset(latest_commits),
         )
+
+    branch = routing.branch(git_forge.pk, merge_request.target_branch)
+
+    return BridgingState(
+        version=latest_version + 1 if latest_version else 1,
+        in_reply_to=in_reply_to,
+        bridged_commits=frozenset(bridged_commits),
+        branch=branch,
+        partial=partial,
     )
-    ccs.sort()
-    return ccs
 
 
-def _prepare_emails(gitlab, git_forge, project, merge_request):
-    """Prepare a set of emails that represent the given merge request."""
-    try:
-        branch = Branch.objects.get(
-            git_forge=git_forge, name=merge_request.target_branch
-        )
-    except Branch.DoesNotExist:
+class CcResolver:
+    """
+    Resolve the Ccs for every email in a merge request's series.
+
+    Trailers are parsed once with patterns compiled at import time, address
+    normalization and filtering is memoized across calls, and the Ccs for the
+    whole series are aggregated as each commit is resolved.
+
+    Args:
+        merge_request: The merge request being bridged; its description and
+            labels provide Ccs for every email in the series.
+    """
+
+    def __init__(self, merge_request):
+        self._filter = _cc_filter(settings.PATCHLAB_CC_FILTER)
+        ccs = []
+        if merge_request.description is not None:
+            for line in merge_request.description.splitlines():
+                cc_match = MR_CC_RE.match(line)
+                if cc_match:
+                    ccs.append(cc_match.group(1))
+        ccs += [
+            label[3:].strip()
+            for label in merge_request.labels
+            if label.startswith("Cc:")
+        ]
+        self._merge_request_ccs = self._clean(ccs)
+        self._series_ccs = set(self._merge_request_ccs)
+
+    def _clean(self, ccs):
+        """Normalize and filter a list of addresses, dropping any duplicates."""
+        clean = set()
+        for cc in ccs:
+            address = _normalize_address(cc)
+            if address and _cc_allowed(self._filter, address):
+                clean.add(address)
+        return clean
+
+    @property
+    def merge_request_ccs(self):
+        """The sorted list of Ccs from the merge request itself."""
+        return sorted(self._merge_request_ccs)
+
+    @property
+    def series_ccs(self):
+        """The sorted list of Ccs for every commit resolved so far."""
+        return sorted(self._series_ccs)
+
+    def commit(self, commit):
+        """
+        Resolve the Ccs for a commit's patch email.
+
+        This includes the commit author, any Cc, Signed-off-by, and Reviewed-by
+        trailers, and the merge request Ccs. They are also added to the Ccs of
+        the series.
+
+        Returns:
+            list: The sorted list of addresses to Cc.
+        """
+        ccs = [commit.author_email]
+        for line in commit.message.splitlines():
+            cc_match = COMMIT_CC_RE.match(line)
+            if cc_match and cc_match.group(1).strip():
+                ccs.append(cc_match.group(1).strip())
+        ccs = self._clean(ccs)
+        self._series_ccs |= ccs
+        return sorted(ccs | self._merge_request_ccs)
+
+
+@functools.lru_cache(maxsize=None)
+def _cc_filter(pattern):
+    """Compile the :data:`settings.PATCHLAB_CC_FILTER` pattern."""
+    return re.compile(pattern, flags=re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_address(cc):
+    """Reduce a "Name <address>" string to just the address."""
+    return email_utils.parseaddr(cc)[1]
+
+
+@functools.lru_cache(maxsize=4096)
+def _cc_allowed(cc_filter, address):
+    return cc_filter.search(address) is not None
+
+
+def _prepare_emails(gitlab, git_forge, project, merge_request, state=None):
+    """
+    Prepare a set of emails that represent the given merge request.
+
+    This is a generator; patches are fetched from GitLab as the emails are
+    consumed so only a small window of messages is held in memory at once.
+    The cover letter, if there is one, is always yielded first and already
+    includes the Ccs of every patch in the series.
+
+    If sending the most recent series version failed part way through and the
+    merge request hasn't changed since, the rest of that version is prepared
+    instead of a new version: the cover letter and the patches that were sent
+    are skipped and the remaining patches reply to the original cover letter.
+
+    Args:
+        state: The merge request's :class:`BridgingState`; it is loaded from
+            the database if it isn't provided.
+    """
+    if state is None:
+        state = _bridging_state(git_forge, merge_request)
+    branch = state.branch
+    if branch is None:
         # Branch isn't configured to be bridged, skip.
         _log.info(
             "There is no branch in the patchlab database for %s; skipping",
             merge_request.target_branch,
         )
-        return []
+        return
 
-    from_email = settings.PATCHLAB_FROM_EMAIL.format(
-        forge_user=merge_request.author["username"]
-    )
-    commits = list(reversed(list(merge_request.commits())))
-    num_commits = len(commits)
-    series_version, in_reply_to = _reroll(git_forge, merge_request)
+    from_email = _from_email(merge_request.author["username"])
+    num_commits, commits = _count_commits(merge_request)
+    too_large = num_commits is None or num_commits > settings.PATCHLAB_MAX_EMAILS
+    if not too_large:
+        commits = list(reversed(list(commits)))
+    partial = None if too_large else _resumable(state.partial, commits)
+    if partial is None:
+        series_version, in_reply_to = state.version, state.in_reply_to
+    else:
+        _log.info(
+            "Resuming version %d of %r, %d of %d patches were already sent",
+            partial.version,
+            merge_request,
+            len(partial.commits),
+            partial.total,
+        )
+        series_version, in_reply_to = partial.version, partial.msgid
     version_prefix = f"v{series_version}" if series_version > 1 else ""
 
-    ccs = _merge_request_ccs(git_forge, merge_request)
+    cc_resolver = CcResolver(merge_request)
 
-    emails = []
-    if num_commits > 1:
+    if num_commits is None or num_commits > 1:
         # Compose a cover letter based on the pull request description.
         headers = {
             "Date": email_utils.formatdate(localtime=settings.EMAIL_USE_LOCALTIME),
@@ -270,8 +526,12 @@ def _prepare_emails(gitlab, git_forge, project, merge_request):
             f"From: {merge_request.author['username']} on {git_forge.host}\n\n"
             f"{wrapped_description}\n"
         )
+        if num_commits is None:
+            total = f"{settings.PATCHLAB_MAX_EMAILS}+"
+        else:
+            total = num_commits
         subject = (
-            f"[{branch.subject_prefix} PATCH{version_prefix} 0/{num_commits}] "
+            f"[{branch.subject_prefix} PATCH{version_prefix} 0/{total}] "
             f"{' '.join(merge_request.title.splitlines())}"  # No multi-line headers allowed
         )
         cover_letter = EmailMessage(
@@ -279,42 +539,46 @@ def _prepare_emails(gitlab, git_forge, project, merge_request):
             body=body,
             from_email=from_email,
             to=[git_forge.project.listemail],
-            cc=ccs,
+            cc=cc_resolver.merge_request_ccs,
             headers=headers,
             reply_to=[git_forge.project.listemail],
         )
 
-        if num_commits > settings.PATCHLAB_MAX_EMAILS:
+        if too_large:
             cover_letter.body = BIG_EMAIL_TEMPLATE.format(
                 description=body or "No description provided for merge request.",
                 remote_url=f"{project.web_url}.git",
                 merge_id=merge_request.iid,
                 merge_url=merge_request.web_url,
             )
-            return [cover_letter]
-
-        in_reply_to = headers["Message-ID"]
-        emails.append(cover_letter)
-
-    for i, commit in enumerate(commits, 1):
-        # This currently only works for public projects; authenticating with a
-        # token does not work.
-        # https://gitlab.com/gitlab-org/gitlab/issues/26228
-        response = gitlab.session.get(f"{project.web_url}/commit/{commit.id}.patch")
-        response.raise_for_status()
-        patch = message_from_string(response.text)
+            yield cover_letter
+            return
 
-        patch_num = "" if len(commits) == 1 else f" {str(i)}/{num_commits}"
+        # Ensure anyone getting Cc'd on a patch also gets the cover letter.
+        commit_ccs = [cc_resolver.commit(commit) for commit in commits]
+        if partial is None:
+            cover_letter.cc = cc_resolver.series_ccs
+            in_reply_to = headers["Message-ID"]
+            yield cover_letter
+    else:
+        commit_ccs = [cc_resolver.commit(commit) for commit in commits]
+
+    unsent = [
+        i
+        for i, commit in enumerate(commits, 1)
+        if partial is None or commit.id not in partial.commits
+    ]
+    patches = _fetch_patches(gitlab, project, [commits[i - 1] for i in unsent])
+    for i, patch in zip(unsent, patches):
+        commit = commits[i - 1]
+        patch_num = "" if num_commits == 1 else f" {str(i)}/{num_commits}"
         sanitized_patch_title = " ".join(commit.title.splitlines())
         subject = (
             f"[{branch.subject_prefix} PATCH{version_prefix}{patch_num}] "
             f"{sanitized_patch_title}"
         )
         patch_author = patch["From"]
-        patch_ccs = sorted(list(set(_commit_ccs(commit) + ccs)))
-        # Ensure anyone getting Cc'd on a patch also gets the cover letter
-        if num_commits > 1:
-            emails[0].cc = sorted(list(set(emails[0].cc + patch_ccs)))
+        patch_ccs = commit_ccs[i - 1]
 
         headers = {
             "Date": email_utils.formatdate(localtime=settings.EMAIL_USE_LOCALTIME),
@@ -336,34 +600,258 @@ def _prepare_emails(gitlab, git_forge, project, merge_request):
             headers=headers,
             reply_to=[git_forge.project.listemail],
         )
-        emails.append(email)
+        yield email
 
-    return emails
+
+def _count_commits(merge_request):
+    """
+    Count the commits in a merge request without paging through all of them.
+
+    The count comes from the pagination total GitLab sends with the first page
+    of commits. GitLab omits the total for very large collections, in which
+    case no more than :data:`settings.PATCHLAB_MAX_EMAILS` + 1 commits are
+    fetched; any more than that is too many to email, whatever the count.
+
+    Returns:
+        tuple: The number of commits, or None if there are more than
+            :data:`settings.PATCHLAB_MAX_EMAILS` and GitLab didn't say how
+            many, and an iterable of the commits, newest first. The iterable
+            is lazy and should only be consumed if the series is small enough
+            to email.
+    """
+    commits = merge_request.commits()
+    try:
+        return int(commits.total), commits
+    except (AttributeError, TypeError, ValueError):
+        pass
+
+    head = list(itertools.islice(commits, settings.PATCHLAB_MAX_EMAILS + 1))
+    if len(head) > settings.PATCHLAB_MAX_EMAILS:
+        return None, head
+    return len(head), head
+
+
+def _resumable(partial, commits):
+    """
+    Check whether a partly sent series version can be finished.
+
+    Returns:
+        PartialSeries: The partly sent version, if the merge request still has
+            the number of commits its cover letter announced and every commit
+            that was sent is still part of it; otherwise None.
+    """
+    if partial is None or partial.total != len(commits):
+        return None
+    if not partial.commits <= {commit.id for commit in commits}:
+        return None
+    return partial
+
+
+def _fetch_patches(gitlab, project, commits):
+    """
+    Fetch the patch for each commit, in order.
+
+    This is a generator. Up to :data:`settings.PATCHLAB_PATCH_PREFETCH`
+    patches are downloaded ahead of the one being consumed, so fetching
+    overlaps with recording and sending the current email without the whole
+    series being held in memory. Each download thread has its own HTTP
+    session, as sessions aren't safe to share between threads.
+    """
+
+    def fetch(session, commit):
+        # This currently only works for public projects; authenticating with a
+        # token does not work.
+        # https://gitlab.com/gitlab-org/gitlab/issues/26228
+        response = session.get(f"{project.web_url}/commit/{commit.id}.patch")
+        response.raise_for_status()
+        return message_from_string(response.text)
+
+    window = max(settings.PATCHLAB_PATCH_PREFETCH, 0)
+    if not window:
+        for commit in commits:
+            yield fetch(gitlab.session, commit)
+        return
+
+    local = threading.local()
+    sessions = []
+
+    def fetch_in_thread(commit):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = _copy_session(gitlab.session)
+            sessions.append(session)
+        return fetch(session, commit)
+
+    pending = collections.deque()
+    commits = iter(commits)
+    try:
+        with futures.ThreadPoolExecutor(max_workers=window) as executor:
+            try:
+                for commit in itertools.islice(commits, window):
+                    pending.append(executor.submit(fetch_in_thread, commit))
+                while pending:
+                    patch = pending.popleft().result()
+                    for commit in itertools.islice(commits, 1):
+                        pending.append(executor.submit(fetch_in_thread, commit))
+                    yield patch
+            finally:
+                for future in pending:
+                    future.cancel()
+    finally:
+        for session in sessions:
+            session.close()
+
+
+def _copy_session(session: requests.Session) -> requests.Session:
+    """Create a new HTTP session configured like an existing one."""
+    copy = requests.Session()
+    copy.headers.update(session.headers)
+    copy.auth = session.auth
+    copy.proxies.update(session.proxies)
+    copy.verify = session.verify
+    copy.cert = session.cert
+    return copy
 
 
 def email_comment(gitlab, forge_id, author, comment, merge_id=None) -> None:
     """Email a comment made on Gitlab"""
-    try:
-        git_forge = GitForge.objects.get(
-            host=urllib.parse.urlsplit(gitlab.url).hostname, forge_id=forge_id
+    git_forge = _comment_git_forge(gitlab, forge_id)
+    if git_forge is None:
+        return
+
+    _email_comments(git_forge, merge_id, comment.get("commit_id"), [(author, comment)])
+
+
+def buffer_comment(gitlab, forge_id, author, comment, merge_id=None) -> bool:
+    """
+    Buffer a comment made on Gitlab so it can be emailed as part of a digest.
+
+    Once the merge request or commit has been quiet for
+    :data:`settings.PATCHLAB_COMMENT_DIGEST_DELAY` seconds,
+    :func:`email_comment_digest` sends every buffered comment as one email.
+
+    Returns:
+        bool: True if this is the only comment waiting on the merge request or
+            commit, so a digest needs to be scheduled; False if one already
+            is, or if the comment can't be bridged.
+    """
+    git_forge = _comment_git_forge(gitlab, forge_id)
+    if git_forge is None:
+        return False
+
+    commit = comment.get("commit_id")
+    with transaction.atomic():
+        # A digest being sent holds these rows until it commits, after which
+        # they're gone and this comment needs a digest of its own
+        first = not (
+            PendingComment.objects.select_for_update()
+            .filter(git_forge=git_forge, merge_request=merge_id, commit=commit)
+            .exists()
         )
-    except GitForge.DoesNotExist:
+        PendingComment.objects.create(
+            git_forge=git_forge,
+            merge_request=merge_id,
+            commit=commit,
+            author=json.dumps(author),
+            comment=json.dumps(comment),
+        )
+    return first
+
+
+def email_comment_digest(gitlab, forge_id, merge_id=None, commit=None) -> None:
+    """
+    Email the comments buffered by :func:`buffer_comment` for a merge request
+    or commit as a single reply, if no comments have arrived on it within
+    :data:`settings.PATCHLAB_COMMENT_DIGEST_DELAY` seconds.
+
+    Returns:
+        float: The number of seconds until the digest can be sent if comments
+            are still arriving, or None if there was nothing left to do.
+    """
+    git_forge = _comment_git_forge(gitlab, forge_id)
+    if git_forge is None:
+        return None
+
+    with transaction.atomic():
+        pending = list(
+            PendingComment.objects.select_for_update()
+            .filter(git_forge=git_forge, merge_request=merge_id, commit=commit)
+            .order_by("received")
+        )
+        if not pending:
+            # Another task already sent the digest
+            return None
+
+        quiet_for = (timezone.now() - pending[-1].received).total_seconds()
+        if quiet_for < settings.PATCHLAB_COMMENT_DIGEST_DELAY:
+            return settings.PATCHLAB_COMMENT_DIGEST_DELAY - quiet_for
+
+        # The rows stay locked, and are restored if sending fails, until the
+        # digest is sent.
+        PendingComment.objects.filter(pk__in=[p.pk for p in pending]).delete()
+        _email_comments(
+            git_forge,
+            merge_id,
+            commit,
+            [(json.loads(p.author), json.loads(p.comment)) for p in pending],
+        )
+    return None
+
+
+def _comment_git_forge(gitlab, forge_id):
+    git_forge = routing.git_forge(urllib.parse.urlsplit(gitlab.url).hostname, forge_id)
+    if git_forge is None:
         _log.error(
             "Got comment event for project id %d, which isn't in the database", forge_id
         )
-        return
+    return git_forge
 
-    commit = comment.get("commit_id")
+
+@contextlib.contextmanager
+def _recording():
+    """Mark the submissions saved in this thread as created by Patchlab."""
+    _local.recording = True
     try:
-        bridged_submission = BridgedSubmission.objects.filter(
-            git_forge=git_forge
-        ).order_by("-series_version")
-        if merge_id:
-            bridged_submission = bridged_submission.filter(merge_request=merge_id)
-        if commit:
-            bridged_submission = bridged_submission.filter(commit=commit)
-        bridged_submission = bridged_submission[0]
-    except IndexError:
+        yield
+    finally:
+        _local.recording = False
+
+
+def recording() -> bool:
+    """Return whether the submission being saved was created by Patchlab."""
+    return getattr(_local, "recording", False)
+
+
+def _from_email(forge_user: str) -> str:
+    """
+    Format :data:`settings.PATCHLAB_FROM_EMAIL` for one or more forge users.
+
+    The display name is quoted as necessary, so names containing commas or
+    other special characters still make a valid address.
+    """
+    name, address = email_utils.parseaddr(settings.PATCHLAB_FROM_EMAIL)
+    return email_utils.formataddr((name.format(forge_user=forge_user), address))
+
+
+def _email_comments(git_forge, merge_id, commit, comments) -> None:
+    """
+    Email one or more comments made on the same merge request or commit as a
+    single reply to the bridged submission.
+
+    Args:
+        comments: A list of (author, comment) tuples from the GitLab web hook.
+    """
+    bridged_submission = BridgedSubmission.objects.filter(git_forge=git_forge)
+    if merge_id:
+        bridged_submission = bridged_submission.filter(merge_request=merge_id)
+    if commit:
+        bridged_submission = bridged_submission.filter(commit=commit)
+    bridged_submission = (
+        bridged_submission.order_by("-series_version")
+        .values_list("msgid", "subject")
+        .first()
+    )
+    if bridged_submission is None:
         _log.info(
             "Unable to find a bridged submission for comment on MR %d, commit %s, forge %r",
             merge_id,
@@ -371,30 +859,34 @@ def email_comment(gitlab, forge_id, author, comment, merge_id=None) -> None:
             git_forge,
         )
         return
+    in_reply_to, subject = bridged_submission
 
-    from_email = settings.PATCHLAB_FROM_EMAIL.format(forge_user=author["name"])
+    authors = []
+    for author, _ in comments:
+        if author["name"] not in authors:
+            authors.append(author["name"])
+    from_email = _from_email(", ".join(authors))
     # From the bridged_submission, find the in-reply-to, create email.
     headers = {
         "Date": email_utils.formatdate(localtime=settings.EMAIL_USE_LOCALTIME),
         "Message-ID": email_utils.make_msgid(domain=DNS_NAME),
-        "In-Reply-To": bridged_submission.submission.msgid,
-        "X-Patchlab-Comment": comment["url"],
+        "In-Reply-To": in_reply_to,
+        "X-Patchlab-Comment": comments[0][1]["url"],
     }
-    subject = "Re: " + " ".join(
-        message_from_string(bridged_submission.submission.headers)[
-            "Subject"
-        ].splitlines()
-    )
-    wrapped_description = "\n".join(
-        [
-            textwrap.fill(line, width=72, replace_whitespace=False)
-            for line in comment["note"].splitlines()
-        ]
-    )
-    body = (
-        f"From: {author['name']} on {git_forge.host}\n{comment['url']}\n\n{wrapped_description}\n"
-        f""
-    )
+    subject = f"Re: {subject}"
+    sections = []
+    for author, comment in comments:
+        wrapped_description = "\n".join(
+            [
+                textwrap.fill(line, width=72, replace_whitespace=False)
+                for line in comment["note"].splitlines()
+            ]
+        )
+        sections.append(
+            f"From: {author['name']} on {git_forge.host}\n{comment['url']}\n\n"
+            f"{wrapped_description}\n"
+        )
+    body = "\n".join(sections)
     comment = EmailMessage(
         subject=subject,
         body=body,
@@ -404,7 +896,10 @@ def email_comment(gitlab, forge_id, author, comment, merge_id=None) -> None:
         reply_to=[git_forge.project.listemail],
     )
     with get_connection(fail_silently=False) as conn:
-        patchwork_parser.parse_mail(comment.message(), list_id=git_forge.project.listid)
+        with _recording():
+            patchwork_parser.parse_mail(
+                comment.message(), list_id=git_forge.project.listid
+            )
         comment.connection = conn
         comment.send(fail_silently=False)
 
@@ -422,7 +917,8 @@ def _record_bridging(listid: str, merge_id: int, email: EmailMessage) -> None:
             there's a bug in this function.
     """
     try:
-        patchwork_parser.parse_mail(email.message(), list_id=listid)
+        with _recording():
+            patchwork_parser.parse_mail(email.message(), list_id=listid)
     except patchwork_parser.DuplicateMailError:
         _log.error(
             "Message ID %s is already in the database; do not call "
@@ -443,9 +939,15 @@ def _record_bridging(listid: str, merge_id: int, email: EmailMessage) -> None:
         )
         raise
 
+    git_forge = routing.project_git_forge(submission.project_id)
+    if git_forge is None:
+        # This process's copy of the routing table predates the Git forge
+        git_forge = submission.project.git_forge
     bridged_submission = BridgedSubmission(
         submission=submission,
-        git_forge=submission.project.git_forge,
+        git_forge=git_forge,
+        msgid=submission.msgid,
+        subject=normalize_subject(email.subject),
         merge_request=merge_id,
         commit=email.extra_headers.get("X-Patchlab-Commit"),
         series_version=email.extra_headers.get("X-Patchlab-Series-Version", 1),
@@ -0,0 +1,48 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Read the email headers Patchwork stores with each submission.
+
+Patchwork keeps a submission's headers as a single string, and several steps
+of bridging a series need the Subject of the same submissions, to pick a
+branch and to thread replies. :func:`parse` only parses the headers, not a
+message body, and keeps the results for the last 256 distinct headers parsed
+in a cache shared by the whole process, so a task that looks at a submission
+more than once parses it once. :func:`has_header` checks for the
+``X-Patchlab-*`` headers Patchlab adds to the email it sends without parsing
+anything.
+"""
+from email.parser import HeaderParser
+import functools
+import typing
+
+_parser = HeaderParser()
+
+
+class Headers(typing.NamedTuple):
+    """The headers of a submission Patchlab uses."""
+
+    #: The Subject header, or None if there isn't one.
+    subject: typing.Optional[str]
+
+
+@functools.lru_cache(maxsize=256)
+def parse(headers: str) -> Headers:
+    """
+    Parse the headers of a submission, reusing the result of earlier calls.
+
+    Args:
+        headers: The headers, as stored in ``Submission.headers``.
+    """
+    message = _parser.parsestr(headers, headersonly=True)
+    return Headers(subject=message["Subject"])
+
+
+def has_header(headers: str, name: str) -> bool:
+    """
+    Check whether raw email headers include a header, without parsing them.
+
+    This is only meant for the headers Patchlab adds to the emails it sends,
+    which always use the capitalization given, and is cheap enough to run on
+    every patch and comment saved.
+    """
+    return headers.startswith(f"{name}:") or f"\n{name}:" in headers
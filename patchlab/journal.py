@@ -0,0 +1,154 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+A journal of the web hooks Patchlab has accepted.
+
+When :data:`settings.PATCHLAB_WEBHOOK_JOURNAL_DIR` is set, each web hook that
+passes authentication is appended to the journal as a line of JSON containing
+the time it was received, its ``X-Gitlab-*`` headers (except the secret token),
+and its body. Writing happens in a background thread so the request only pays
+for putting the event on a queue.
+
+Each process writes to its own ``webhooks-<pid>.jsonl`` file. Once that file
+reaches :data:`settings.PATCHLAB_WEBHOOK_JOURNAL_MAX_BYTES` it is compressed
+to ``webhooks-<pid>.jsonl.<timestamp>.gz`` and a new file is started. Old
+journal files are never removed by Patchlab.
+
+Journals can be fed back through the web hook handlers with the
+``replay_webhooks`` management command.
+"""
+import atexit
+import datetime
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+import typing
+
+from django import http
+from django.conf import settings
+
+_log = logging.getLogger(__name__)
+
+#: Headers that are never written to the journal.
+EXCLUDED_HEADERS = frozenset(["x-gitlab-token"])
+
+_lock = threading.Lock()
+_listener = None
+_pid = None
+_journal = logging.getLogger("patchlab.journal.events")
+_journal.propagate = False
+_journal.setLevel(logging.INFO)
+
+
+class JournalFileHandler(logging.handlers.RotatingFileHandler):
+    """A rotating file handler that compresses, rather than numbers, old files."""
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        timestamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S.%f")
+        self.rotate(self.baseFilename, f"{self.baseFilename}.{timestamp}.gz")
+        self.stream = self._open()
+
+    def rotate(self, source, dest):
+        with open(source, "rb") as uncompressed, gzip.open(dest, "wb") as compressed:
+            shutil.copyfileobj(uncompressed, compressed)
+        os.remove(source)
+
+
+def record(request: http.HttpRequest) -> None:
+    """Append a web hook request to the journal, if the journal is enabled."""
+    if not settings.PATCHLAB_WEBHOOK_JOURNAL_DIR:
+        return
+
+    headers = {
+        key: value
+        for key, value in request.headers.items()
+        if key.lower().startswith("x-gitlab-") and key.lower() not in EXCLUDED_HEADERS
+    }
+    entry = {
+        "received": time.time(),
+        "headers": headers,
+        "body": request.body.decode("utf-8", errors="replace"),
+    }
+    _start()
+    _journal.info(json.dumps(entry))
+
+
+def read(
+    paths: typing.Iterable[str], since: float = None, until: float = None
+) -> typing.List[dict]:
+    """
+    Read entries from journal files, oldest first.
+
+    Files ending in ``.gz`` are decompressed. Entries from all the files are
+    merged by the time they were received.
+
+    Args:
+        paths: The journal files to read.
+        since: If provided, skip entries received before this Unix timestamp.
+        until: If provided, skip entries received after this Unix timestamp.
+    """
+    entries = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as journal_file:
+            for line in journal_file:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if since is not None and entry["received"] < since:
+                    continue
+                if until is not None and entry["received"] > until:
+                    continue
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry["received"])
+    return entries
+
+
+def close() -> None:
+    """Write any queued entries and close the journal file."""
+    global _listener
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+            _journal.handlers = []
+
+
+def _start() -> None:
+    """Start the thread writing the journal in this process if it's not running."""
+    global _listener, _pid
+
+    if _listener is not None and _pid == os.getpid():
+        return
+    with _lock:
+        if _listener is not None and _pid == os.getpid():
+            return
+        # A forked child inherits the parent's handlers, but not its thread
+        _journal.handlers = []
+        _pid = os.getpid()
+        path = os.path.join(
+            settings.PATCHLAB_WEBHOOK_JOURNAL_DIR, f"webhooks-{_pid}.jsonl"
+        )
+        file_handler = JournalFileHandler(
+            path, maxBytes=settings.PATCHLAB_WEBHOOK_JOURNAL_MAX_BYTES, encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        events = queue.Queue()
+        _journal.addHandler(logging.handlers.QueueHandler(events))
+        _listener = logging.handlers.QueueListener(events, file_handler)
+        _listener.start()
+        _log.info("Journaling web hooks to %s", path)
+
+
+atexit.register(close)
@@ -0,0 +1,25 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+import argparse
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from patchlab.events import bulk_import
+
+
+class Command(BaseCommand):
+    help = (
+        "Run Patchwork's parsearchive command without bridging each patch and"
+        " comment as it is imported; once the import is done, a single task"
+        " bridges every series and comment that was imported. Arguments are"
+        " passed to parsearchive."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "args", nargs=argparse.REMAINDER, help="Arguments for parsearchive"
+        )
+
+    def handle(self, *args, **kwargs):
+        with bulk_import():
+            call_command("parsearchive", *args)
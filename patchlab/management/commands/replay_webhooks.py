@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+import argparse
+import datetime
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import dateparse
+
+from patchlab import journal
+from patchlab.views.gitlab import WEBHOOKS
+
+
+def _timestamp(value: str) -> float:
+    """Parse an ISO 8601 date and time, assuming UTC if no offset is given."""
+    parsed = dateparse.parse_datetime(value)
+    if parsed is None:
+        raise argparse.ArgumentTypeError(f"{value} is not an ISO 8601 date and time")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay web hooks recorded in journal files (see"
+        " PATCHLAB_WEBHOOK_JOURNAL_DIR) through the web hook handlers. This can"
+        " be used to recover from an outage or to load test with real traffic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "journals", nargs="+", help="Journal files to replay, compressed or not"
+        )
+        parser.add_argument(
+            "--since",
+            type=_timestamp,
+            help="Only replay web hooks received at or after this ISO 8601 time",
+        )
+        parser.add_argument(
+            "--until",
+            type=_timestamp,
+            help="Only replay web hooks received at or before this ISO 8601 time",
+        )
+        parser.add_argument(
+            "--speed",
+            type=float,
+            default=1.0,
+            help=(
+                "How much faster than originally received to replay web hooks;"
+                " 2 replays at twice the original rate and 0 replays them as fast"
+                " as possible (default is 1)"
+            ),
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["speed"] < 0:
+            raise CommandError("The speed cannot be negative")
+
+        try:
+            entries = journal.read(kwargs["journals"], kwargs["since"], kwargs["until"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Failed to read the journal: {str(e)}")
+
+        start = time.monotonic()
+        first_received = entries[0]["received"] if entries else 0
+        for entry in entries:
+            if kwargs["speed"]:
+                offset = (entry["received"] - first_received) / kwargs["speed"]
+                delay = start + offset - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            event = entry["headers"].get("X-Gitlab-Event")
+            try:
+                handler = WEBHOOKS[event]
+            except KeyError:
+                self.stderr.write(f"Skipping {event} web hook with no handler")
+                continue
+            response = handler(json.loads(entry["body"]))
+            self.stdout.write(
+                f"{event} received at {entry['received']}: "
+                f"{response.status_code} {response.content.decode()}"
+            )
+        self.stdout.write(f"Replayed {len(entries)} web hooks")
@@ -0,0 +1,53 @@
+"""
+Copy the Message-ID and Subject of bridged submissions onto BridgedSubmission
+and index it for the lookup used when threading GitLab comments in email.
+"""
+import email
+
+from django.db import migrations, models
+
+
+def copy_threading_headers(apps, schema_editor):
+    BridgedSubmission = apps.get_model("patchlab", "BridgedSubmission")
+    for bridged_submission in BridgedSubmission.objects.select_related("submission"):
+        subject = email.message_from_string(bridged_submission.submission.headers)[
+            "Subject"
+        ]
+        bridged_submission.msgid = bridged_submission.submission.msgid
+        bridged_submission.subject = " ".join((subject or "").splitlines())
+        bridged_submission.save(update_fields=["msgid", "subject"])
+
+
+def reverse_migration(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patchlab", "0004_auto_20200428_0559"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bridgedsubmission",
+            name="msgid",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="bridgedsubmission",
+            name="subject",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.RunPython(copy_threading_headers, reverse_migration),
+        migrations.RemoveIndex(
+            model_name="bridgedsubmission", name="patchlab_br_merge_r_195b52_idx",
+        ),
+        migrations.AddIndex(
+            model_name="bridgedsubmission",
+            index=models.Index(
+                fields=["git_forge", "merge_request", "commit", "-series_version"],
+                name="patchlab_bridged_thread_idx",
+            ),
+        ),
+    ]
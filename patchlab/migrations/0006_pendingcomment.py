@@ -0,0 +1,47 @@
+"""Add a table to buffer GitLab comments that are emailed as digests."""
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patchlab", "0005_bridgedsubmission_threading"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingComment",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("merge_request", models.IntegerField(blank=True, null=True)),
+                ("commit", models.CharField(blank=True, max_length=128, null=True)),
+                ("author", models.TextField()),
+                ("comment", models.TextField()),
+                ("received", models.DateTimeField(auto_now_add=True)),
+                (
+                    "git_forge",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="patchlab.GitForge",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="pendingcomment",
+            index=models.Index(
+                fields=["git_forge", "merge_request", "commit", "received"],
+                name="patchlab_pending_thread_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,45 @@
+"""Add a table to buffer emailed comments that are posted to GitLab in batches."""
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patchwork", "0036_project_commit_url_format"),
+        ("patchlab", "0006_pendingcomment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingGitlabComment",
+            fields=[
+                (
+                    "comment",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="patchwork.Comment",
+                    ),
+                ),
+                ("merge_request", models.IntegerField()),
+                ("received", models.DateTimeField(auto_now_add=True)),
+                (
+                    "git_forge",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="patchlab.GitForge",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="pendinggitlabcomment",
+            index=models.Index(
+                fields=["git_forge", "merge_request"],
+                name="patchlab_pending_gitlab_idx",
+            ),
+        ),
+    ]
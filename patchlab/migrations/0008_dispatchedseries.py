@@ -0,0 +1,30 @@
+"""Add a table recording which series have been dispatched to be bridged."""
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patchwork", "0036_project_commit_url_format"),
+        ("patchlab", "0007_pendinggitlabcomment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DispatchedSeries",
+            fields=[
+                (
+                    "series",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="patchwork.Series",
+                    ),
+                ),
+                ("dispatched", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+"""Add a table of tasks waiting for fair-share scheduling."""
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patchlab", "0008_dispatchedseries"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WorkItem",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task", models.CharField(max_length=255)),
+                ("args", models.TextField()),
+                ("size", models.PositiveIntegerField(default=0)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("started", models.DateTimeField(blank=True, null=True)),
+                (
+                    "git_forge",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="patchlab.GitForge",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="workitem",
+            index=models.Index(
+                fields=["git_forge", "started", "size", "created"],
+                name="patchlab_work_item_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+"""
+Include the Message-ID and Subject in the index used when threading GitLab
+comments in email, so the lookup doesn't need to visit the table.
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("patchlab", "0009_workitem"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="bridgedsubmission", name="patchlab_bridged_thread_idx",
+        ),
+        migrations.AddIndex(
+            model_name="bridgedsubmission",
+            index=models.Index(
+                fields=["git_forge", "merge_request", "commit", "-series_version"],
+                include=["msgid", "subject"],
+                name="patchlab_bridged_thread_idx",
+            ),
+        ),
+    ]
@@ -1,12 +1,23 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
-import email
 import os
-import re
 
 from django.conf import settings
 from django.db import models
 
-from patchwork.models import Project, Submission, validate_regex_compiles
+from patchwork.models import (
+    Comment,
+    Project,
+    Series,
+    Submission,
+    validate_regex_compiles,
+)
+
+from . import headers
+
+
+def normalize_subject(subject: str) -> str:
+    """Fold a possibly multi-line Subject header into a single line."""
+    return " ".join(subject.splitlines())
 
 
 class BridgedSubmission(models.Model):
@@ -21,6 +32,12 @@ class BridgedSubmission(models.Model):
         merge_request: The merge request ID in the Git forge.
         commit: The commit hash of the bridged submission, if the submission in
             question is a patch. May be null for comments.
+        msgid: The Message-ID of the submission, copied from the submission
+            so comments can be threaded without loading it.
+        subject: The single-line Subject of the submission, copied from the
+            submission headers so comments can be threaded without parsing
+            them. Both are filled in from the submission on save if they are
+            not provided.
     """
 
     submission = models.OneToOneField(
@@ -30,10 +47,143 @@ class BridgedSubmission(models.Model):
     commit = models.CharField(max_length=128, null=True, blank=True)
     series_version = models.IntegerField(null=True, blank=True)
     git_forge = models.ForeignKey("GitForge", on_delete=models.CASCADE)
+    msgid = models.CharField(max_length=255, blank=True, default="")
+    subject = models.TextField(blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # Matches the lookup used to thread GitLab comments in email and
+            # covers the columns it reads, so PostgreSQL can answer it from
+            # the index alone
+            models.Index(
+                fields=["git_forge", "merge_request", "commit", "-series_version"],
+                include=["msgid", "subject"],
+                name="patchlab_bridged_thread_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.msgid:
+            self.msgid = self.submission.msgid
+        if not self.subject:
+            subject = headers.parse(self.submission.headers).subject
+            self.subject = normalize_subject(subject or "")
+        super().save(*args, **kwargs)
+
+
+class PendingComment(models.Model):
+    """
+    A GitLab comment waiting to be emailed as part of a digest.
+
+    When :data:`settings.PATCHLAB_COMMENT_DIGEST_DELAY` is set, comments are
+    buffered here until the merge request or commit they were made on has been
+    quiet for the configured delay, then emailed together as one reply.
+
+    Attributes:
+        git_forge: The Git forge the comment was made on.
+        merge_request: The merge request ID the comment was made on, if any.
+        commit: The commit hash the comment was made on, if any.
+        author: The GitLab web hook's user object for the author, as JSON.
+        comment: The GitLab web hook's note object, as JSON.
+        received: When the comment was buffered.
+    """
+
+    git_forge = models.ForeignKey("GitForge", on_delete=models.CASCADE)
+    merge_request = models.IntegerField(null=True, blank=True)
+    commit = models.CharField(max_length=128, null=True, blank=True)
+    author = models.TextField()
+    comment = models.TextField()
+    received = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["git_forge", "merge_request", "commit", "received"],
+                name="patchlab_pending_thread_idx",
+            ),
+        ]
+
+
+class PendingGitlabComment(models.Model):
+    """
+    An emailed comment waiting to be posted to a GitLab merge request.
+
+    When :data:`settings.PATCHLAB_GITLAB_COMMENT_WINDOW` is set, emailed
+    comments are buffered here and every comment received for a merge request
+    within the window is posted as a single note.
+
+    Attributes:
+        comment: The :class:`patchwork.models.Comment` to post.
+        git_forge: The Git forge hosting the merge request.
+        merge_request: The merge request ID in the Git forge.
+        received: When the comment was buffered.
+    """
+
+    comment = models.OneToOneField(Comment, on_delete=models.CASCADE, primary_key=True)
+    git_forge = models.ForeignKey("GitForge", on_delete=models.CASCADE)
+    merge_request = models.IntegerField()
+    received = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["git_forge", "merge_request"],
+                name="patchlab_pending_gitlab_idx",
+            ),
+        ]
+
+
+class DispatchedSeries(models.Model):
+    """
+    Marks a Patchwork series as handed off to be opened as a merge request.
+
+    Every patch save in a complete series would otherwise queue another task
+    to bridge it; the row is claimed with a single insert so only the first
+    of those saves queues the task.
+
+    Attributes:
+        series: The :class:`patchwork.models.Series` that was dispatched.
+        dispatched: When the task to bridge the series was queued.
+    """
+
+    series = models.OneToOneField(Series, on_delete=models.CASCADE, primary_key=True)
+    dispatched = models.DateTimeField(auto_now_add=True)
+
+
+class WorkItem(models.Model):
+    """
+    A task waiting for its Git forge's turn to run, or running.
+
+    When :data:`settings.PATCHLAB_FAIR_SHARE_LIMIT` is set, bridging tasks are
+    recorded here rather than sent to Celery straight away, and
+    :func:`patchlab.scheduler.schedule` sends them once their Git forge has
+    fewer than that many tasks running. The row is deleted when the task
+    finishes.
+
+    Attributes:
+        git_forge: The Git forge, and so the project, the task is for.
+        task: The name of the Celery task.
+        args: The task's positional arguments, as JSON.
+        size: How much work the task is, such as the number of patches in a
+            series; smaller tasks are sent first.
+        created: When the task was submitted.
+        started: When the task was sent to Celery, or None if it's waiting.
+    """
+
+    git_forge = models.ForeignKey("GitForge", on_delete=models.CASCADE)
+    task = models.CharField(max_length=255)
+    args = models.TextField()
+    size = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         indexes = [
-            models.Index(fields=["merge_request", "git_forge"]),
+            # Matches the lookup of each Git forge's next tasks
+            models.Index(
+                fields=["git_forge", "started", "size", "created"],
+                name="patchlab_work_item_idx",
+            ),
         ]
 
 
@@ -87,21 +237,30 @@ class GitForge(models.Model):
     def repo_path(self):
         return os.path.join(settings.PATCHLAB_REPO_DIR, f"{self.host}-{self.forge_id}")
 
-    def branch(self, submission: Submission) -> str:
+    def branch(self, submission: Submission = None, subject: str = None) -> str:
         """
         Get the correct git branch name for a submission.
 
+        The branches' subject match rules are tried in order by the forge's
+        cached :class:`patchlab.routing.BranchRouter`.
+
+        Args:
+            submission: The submission to find the branch for.
+            subject: The submission's Subject header, if the caller has already
+                parsed it; the submission isn't needed if this is provided.
+
         Raises:
-            ValueError: if no forge can be found.
+            ValueError: if no branch matches.
         """
-        msg = email.message_from_string(submission.headers)
-        for branch in self.branches.all():
-            if re.search(
-                branch.subject_match, msg["Subject"], flags=re.MULTILINE | re.IGNORECASE
-            ):
-                return branch.name
-        else:
-            raise ValueError(f"No branch matches {submission}")
+        # The routing module imports this one
+        from patchlab import routing
+
+        if subject is None:
+            subject = headers.parse(submission.headers).subject
+        name = routing.branch_router(self.pk).match(subject or "")
+        if name is None:
+            raise ValueError(f"No branch matches {submission or subject}")
+        return name
 
 
 class Branch(models.Model):
@@ -0,0 +1,311 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+An in-memory copy of the Git forges, branches, and projects Patchlab bridges.
+
+The web hook views consult the routing table so events that can never result
+in an email, such as those for projects or branches that aren't configured,
+are rejected without queuing a task. The tasks look up Git forges, along with
+their Patchwork project, and branches here rather than querying for them on
+every event, and each Git forge has a :class:`BranchRouter`, used to pick the
+branch an emailed series is applied to.
+
+Everything is loaded from the database on first use and dropped whenever a
+:class:`GitForge`, :class:`Branch`, or Patchwork project is saved or deleted
+in this process. Other processes are told by a version number kept in
+Django's cache, which is bumped once the change is committed. Reading it can
+cost a network round trip or a query, so each process checks it at most once
+every :data:`settings.PATCHLAB_ROUTING_VERSION_CHECK_INTERVAL` seconds; if the
+cache isn't shared between processes, changes are picked up after
+:data:`settings.PATCHLAB_ROUTING_CACHE_TIMEOUT` seconds instead.
+
+The model instances handed out are shared between callers and threads, and
+must not be modified.
+"""
+import logging
+import re
+import threading
+import time
+import typing
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from patchwork.models import Project
+
+from .models import Branch, GitForge
+
+_log = logging.getLogger(__name__)
+
+#: The cache key of the configuration's version number.
+VERSION_KEY = "patchlab:routing:version"
+
+_lock = threading.Lock()
+_config = None
+#: When the version number was last read from Django's cache.
+_checked_at = None
+
+#: Matches the parts of a regular expression that stop it being combined with
+#: others: references to groups by number or name, and global inline flags.
+_UNCOMBINABLE_RE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(|\(\?[aiLmsux]+\)")
+
+
+class Route(typing.NamedTuple):
+    """The configuration of a single bridged Git forge project."""
+
+    git_forge_id: int
+    branches: typing.FrozenSet[str]
+
+
+class _Config(typing.NamedTuple):
+    version: typing.Optional[int]
+    loaded_at: float
+    routes: typing.Dict[typing.Tuple[str, int], Route]
+    git_forges: typing.Dict[int, GitForge]
+    project_git_forges: typing.Dict[int, GitForge]
+    #: Each Git forge's branches, in primary key order.
+    branches: typing.Dict[int, typing.List[Branch]]
+    #: Each Git forge's :class:`BranchRouter`, built from ``branches`` as needed.
+    routers: typing.Dict[int, "BranchRouter"]
+
+
+def _load(version: typing.Optional[int]) -> _Config:
+    git_forges = {
+        git_forge.pk: git_forge
+        for git_forge in GitForge.objects.select_related("project")
+    }
+    branches = {}
+    for branch in Branch.objects.order_by("pk"):
+        branch.git_forge = git_forges[branch.git_forge_id]
+        branches.setdefault(branch.git_forge_id, []).append(branch)
+    return _Config(
+        version=version,
+        loaded_at=time.monotonic(),
+        routes={
+            (git_forge.host, git_forge.forge_id): Route(
+                git_forge.pk,
+                frozenset(branch.name for branch in branches.get(git_forge.pk, ())),
+            )
+            for git_forge in git_forges.values()
+        },
+        git_forges=git_forges,
+        project_git_forges={
+            git_forge.project_id: git_forge for git_forge in git_forges.values()
+        },
+        branches=branches,
+        routers={},
+    )
+
+
+def _current() -> _Config:
+    """Get the configuration, loading it from the database if necessary."""
+    global _config, _checked_at
+
+    now = time.monotonic()
+    with _lock:
+        config = _config
+        if (
+            config is not None
+            and now - _checked_at < settings.PATCHLAB_ROUTING_VERSION_CHECK_INTERVAL
+            and now - config.loaded_at <= settings.PATCHLAB_ROUTING_CACHE_TIMEOUT
+        ):
+            return config
+
+    version = cache.get(VERSION_KEY)
+    with _lock:
+        _checked_at = now
+        if (
+            _config is None
+            or _config.version != version
+            or now - _config.loaded_at > settings.PATCHLAB_ROUTING_CACHE_TIMEOUT
+        ):
+            _config = _load(version)
+        return _config
+
+
+def routes() -> typing.Dict[typing.Tuple[str, int], Route]:
+    """
+    Get the routing table, loading it from the database if necessary.
+
+    Returns:
+        A dictionary mapping (host, forge_id) tuples to :class:`Route`.
+    """
+    return _current().routes
+
+
+def git_forge(host: str, forge_id: int) -> typing.Optional[GitForge]:
+    """
+    Get a Git forge, with its Patchwork project, by its project in the forge.
+
+    Args:
+        host: The hostname of the Git forge.
+        forge_id: The project ID in the Git forge.
+
+    Returns:
+        The :class:`GitForge`, or None if none is configured.
+    """
+    config = _current()
+    route = config.routes.get((host, forge_id))
+    return None if route is None else config.git_forges[route.git_forge_id]
+
+
+def git_forge_by_id(git_forge_id: int) -> typing.Optional[GitForge]:
+    """Get a Git forge, with its Patchwork project, by its primary key."""
+    return _current().git_forges.get(git_forge_id)
+
+
+def project_git_forge(project_id: int) -> typing.Optional[GitForge]:
+    """Get the Git forge of a Patchwork project, or None if it has none."""
+    return _current().project_git_forges.get(project_id)
+
+
+def branch(git_forge_id: int, name: str) -> typing.Optional[Branch]:
+    """Get a Git forge's branch by name, or None if it isn't configured."""
+    for candidate in _current().branches.get(git_forge_id, ()):
+        if candidate.name == name:
+            return candidate
+    return None
+
+
+def _drop() -> None:
+    global _config, _checked_at
+
+    with _lock:
+        _config = None
+        _checked_at = None
+
+
+def invalidate(*args, **kwargs) -> None:
+    """
+    Drop the configuration; it's reloaded the next time it's used.
+
+    Other processes sharing Django's cache reload it the next time they use it.
+    """
+    _drop()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Versions only need to differ, so starting over after the key is
+        # evicted is fine.
+        cache.set(VERSION_KEY, 1, timeout=None)
+
+
+def _changed(*args, **kwargs) -> None:
+    # This process sees the change straight away, but other processes can't
+    # until it's committed; telling them any earlier would have them reload
+    # the old configuration and keep it.
+    _drop()
+    transaction.on_commit(invalidate)
+
+
+class BranchRouter:
+    """
+    Picks the branch a submission is for from its subject.
+
+    The ``subject_match`` rules of a Git forge's branches are tried in order
+    and the first one to match wins, as :meth:`GitForge.branch` has always
+    done. Rather than trying each rule in turn, the rules are compiled into
+    as few regular expressions as possible: each is an alternation that tries
+    every rule from the start of the subject, in order. Rules that use named
+    groups, backreferences, or global inline flags can't be combined and are
+    tried on their own.
+
+    Args:
+        rules: A list of (subject_match, branch name) tuples, in order.
+    """
+
+    flags = re.MULTILINE | re.IGNORECASE
+
+    def __init__(self, rules: typing.List[typing.Tuple[str, str]]):
+        self.rules = rules
+        #: A list of (pattern, branch names) tuples; the name of the matching
+        #: rule's group is ``b<index>`` in a combined pattern.
+        self._matchers = []
+        pending = []
+        for subject_match, name in rules:
+            if (
+                _UNCOMBINABLE_RE.search(subject_match)
+                or re.compile(subject_match, self.flags).groupindex
+            ):
+                self._combine(pending)
+                pending = []
+                self._matchers.append((re.compile(subject_match, self.flags), [name]))
+            else:
+                pending.append((subject_match, name))
+        self._combine(pending)
+
+    def _combine(self, rules):
+        if not rules:
+            return
+        pattern = "|".join(
+            f"(?=[\\s\\S]*?(?:{subject_match}))(?P<b{index}>)"
+            for index, (subject_match, _) in enumerate(rules)
+        )
+        self._matchers.append(
+            (re.compile(f"\\A(?:{pattern})", self.flags), [name for _, name in rules])
+        )
+
+    def match(self, subject: str) -> typing.Optional[str]:
+        """Return the name of the branch for a subject, or None if none match."""
+        for pattern, names in self._matchers:
+            match = pattern.search(subject)
+            if match:
+                if len(names) == 1:
+                    return names[0]
+                return names[int(match.lastgroup[1:])]
+        return None
+
+
+def branch_router(git_forge_id: int) -> BranchRouter:
+    """Get the :class:`BranchRouter` for a Git forge, building it if necessary."""
+    config = _current()
+    router = config.routers.get(git_forge_id)
+    if router is None:
+        router = BranchRouter(
+            [
+                (branch.subject_match, branch.name)
+                for branch in config.branches.get(git_forge_id, ())
+            ]
+        )
+        # The router belongs to the configuration it was built from, so a
+        # reload in the meantime can't leave it cached
+        router = config.routers.setdefault(git_forge_id, router)
+    return router
+
+
+def is_routable(host: str, forge_id: int, target_branch: str = None) -> bool:
+    """
+    Check whether events for a project, and optionally a branch, are bridged.
+
+    Args:
+        host: The hostname of the Git forge.
+        forge_id: The project ID in the Git forge.
+        target_branch: The branch a merge request targets, if the event is for
+            a merge request.
+    """
+    route = routes().get((host, forge_id))
+    if route is None:
+        _log.info("No Git forge is configured for project %d on %s", forge_id, host)
+        return False
+    if target_branch is not None and target_branch not in route.branches:
+        _log.info(
+            "No branch named %s is configured for project %d on %s",
+            target_branch,
+            forge_id,
+            host,
+        )
+        return False
+    return True
+
+
+def is_bot(username: str) -> bool:
+    """Check whether a Git forge user is one Patchlab posts as."""
+    return username in settings.PATCHLAB_GITLAB_BOT_USERNAMES
+
+
+post_save.connect(_changed, sender=GitForge, dispatch_uid="patchlab_routing_forge")
+post_delete.connect(_changed, sender=GitForge, dispatch_uid="patchlab_routing_forge")
+post_save.connect(_changed, sender=Branch, dispatch_uid="patchlab_routing_branch")
+post_delete.connect(_changed, sender=Branch, dispatch_uid="patchlab_routing_branch")
+post_save.connect(_changed, sender=Project, dispatch_uid="patchlab_routing_project")
+post_delete.connect(_changed, sender=Project, dispatch_uid="patchlab_routing_project")
@@ -0,0 +1,166 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Fair-share scheduling of bridging tasks between projects.
+
+Celery runs tasks first come, first served, so a busy project submitting
+hundreds of patches and comments keeps every other project waiting. When
+:data:`settings.PATCHLAB_FAIR_SHARE_LIMIT` is set, tasks are instead
+submitted here with the Git forge they're for and recorded as
+:class:`WorkItem` rows. :func:`schedule` sends them to Celery, never letting a
+Git forge have more than the limit queued or running, so the work of other
+projects gets to the workers alongside the busy one's.
+
+Each time it runs, :func:`schedule` takes turns between the Git forges with
+waiting tasks, starting with those with the fewest tasks running and then
+those that have been waiting longest, and sends each forge's smallest tasks
+first: comments, then series by their number of patches. So that a large
+series can't be held back indefinitely by smaller ones, tasks that have waited
+longer than :data:`settings.PATCHLAB_FAIR_SHARE_MAX_WAIT` go before any
+others, oldest first. It runs once a transaction that submitted tasks has
+committed, and again each time a task finishes, by way of the
+:func:`patchlab.tasks.finish_work` callback.
+"""
+import datetime
+import itertools
+import json
+import logging
+
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Min, Value, When
+from django.utils import timezone
+
+from . import transactions
+from .models import GitForge, WorkItem
+
+_log = logging.getLogger(__name__)
+
+
+def submit(task, args: tuple, git_forge_id: int, size: int = 0) -> None:
+    """
+    Submit a Celery task to be sent once its Git forge's turn comes.
+
+    Outside a transaction the task may be sent straight away; otherwise it
+    waits for the transaction to commit.
+
+    Args:
+        task: The Celery task to queue.
+        args: The positional arguments for the task; they must be JSON
+            serializable.
+        git_forge_id: The primary key of the Git forge the task is for.
+        size: How much work the task is; smaller tasks are sent first.
+    """
+    WorkItem.objects.create(
+        git_forge_id=git_forge_id, task=task.name, args=json.dumps(args), size=size
+    )
+
+    if not transaction.get_connection().in_atomic_block:
+        schedule()
+        return
+
+    # One run once the transaction commits covers everything it submitted
+    if schedule not in transactions.on_commit_callbacks():
+        transaction.on_commit(schedule)
+
+
+def schedule() -> None:
+    """Send waiting tasks to Celery, as far as each Git forge's limit allows."""
+    limit = settings.PATCHLAB_FAIR_SHARE_LIMIT
+    now = timezone.now()
+    timeout = datetime.timedelta(seconds=settings.PATCHLAB_FAIR_SHARE_TIMEOUT)
+    lost, _ = WorkItem.objects.filter(started__lt=now - timeout).delete()
+    if lost:
+        _log.warning("%d tasks didn't finish in time and are assumed lost", lost)
+
+    with transaction.atomic():
+        # Locking the Git forges stops two processes both sending tasks for a
+        # forge with room for only one more
+        forge_ids = list(
+            GitForge.objects.select_for_update()
+            .filter(
+                pk__in=WorkItem.objects.filter(started__isnull=True).values("git_forge")
+            )
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        running = dict(
+            WorkItem.objects.filter(git_forge__in=forge_ids, started__isnull=False)
+            .values_list("git_forge")
+            .annotate(Count("pk"))
+        )
+        waiting_since = dict(
+            WorkItem.objects.filter(git_forge__in=forge_ids, started__isnull=True)
+            .values_list("git_forge")
+            .annotate(Min("created"))
+        )
+        overdue = now - datetime.timedelta(
+            seconds=settings.PATCHLAB_FAIR_SHARE_MAX_WAIT
+        )
+        # Overdue items all rank before the smallest, and among themselves by age
+        priority = Case(
+            When(created__lt=overdue, then=Value(-1)),
+            default=F("size"),
+            output_field=IntegerField(),
+        )
+        turns = []
+        for forge_id in sorted(
+            forge_ids,
+            key=lambda forge_id: (running.get(forge_id, 0), waiting_since[forge_id]),
+        ):
+            waiting = (
+                WorkItem.objects.filter(git_forge_id=forge_id, started__isnull=True)
+                .annotate(priority=priority)
+                .order_by("priority", "created", "pk")
+            )
+            if limit:
+                # Room left under the limit; if the limit was just turned off,
+                # everything still waiting is sent
+                waiting = waiting[: max(limit - running.get(forge_id, 0), 0)]
+            turns.append(list(waiting))
+        batch = [
+            item
+            for turn in itertools.zip_longest(*turns)
+            for item in turn
+            if item is not None
+        ]
+        WorkItem.objects.filter(pk__in=[item.pk for item in batch]).update(started=now)
+
+    if batch:
+        _publish(batch)
+
+
+def _publish(batch: list) -> None:
+    """Send started work items' tasks, with a single producer."""
+    # The tasks module imports this one
+    from .tasks import finish_work
+
+    unsent = list(batch)
+    try:
+        with current_app.producer_or_acquire() as producer:
+            for item in batch:
+                finished = finish_work.si(item.pk)
+                try:
+                    current_app.tasks[item.task].apply_async(
+                        json.loads(item.args),
+                        producer=producer,
+                        link=finished,
+                        link_error=finished,
+                    )
+                except Exception:
+                    _log.exception("Failed to dispatch %s%s", item.task, item.args)
+                else:
+                    unsent.remove(item)
+    except Exception:
+        _log.exception("Unable to reach the broker to dispatch %d tasks", len(unsent))
+    if unsent:
+        # Let the next run of the scheduler try again
+        WorkItem.objects.filter(pk__in=[item.pk for item in unsent]).update(
+            started=None
+        )
+
+
+def finish(work_item_id: int) -> None:
+    """Record that a work item's task has finished, and send the next tasks."""
+    WorkItem.objects.filter(pk=work_item_id).delete()
+    schedule()
@@ -29,6 +29,13 @@ PATCHLAB_GITLAB_WEBHOOK_SECRET = "change this"
 #: git branch for local review is sent instead of the series.
 PATCHLAB_MAX_EMAILS = 25
 
+#: The number of patches to download ahead of the one currently being emailed
+#: when bridging a merge request. Downloading happens in background threads so
+#: fetching overlaps with sending; set this to 0 to download patches one at a
+#: time as they are sent. If a download fails part way through a series, the
+#: retry sends the remaining patches as part of the same series version.
+PATCHLAB_PATCH_PREFETCH = 2
+
 #: The directory to store Git trees in. The scheme inside this directory is
 #: <forge-host>-<forge-id>.
 PATCHLAB_REPO_DIR = "/var/lib/patchlab"
@@ -41,6 +48,18 @@ PATCHLAB_EMAIL_TO_GITLAB_MR = True
 #: to patches.
 PATCHLAB_EMAIL_TO_GITLAB_COMMENT = True
 
+#: If non-zero, emailed comments are bridged to GitLab in batches. Every comment
+#: on a merge request received within this many seconds of the first is posted
+#: as a single note, along with a single update for any Acked-by or Nacked-by
+#: labels.
+PATCHLAB_GITLAB_COMMENT_WINDOW = 0
+
+#: If non-zero, GitLab comments are emailed as digests. Comments on the same
+#: merge request or commit are buffered until none have arrived for this many
+#: seconds and are then sent as a single reply, so a reviewer leaving many
+#: inline comments produces one email rather than one per comment.
+PATCHLAB_COMMENT_DIGEST_DELAY = 0
+
 #: A list of labels that, if any are present on a merge request, are ignored.
 PATCHLAB_IGNORE_GITLAB_LABELS = ["🛑 Do Not Email", "Do Not Email"]
 
@@ -55,9 +74,102 @@ PATCHLAB_PIPELINE_SUCCESS_REQUIRED = False
 #: for a pipeline to complete. Defaults to 2 hours.
 PATCHLAB_PIPELINE_MAX_WAIT = 120
 
+#: A push to a merge request typically results in several web hooks, such as a
+#: merge request update followed by a pipeline completing. Web hooks for a merge
+#: request revision that has been queued, but not yet bridged or skipped, are
+#: dropped for up to this many seconds. This uses Django's cache, so configure a
+#: cache shared by all the web workers (memcached, redis, or the database cache)
+#: in production; the default local-memory cache only deduplicates within a
+#: single process.
+PATCHLAB_WEBHOOK_DEDUPLICATE_TIMEOUT = 600
+
+#: The maximum number of events the asynchronous web hook endpoint holds while
+#: waiting to queue them with Celery. Once it is full, further events are
+#: rejected and dropped, since GitLab doesn't retry web hooks; enable
+#: :data:`PATCHLAB_WEBHOOK_JOURNAL_DIR` to be able to replay them.
+PATCHLAB_WEBHOOK_QUEUE_SIZE = 1000
+
+#: If set, every web hook Patchlab accepts is recorded in a journal in this
+#: directory, which must be writable by the web server. Journals can be replayed
+#: with the ``replay_webhooks`` management command to reproduce problems or
+#: recover from outages. Journals include comment text and other project data,
+#: but not the web hook secret.
+PATCHLAB_WEBHOOK_JOURNAL_DIR = None
+
+#: The size in bytes a web hook journal file grows to before it is compressed
+#: and a new file is started.
+PATCHLAB_WEBHOOK_JOURNAL_MAX_BYTES = 64 * 1024 * 1024
+
+#: The most seconds a process keeps its copy of the Git forges, branches, and
+#: projects Patchlab bridges. Changes made through the admin interface take
+#: effect immediately in the process that made them, and in every other process
+#: that shares Django's cache within
+#: :data:`PATCHLAB_ROUTING_VERSION_CHECK_INTERVAL` seconds of being committed;
+#: processes that don't share a cache, such as with the default local memory
+#: cache, pick them up once their copy expires.
+PATCHLAB_ROUTING_CACHE_TIMEOUT = 60
+
+#: The most seconds a process goes without asking Django's cache whether the
+#: Git forges, branches, or projects have changed. Asking costs a round trip to
+#: the cache server, or a query with the database cache, so lookups within the
+#: interval are served from memory alone.
+PATCHLAB_ROUTING_VERSION_CHECK_INTERVAL = 5
+
+#: The Celery queue for each kind of task Patchlab runs, and how workers handle
+#: those tasks. The kinds are ``git`` for applying emailed series with Git,
+#: ``api`` for bridging merge requests to email, and ``mail`` for delivering
+#: comments between GitLab and email; see :mod:`patchlab.celery`. For each kind:
+#:
+#: * ``queue`` is the name of the queue its tasks are sent to.
+#: * ``prefetch_multiplier`` is the Celery prefetch multiplier of workers that
+#:   consume from the queue. A worker consuming from several queues uses the
+#:   lowest of theirs.
+#: * ``acks_late`` is whether its tasks are acknowledged once they finish,
+#:   rather than when they start, so tasks interrupted by a worker crashing are
+#:   run again. It's off for merge requests, which can wait on a pipeline for
+#:   longer than brokers let a message go unacknowledged, and for comments,
+#:   which would be sent twice.
+#:
+#: Kinds or options left out keep their defaults. By default, workers consume
+#: from every queue; start them with ``celery worker --queues`` to dedicate
+#: them to some kinds of work.
+PATCHLAB_CELERY_QUEUES = {
+    "git": {"queue": "patchlab.git", "prefetch_multiplier": 1, "acks_late": True},
+    "api": {"queue": "patchlab.api", "prefetch_multiplier": 1, "acks_late": False},
+    "mail": {"queue": "patchlab.mail", "prefetch_multiplier": 4, "acks_late": False},
+}
+
+#: If non-zero, bridging tasks are scheduled fairly between projects rather than
+#: first come, first served, and each Git forge has at most this many tasks
+#: queued or running in Celery at a time; the rest wait in the database. When a
+#: task finishes, the projects that have waited longest go first, and each
+#: project's comments and smallest series go before its larger series, unless
+#: one has waited longer than :data:`PATCHLAB_FAIR_SHARE_MAX_WAIT`. See
+#: :mod:`patchlab.scheduler`.
+PATCHLAB_FAIR_SHARE_LIMIT = 0
+
+#: The number of seconds a task waits for the fair-share scheduler before it
+#: goes ahead of its project's smaller tasks, so a large series isn't held back
+#: indefinitely by a stream of comments and small series.
+PATCHLAB_FAIR_SHARE_MAX_WAIT = 30 * 60
+
+#: The number of seconds a task sent to Celery by the fair-share scheduler is
+#: given to finish. After that it's assumed lost, such as with a worker that
+#: was killed, and no longer counts against its Git forge's limit. This should
+#: be longer than the slowest task runs, including retries and
+#: :data:`PATCHLAB_PIPELINE_MAX_WAIT`.
+PATCHLAB_FAIR_SHARE_TIMEOUT = 3 * 60 * 60
+
+#: The usernames Patchlab posts to GitLab as. Comment web hooks from these users
+#: are dropped without queuing a task, rather than each task logging in to
+#: GitLab to discover the bridge's own username.
+PATCHLAB_GITLAB_BOT_USERNAMES = []
+
 #: The email to use for From: in bridged comments and patches. Python's
 #: `format` API will be called on the string. Currently the only key provided is
-#: `forge_author` which is set to the user's name on the Git forge.
+#: `forge_user` which is set to the user's name on the Git forge. Only the
+#: display name is formatted, and it's quoted as necessary, since a comment
+#: digest lists the names of everyone who commented.
 PATCHLAB_FROM_EMAIL = "Email Bridge on behalf of {forge_user} <bridge@example.com>"
 
 LOGGING = {
@@ -1,15 +1,21 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
+import contextlib
 import logging
 import os
+import typing
+import uuid
 
 from celery import shared_task
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from billiard.process import current_process
 from patchwork.models import Series
 from patchwork import models as pw_models
 import gitlab as gitlab_module
 
-from patchlab import bridge as email_bridge, gitlab2email
+from patchlab import bridge as email_bridge, gitlab2email, routing, scheduler
+from patchlab.headers import has_header
 
 _log = logging.getLogger(__name__)
 
@@ -18,18 +24,19 @@ _log = logging.getLogger(__name__)
 def open_merge_request(series_id: int) -> None:
     """Convert a Patchwork series into a pull request in GitLab."""
     series = Series.objects.get(pk=series_id)
+    git_forge = routing.project_git_forge(series.project_id)
+    if git_forge is None:
+        _log.error("No git forge associated with %s", str(series.project))
+        return
     try:
-        gitlab = gitlab_module.Gitlab.from_config(series.project.git_forge.host)
+        gitlab = gitlab_module.Gitlab.from_config(git_forge.host)
     except gitlab_module.config.ConfigError:
         _log.error(
             "Missing Gitlab configuration for %s; skipping series %i",
-            series.project.git_forge.host,
+            git_forge.host,
             series_id,
         )
         return
-    except ObjectDoesNotExist:
-        _log.error("No git forge associated with %s", str(series.project))
-        return
 
     # This assumes Celery has been configured with an acceptable working directory
     # either via the systemd unit file or the celery worker argument.
@@ -52,14 +59,24 @@ def submit_gitlab_comment(comment_id: int) -> None:
         _log.info("Received invalid comment id %d, dropping task", comment_id)
         return
 
+    if settings.PATCHLAB_GITLAB_COMMENT_WINDOW:
+        pending = email_bridge.buffer_gitlab_comment(comment)
+        if pending is not None:
+            submit_gitlab_comment_batch.apply_async(
+                (pending.git_forge_id, pending.merge_request),
+                countdown=settings.PATCHLAB_GITLAB_COMMENT_WINDOW,
+            )
+        return
+
+    # Comments are only dispatched for bridged submissions, so the project
+    # has a git forge
+    git_forge = routing.project_git_forge(comment.submission.project_id)
     try:
-        gitlab = gitlab_module.Gitlab.from_config(
-            comment.submission.project.git_forge.host
-        )
+        gitlab = gitlab_module.Gitlab.from_config(git_forge.host)
     except gitlab_module.config.ConfigError:
         _log.error(
             "Missing Gitlab configuration for %s; skipping comment %i",
-            comment.submission.project.git_forge.host,
+            git_forge.host,
             comment.msgid,
         )
         return
@@ -68,24 +85,162 @@ def submit_gitlab_comment(comment_id: int) -> None:
 
 
 @shared_task
-def merge_request_hook(gitlab_host: str, project_id: int, merge_id: int) -> None:
+def submit_gitlab_comment_batch(git_forge_id: int, merge_id: int) -> None:
+    """Submit the emailed comments buffered for a merge request as one Gitlab note."""
+    git_forge = routing.git_forge_by_id(git_forge_id)
+    if git_forge is None:
+        _log.info("Received invalid git forge id %d, dropping task", git_forge_id)
+        return
+
+    try:
+        gitlab = gitlab_module.Gitlab.from_config(git_forge.host)
+    except gitlab_module.config.ConfigError:
+        _log.error(
+            "Missing Gitlab configuration for %s; skipping comments on merge request %d",
+            git_forge.host,
+            merge_id,
+        )
+        return
+
+    try:
+        email_bridge.submit_pending_gitlab_comments(gitlab, git_forge, merge_id)
+    except Exception as e:
+        _log.warning("Failed to submit emailed comments to Gitlab, retrying...")
+        raise submit_gitlab_comment_batch.retry(exc=e, throw=False, countdown=60)
+
+
+def _revision_key(gitlab_host: str, project_id: int, merge_id: int, sha: str) -> str:
+    """The cache key recording that a merge request revision is queued."""
+    return f"patchlab:merge-request:{gitlab_host}:{project_id}:{merge_id}:{sha}"
+
+
+def dispatch_merge_request(
+    gitlab_host: str,
+    project_id: int,
+    merge_id: int,
+    snapshot: gitlab2email.MergeRequestSnapshot,
+) -> bool:
+    """
+    Queue a :func:`merge_request_hook` task for a merge request revision.
+
+    A single push to a merge request usually produces several web hooks, so
+    the task is only queued once per revision while one is waiting or running,
+    for at most :data:`settings.PATCHLAB_WEBHOOK_DEDUPLICATE_TIMEOUT` seconds.
+    Once the task has bridged or skipped the revision, later web hooks for it,
+    such as a pipeline that was retried and passed, queue it again. This relies
+    on Django's cache, so it should be shared between the web workers. With
+    fair-share scheduling, the task is submitted to :mod:`patchlab.scheduler`.
+
+    Args:
+        snapshot: The merge request as described by the web hook; it's passed
+            on to the task so merge requests that won't be bridged can be
+            skipped without asking GitLab about them.
+
+    Returns:
+        bool: True if a task was queued, False if one already was.
+    """
+    head_sha = snapshot.sha
+    key = _revision_key(gitlab_host, project_id, merge_id, head_sha)
+    if head_sha and not cache.add(
+        key, True, timeout=settings.PATCHLAB_WEBHOOK_DEDUPLICATE_TIMEOUT
+    ):
+        _log.info(
+            "Merge request %d revision %s on %s is already queued; skipping",
+            merge_id,
+            head_sha,
+            gitlab_host,
+        )
+        return False
+
+    args = (gitlab_host, project_id, merge_id, snapshot._asdict())
+    git_forge = routing.git_forge(gitlab_host, project_id)
+    try:
+        if settings.PATCHLAB_FAIR_SHARE_LIMIT and git_forge is not None:
+            # How many commits there are isn't known until GitLab is asked
+            scheduler.submit(merge_request_hook, args, git_forge.pk, size=1)
+        else:
+            merge_request_hook.apply_async(args)
+    except Exception:
+        cache.delete(key)
+        raise
+    return True
+
+
+@contextlib.contextmanager
+def _merge_request_lock(gitlab_host: str, project_id: int, merge_id: int):
+    """
+    Hold a lock, in Django's cache, on bridging a merge request.
+
+    This only excludes workers that share the cache, so the cache must be
+    shared by every Celery worker process; with Django's local-memory cache,
+    each process has its own lock.
+
+    Yields:
+        bool: True if the lock was acquired, False if another worker holds it.
+    """
+    key = f"patchlab:merge-request-lock:{gitlab_host}:{project_id}:{merge_id}"
+    token = uuid.uuid4().hex
+    # The lock must outlive a run that waits on the merge request's pipeline
+    timeout = 10 * 60
+    if settings.PATCHLAB_PIPELINE_SUCCESS_REQUIRED:
+        timeout += settings.PATCHLAB_PIPELINE_MAX_WAIT * 60
+    acquired = cache.add(key, token, timeout=timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+@shared_task
+def merge_request_hook(
+    gitlab_host: str, project_id: int, merge_id: int, snapshot: dict = None
+) -> None:
     """
     Handle incoming merge request web hooks.
 
     If a merge request is made up of more than a single commit, a cover letter
-    is created using the merge request description.
+    is created using the merge request description. Only one worker bridges a
+    given merge request at a time; others retry once it's done.
 
     Args:
         merge_request: The merge request web hook payload from GitLab
+        snapshot: The merge request as described by the web hook; see
+            :func:`gitlab2email.email_merge_request`.
     """
     gitlab = gitlab_module.Gitlab.from_config(gitlab_host)
-    try:
-        gitlab2email.email_merge_request(gitlab, project_id, merge_id)
-    except Exception as e:
-        _log.warning(
-            "Failed to email merge request from merge_request_hook, retrying in 1 minute"
-        )
-        raise merge_request_hook.retry(exc=e, throw=False, countdown=60)
+    with _merge_request_lock(gitlab_host, project_id, merge_id) as acquired:
+        if not acquired:
+            _log.info(
+                "Merge request %d on %s is already being bridged, retrying in 1 minute",
+                merge_id,
+                gitlab_host,
+            )
+            retry = merge_request_hook.retry(
+                throw=False, countdown=60, max_retries=None
+            )
+        else:
+            try:
+                gitlab2email.email_merge_request(
+                    gitlab, project_id, merge_id, snapshot=snapshot
+                )
+                if snapshot and snapshot.get("sha"):
+                    # Later web hooks may change whether the revision is
+                    # bridged, so let them queue it again
+                    cache.delete(
+                        _revision_key(
+                            gitlab_host, project_id, merge_id, snapshot["sha"]
+                        )
+                    )
+                return
+            except Exception as e:
+                _log.warning(
+                    "Failed to email merge request from merge_request_hook, "
+                    "retrying in 1 minute"
+                )
+                retry = merge_request_hook.retry(exc=e, throw=False, countdown=60)
+    # Retry once the lock has been released
+    raise retry
 
 
 @shared_task
@@ -99,12 +254,99 @@ def email_comment(
         return
     try:
         gitlab.auth()
-        if gitlab.user.username != comment_author["username"]:
+        if gitlab.user.username == comment_author["username"]:
+            _log.info("Ignoring comment posted by the bridge user.")
+        elif settings.PATCHLAB_COMMENT_DIGEST_DELAY:
+            if gitlab2email.buffer_comment(
+                gitlab, project_id, comment_author, comment, merge_id
+            ):
+                email_comment_digest.apply_async(
+                    (gitlab_host, project_id, merge_id, comment.get("commit_id")),
+                    countdown=settings.PATCHLAB_COMMENT_DIGEST_DELAY,
+                )
+        else:
             gitlab2email.email_comment(
                 gitlab, project_id, comment_author, comment, merge_id
             )
-        else:
-            _log.info("Ignoring comment posted by the bridge user.")
     except Exception as e:
         _log.warning("Failed to send gitlab comment as email, retrying...")
         raise merge_request_hook.retry(exc=e, throw=False, countdown=60)
+
+
+@shared_task
+def email_comment_digest(gitlab_host: str, project_id: int, merge_id=None, commit=None):
+    """
+    Email the comments buffered for a merge request or commit as one reply.
+
+    The first comment buffered for a merge request or commit schedules one of
+    these tasks; if more comments have arrived since, the digest is
+    rescheduled until the thread has been quiet for
+    :data:`settings.PATCHLAB_COMMENT_DIGEST_DELAY` seconds.
+    """
+    try:
+        gitlab = gitlab_module.Gitlab.from_config(gitlab_host)
+    except gitlab_module.config.ConfigError:
+        _log.error("Missing Gitlab configuration for %s", gitlab_host)
+        return
+    try:
+        wait = gitlab2email.email_comment_digest(gitlab, project_id, merge_id, commit)
+    except Exception as e:
+        _log.warning("Failed to send gitlab comment digest as email, retrying...")
+        raise email_comment_digest.retry(exc=e, throw=False, countdown=60)
+    if wait:
+        email_comment_digest.apply_async(
+            (gitlab_host, project_id, merge_id, commit), countdown=wait
+        )
+
+
+@shared_task
+def reconcile_import(patch_id: int, comment_ids: typing.List[int]) -> None:
+    """
+    Bridge the series and comments saved during a :func:`events.bulk_import`.
+
+    Args:
+        patch_id: The largest patch ID before the import started; every series
+            with a newer patch is dispatched if it's complete.
+        comment_ids: The IDs of the comments saved by the import; those on a
+            bridged submission are dispatched.
+    """
+    # The events module imports this one to dispatch its tasks
+    from patchlab import events
+
+    with transaction.atomic():
+        if settings.PATCHLAB_EMAIL_TO_GITLAB_MR:
+            series_ids = (
+                pw_models.Patch.objects.filter(pk__gt=patch_id, series__isnull=False)
+                .values_list("series", flat=True)
+                .distinct()
+            )
+            for series in Series.objects.filter(pk__in=series_ids).select_related(
+                "project"
+            ):
+                if not series.received_all:
+                    continue
+                patches = pw_models.Patch.objects.filter(series=series)
+                headers = patches.only("headers").first().headers
+                if has_header(headers, "X-Patchlab-Merge-Request"):
+                    continue
+                events.dispatch_series(series)
+
+        if settings.PATCHLAB_EMAIL_TO_GITLAB_COMMENT:
+            comments = pw_models.Comment.objects.filter(
+                pk__in=comment_ids, submission__bridgedsubmission__isnull=False
+            ).values_list("id", "headers", "submission__bridgedsubmission__git_forge")
+            for pk, headers, git_forge_id in comments.iterator():
+                if has_header(headers, "X-Patchlab-Comment"):
+                    continue
+                events.dispatch_comment(pk, git_forge_id)
+
+
+@shared_task
+def finish_work(work_item_id: int) -> None:
+    """
+    Record that a task sent by the fair-share scheduler finished.
+
+    This is linked to each task :mod:`patchlab.scheduler` sends, whether it
+    succeeds or fails, and sends the next waiting tasks.
+    """
+    scheduler.finish(work_item_id)
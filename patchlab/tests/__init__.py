@@ -19,9 +19,12 @@ class BaseTestCase(TestCase):
         """Common setup for tests."""
         # Import here because the Django app isn't set up until here.
         from patchwork.models import Patch
+        from patchlab import routing
 
         post_save.disconnect(sender=Patch, dispatch_uid="patchlab_mr")
         post_save.disconnect(sender=Patch, dispatch_uid="patchlab_comments")
+        # The routing table outlives the transaction each test is rolled back in
+        routing.invalidate()
         my_vcr = vcr.VCR(
             cassette_library_dir=os.path.join(FIXTURES, "VCR/"), record_mode="once"
         )
@@ -87,7 +87,9 @@ request:
 """
 
         bridge._notify_am_failure(
-            models.GitForge.objects.first(), pw_models.Series.objects.get(pk=1)
+            models.GitForge.objects.first(),
+            pw_models.Series.objects.get(pk=1),
+            "master",
         )
 
         self.assertEqual(1, len(mail.outbox))
@@ -120,7 +122,9 @@ request:
 """
 
         bridge._notify_am_failure(
-            models.GitForge.objects.first(), pw_models.Series.objects.get(pk=2)
+            models.GitForge.objects.first(),
+            pw_models.Series.objects.get(pk=2),
+            "master",
         )
 
         self.assertEqual(1, len(mail.outbox))
@@ -221,3 +225,91 @@ Nacked-by: Jeremy Cline <jcline@redhat.com>
         merge_request, note = bridge.submit_gitlab_comment(self.gitlab, comment)
 
         self.assertEqual(merge_request.labels, ["Nacked-by: jcline@redhat.com"])
+
+
+class SubmitGitlabCommentsTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.gitlab = mock.Mock()
+        self.merge_request = (
+            self.gitlab.projects.get.return_value.mergerequests.get.return_value
+        )
+        self.merge_request.labels = ["Acked-by: jcline@redhat.com"]
+
+    def _comment(self, content):
+        return mock.Mock(
+            content=content,
+            response_re=pw_models.Comment.response_re,
+            submitter="Jeremy Cline <jcline@redhat.com>",
+        )
+
+    def test_labels_unchanged(self):
+        """Assert the merge request isn't saved if no labels are added."""
+        comments = [self._comment("Acked-by: Jeremy Cline <jcline@redhat.com>")]
+
+        bridge.submit_gitlab_comments(
+            self.gitlab, models.GitForge.objects.get(pk=1), 2, comments
+        )
+
+        self.merge_request.save.assert_not_called()
+        self.merge_request.notes.create.assert_called_once()
+
+    def test_batched(self):
+        """Assert several comments result in one label update and one note."""
+        comments = [
+            self._comment("Looks good.\n\nAcked-by: Someone <someone@example.com>"),
+            self._comment("Never.\n\nNacked-by: Other <other@example.com>"),
+        ]
+
+        bridge.submit_gitlab_comments(
+            self.gitlab, models.GitForge.objects.get(pk=1), 2, comments
+        )
+
+        self.assertEqual(
+            [
+                "Acked-by: jcline@redhat.com",
+                "Acked-by: someone@example.com",
+                "Nacked-by: other@example.com",
+            ],
+            self.merge_request.labels,
+        )
+        self.merge_request.save.assert_called_once_with()
+        self.merge_request.notes.create.assert_called_once_with(
+            {
+                "body": (
+                    "Jeremy Cline <jcline@redhat.com> commented via email:\n"
+                    "```\nLooks good.\n\nAcked-by: Someone <someone@example.com>\n```"
+                    "\n\n"
+                    "Jeremy Cline <jcline@redhat.com> commented via email:\n"
+                    "```\nNever.\n\nNacked-by: Other <other@example.com>\n```"
+                )
+            }
+        )
+
+
+class BufferGitlabCommentTests(BaseTestCase):
+    """Tests for :func:`patchlab.bridge.buffer_gitlab_comment`."""
+
+    def test_batch_scheduled_once(self):
+        """Assert only the first comment waiting on a merge request needs a batch."""
+        submission = pw_models.Submission.objects.get(pk=1)
+        models.BridgedSubmission.objects.create(
+            git_forge=models.GitForge.objects.get(pk=1),
+            submission=submission,
+            merge_request=2,
+        )
+        comments = [
+            pw_models.Comment.objects.create(
+                submission=submission,
+                msgid=f"<{i}@example.com>",
+                submitter=pw_models.Person.objects.first(),
+                content="Looks good.",
+            )
+            for i in range(2)
+        ]
+
+        pending = [bridge.buffer_gitlab_comment(comment) for comment in comments]
+
+        self.assertEqual(comments[0], pending[0].comment)
+        self.assertIsNone(pending[1])
+        self.assertEqual(2, models.PendingGitlabComment.objects.count())
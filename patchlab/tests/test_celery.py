@@ -0,0 +1,103 @@
+from unittest import mock
+import types
+
+from django.test import SimpleTestCase, override_settings
+
+from patchlab import celery, tasks
+
+
+class RouteTaskTests(SimpleTestCase):
+    """Tests for :func:`patchlab.celery.route_task`."""
+
+    def test_routes(self):
+        """Assert each kind of task goes to its own queue."""
+        self.assertEqual(
+            {"queue": "patchlab.git"},
+            celery.route_task(tasks.open_merge_request.name, (), {}, {}),
+        )
+        self.assertEqual(
+            {"queue": "patchlab.api"},
+            celery.route_task(tasks.merge_request_hook.name, (), {}, {}),
+        )
+        self.assertEqual(
+            {"queue": "patchlab.mail"},
+            celery.route_task(tasks.email_comment.name, (), {}, {}),
+        )
+
+    def test_other_tasks(self):
+        """Assert tasks that aren't Patchlab's are left to other routers."""
+        self.assertIsNone(celery.route_task("celery.backend_cleanup", (), {}, {}))
+
+    @override_settings(PATCHLAB_CELERY_QUEUES={"mail": {"queue": "comments"}})
+    def test_override(self):
+        """Assert queues can be renamed, keeping the other defaults."""
+        self.assertEqual(
+            {"queue": "comments"},
+            celery.route_task(tasks.submit_gitlab_comment.name, (), {}, {}),
+        )
+        self.assertEqual(
+            {"queue": "patchlab.git"},
+            celery.route_task(tasks.open_merge_request.name, (), {}, {}),
+        )
+
+
+class TaskAnnotationsTests(SimpleTestCase):
+    """Tests for :class:`patchlab.celery.TaskAnnotations`."""
+
+    def test_acks_late(self):
+        """Assert acks_late is set for each kind of task."""
+        annotations = celery.TaskAnnotations()
+
+        self.assertEqual(
+            {"acks_late": True}, annotations.annotate(tasks.open_merge_request)
+        )
+        self.assertEqual(
+            {"acks_late": False}, annotations.annotate(tasks.email_comment)
+        )
+        self.assertIsNone(
+            annotations.annotate(types.SimpleNamespace(name="celery.backend_cleanup"))
+        )
+
+
+class SetPrefetchMultiplierTests(SimpleTestCase):
+    """Tests for :func:`patchlab.celery._set_prefetch_multiplier`."""
+
+    def setUp(self):
+        self.default = celery.app.conf.worker_prefetch_multiplier
+
+    def _worker(self, queues, prefetch_multiplier=None):
+        consume_from = mock.patch.object(
+            type(celery.app.amqp.queues),
+            "consume_from",
+            new_callable=mock.PropertyMock,
+            return_value={name: celery.app.amqp.queues[name] for name in queues},
+        )
+        consume_from.start()
+        self.addCleanup(consume_from.stop)
+        return types.SimpleNamespace(
+            app=celery.app, prefetch_multiplier=prefetch_multiplier or self.default
+        )
+
+    def test_lowest(self):
+        """Assert the lowest multiplier of the worker's queues is used."""
+        worker = self._worker(["patchlab.git", "patchlab.mail"])
+
+        celery._set_prefetch_multiplier(worker)
+
+        self.assertEqual(1, worker.prefetch_multiplier)
+
+    def test_other_queues(self):
+        """Assert other queues use the configured multiplier."""
+        worker = self._worker(["patchlab.mail", "celery"])
+
+        celery._set_prefetch_multiplier(worker)
+
+        self.assertEqual(min(4, self.default), worker.prefetch_multiplier)
+
+    def test_command_line(self):
+        """Assert a multiplier given on the command line is kept."""
+        worker = self._worker(["patchlab.git"], prefetch_multiplier=self.default + 8)
+
+        celery._set_prefetch_multiplier(worker)
+
+        self.assertEqual(self.default + 8, worker.prefetch_multiplier)
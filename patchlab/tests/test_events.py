@@ -1,12 +1,134 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 from unittest import mock
 
+from django.db import DatabaseError, transaction
 from django.test import override_settings
+from patchwork import models as pw_models
 
-from patchlab import events
+from patchlab import events, gitlab2email, models
 from . import BaseTestCase
 
 
+@mock.patch.object(
+    pw_models.Series, "received_all", new_callable=mock.PropertyMock, return_value=True
+)
+@mock.patch("patchlab.events.transaction.on_commit", lambda callback: callback())
+@mock.patch("patchlab.events.open_merge_request")
+class PatchEventsTests(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.patch = mock.Mock(
+            series=pw_models.Series.objects.get(pk=1),
+            headers="Subject: [TEST PATCH] Bring balance to the equals signs\n",
+        )
+
+    def test_dispatch_once(self, mock_open_merge_request, mock_received_all):
+        """Assert saving patches in a dispatched series doesn't queue it again."""
+        events.patch_event_handler(None, instance=self.patch)
+        events.patch_event_handler(None, instance=self.patch)
+
+        mock_open_merge_request.apply_async.assert_called_once_with(
+            (1,), producer=mock.ANY
+        )
+        self.assertTrue(models.DispatchedSeries.objects.filter(series_id=1).exists())
+
+    def test_dispatch_failed(self, mock_open_merge_request, mock_received_all):
+        """Assert a series is dispatched again if queuing the task failed."""
+        mock_open_merge_request.apply_async.side_effect = [Exception("Boom"), None]
+
+        events.patch_event_handler(None, instance=self.patch)
+        self.assertFalse(models.DispatchedSeries.objects.filter(series_id=1).exists())
+        events.patch_event_handler(None, instance=self.patch)
+
+        self.assertEqual(2, mock_open_merge_request.apply_async.call_count)
+        self.assertTrue(models.DispatchedSeries.objects.filter(series_id=1).exists())
+
+    def test_bridged_patch(self, mock_open_merge_request, mock_received_all):
+        """Assert patches emailed by Patchlab are ignored before checking the series."""
+        self.patch.headers = (
+            "Subject: [TEST PATCH] Bring balance to the equals signs\n"
+            "X-Patchlab-Merge-Request: https://gitlab/root/kernel/merge_requests/1\n"
+        )
+
+        events.patch_event_handler(None, instance=self.patch)
+
+        mock_received_all.assert_not_called()
+        mock_open_merge_request.apply_async.assert_not_called()
+
+    def test_recording(self, mock_open_merge_request, mock_received_all):
+        """Assert submissions saved while Patchlab records its own emails are ignored."""
+        with gitlab2email._recording():
+            events.patch_event_handler(None, instance=self.patch)
+
+        mock_received_all.assert_not_called()
+        mock_open_merge_request.apply_async.assert_not_called()
+        self.assertFalse(gitlab2email.recording())
+
+    def test_bulk_import(self, mock_open_merge_request, mock_received_all):
+        """Assert nothing is dispatched per patch during a bulk import."""
+        with mock.patch("patchlab.events.reconcile_import") as mock_reconcile:
+            with events.bulk_import():
+                events.patch_event_handler(None, instance=self.patch)
+
+        mock_open_merge_request.apply_async.assert_not_called()
+        mock_reconcile.apply_async.assert_called_once_with((4, []), producer=mock.ANY)
+
+
+@mock.patch("patchlab.events.submit_gitlab_comment")
+class DispatchTests(BaseTestCase):
+    """Tests for :func:`patchlab.events.dispatch`."""
+
+    def test_batched_on_commit(self, mock_submit_gitlab_comment):
+        """Assert tasks are published together once the transaction commits."""
+        with mock.patch("patchlab.events.transaction.on_commit") as mock_on_commit:
+            events.dispatch(mock_submit_gitlab_comment, (1,))
+            events.dispatch(mock_submit_gitlab_comment, (2,))
+            mock_submit_gitlab_comment.apply_async.assert_not_called()
+
+        mock_on_commit.assert_called_once()
+        mock_on_commit.call_args[0][0]()
+        producer = (
+            mock_submit_gitlab_comment.app.producer_or_acquire.return_value.__enter__()
+        )
+        self.assertEqual(
+            [
+                mock.call((1,), producer=producer),
+                mock.call((2,), producer=producer),
+            ],
+            mock_submit_gitlab_comment.apply_async.call_args_list,
+        )
+
+    def test_discarded_batch(self, mock_submit_gitlab_comment):
+        """Assert tasks aren't added to a batch whose transaction rolled back."""
+        # The callback is never registered, as if its transaction rolled back
+        with mock.patch("patchlab.events.transaction.on_commit"):
+            events.dispatch(mock_submit_gitlab_comment, (1,))
+
+        with mock.patch(
+            "patchlab.events.transaction.on_commit", lambda callback: callback()
+        ):
+            events.dispatch(mock_submit_gitlab_comment, (2,))
+
+        mock_submit_gitlab_comment.apply_async.assert_called_once_with(
+            (2,), producer=mock.ANY
+        )
+
+    def test_savepoint_rolled_back(self, mock_submit_gitlab_comment):
+        """Assert only the tasks of committed savepoints are published."""
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                events.dispatch(mock_submit_gitlab_comment, (1,))
+                raise DatabaseError("Boom")
+        events.dispatch(mock_submit_gitlab_comment, (2,))
+
+        for entry in transaction.get_connection().run_on_commit:
+            entry[1]()
+
+        mock_submit_gitlab_comment.apply_async.assert_called_once_with(
+            (2,), producer=mock.ANY
+        )
+
+
 @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
 class CommentEventsTests(BaseTestCase):
     def test_ignore_emails_with_header(self):
@@ -32,3 +154,41 @@ class CommentEventsTests(BaseTestCase):
                 "Ignoring instance %d as it originated from the bridge.",
                 mock_comment.id,
             )
+
+    @mock.patch("patchlab.events.dispatch")
+    def test_unbridged_submission(self, mock_dispatch):
+        """Assert comments on submissions that weren't bridged aren't dispatched."""
+        mock_comment = mock.Mock(headers="Subject: Re: [TEST PATCH]\n", submission_id=1)
+
+        events.comment_event_handler(None, instance=mock_comment)
+
+        mock_dispatch.assert_not_called()
+
+    @mock.patch("patchlab.events.dispatch")
+    def test_bridged_submission(self, mock_dispatch):
+        """Assert comments on bridged submissions are dispatched."""
+        models.BridgedSubmission.objects.create(
+            git_forge=models.GitForge.objects.get(pk=1),
+            submission=pw_models.Submission.objects.get(pk=1),
+            merge_request=1,
+        )
+        mock_comment = mock.Mock(headers="Subject: Re: [TEST PATCH]\n", submission_id=1)
+
+        events.comment_event_handler(None, instance=mock_comment)
+
+        mock_dispatch.assert_called_once_with(
+            events.submit_gitlab_comment, (mock_comment.id,)
+        )
+
+    @mock.patch("patchlab.events.dispatch")
+    def test_bulk_import(self, mock_dispatch):
+        """Assert only comments the import saved are left to reconcile."""
+        mock_comment = mock.Mock(headers="Subject: Re: [TEST PATCH]\n", submission_id=1)
+
+        with events.bulk_import():
+            events.comment_event_handler(None, instance=mock_comment, created=True)
+            events.comment_event_handler(None, instance=mock.Mock(), created=False)
+
+        mock_dispatch.assert_called_once_with(
+            events.reconcile_import, (mock.ANY, [mock_comment.id])
+        )
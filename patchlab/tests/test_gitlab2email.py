@@ -1,13 +1,16 @@
+from email import message_from_string
 from unittest import mock
+import datetime
 import os
 import json
 
 from django.core import mail
-from django.test import override_settings
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
 from patchwork import models as pw_models
 import gitlab as gitlab_module
 
-from patchlab import gitlab2email, models
+from patchlab import gitlab2email, models, routing
 from . import BIG_EMAIL, SINGLE_COMMIT_MR, MULTI_COMMIT_MR, BaseTestCase, FIXTURES
 
 
@@ -63,38 +66,147 @@ class EmailMergeRequestTests(BaseTestCase):
             "Not emailing %r because it's a work in progress", mock.ANY
         )
 
+    @mock.patch("patchlab.gitlab2email._log")
+    def test_snapshot_ignored(self, mock_log):
+        """Assert web hook data is enough to skip a merge request."""
+        gitlab = mock.Mock(url="https://gitlab")
+        snapshot = gitlab2email.MergeRequestSnapshot(
+            iid=8, sha="abc123", target_branch="master", work_in_progress=True
+        )
+
+        gitlab2email.email_merge_request(gitlab, 1, 8, snapshot._asdict())
+
+        gitlab.projects.get.assert_not_called()
+        mock_log.info.assert_called_once_with(
+            "Not emailing %r because it's a work in progress", snapshot
+        )
+
+    @mock.patch("patchlab.gitlab2email._log")
+    def test_snapshot_outdated(self, mock_log):
+        """Assert a revision that's no longer the head isn't emailed."""
+        gitlab = mock.Mock(url="https://gitlab")
+        merge_request = gitlab.projects.get.return_value.mergerequests.get.return_value
+        merge_request.sha = "def456"
+        snapshot = gitlab2email.MergeRequestSnapshot(
+            iid=8, sha="abc123", target_branch="master"
+        )
 
-class RerollTests(BaseTestCase):
-    """Tests for the :func:`gitlab2email._reroll` function."""
+        gitlab2email.email_merge_request(gitlab, 1, 8, snapshot._asdict())
+
+        mock_log.info.assert_called_once_with(
+            "A new revision for %r has been pushed, skipping emailing revision %s",
+            merge_request,
+            "abc123",
+        )
+        self.assertEqual(0, len(mail.outbox))
+
+    @override_settings(PATCHLAB_PIPELINE_SUCCESS_REQUIRED=True)
+    @mock.patch("patchlab.gitlab2email._prepare_emails", return_value=[])
+    @mock.patch("patchlab.gitlab2email.time.sleep")
+    def test_pipeline_finished(self, mock_sleep, mock_prepare_emails):
+        """Assert nothing is fetched again if the pipeline had already finished."""
+        gitlab = mock.Mock(url="https://gitlab")
+        mergerequests = gitlab.projects.get.return_value.mergerequests
+        mergerequests.get.return_value = mock.Mock(
+            iid=1,
+            sha="abc123",
+            target_branch="master",
+            labels=[],
+            work_in_progress=False,
+            merge_status="can_be_merged",
+            head_pipeline={"status": "success"},
+        )
+
+        with mock.patch(
+            "patchlab.gitlab2email._bridging_state",
+            wraps=gitlab2email._bridging_state,
+        ) as mock_bridging_state:
+            gitlab2email.email_merge_request(gitlab, 1, 1)
+
+        mock_sleep.assert_not_called()
+        mergerequests.get.assert_called_once_with(1)
+        mock_bridging_state.assert_called_once()
+        mock_prepare_emails.assert_called_once()
+
+
+class MergeRequestSnapshotTests(SimpleTestCase):
+    """Tests for :class:`gitlab2email.MergeRequestSnapshot`."""
+
+    def test_from_merge_request_hook(self):
+        payload = {
+            "object_attributes": {
+                "iid": 8,
+                "target_branch": "master",
+                "work_in_progress": False,
+                "merge_status": "can_be_merged",
+                "last_commit": {"id": "abc123"},
+            },
+            "labels": [{"title": "From email"}],
+        }
+
+        snapshot = gitlab2email.MergeRequestSnapshot.from_merge_request_hook(payload)
+
+        self.assertEqual(
+            gitlab2email.MergeRequestSnapshot(
+                iid=8,
+                sha="abc123",
+                target_branch="master",
+                labels=["From email"],
+                work_in_progress=False,
+                merge_status="can_be_merged",
+            ),
+            snapshot,
+        )
+
+    def test_from_pipeline_hook(self):
+        payload = {
+            "object_attributes": {"sha": "abc123", "status": "success"},
+            "merge_request": {"iid": 8, "target_branch": "master"},
+        }
+
+        snapshot = gitlab2email.MergeRequestSnapshot.from_pipeline_hook(payload)
+
+        self.assertEqual(
+            gitlab2email.MergeRequestSnapshot(
+                iid=8, sha="abc123", target_branch="master", pipeline_status="success"
+            ),
+            snapshot,
+        )
+        self.assertIsNone(snapshot.labels)
+
+
+class BridgingStateTests(BaseTestCase):
+    """Tests for the :func:`gitlab2email._bridging_state` function."""
 
     def test_no_prior_submissions(self):
         """Assert if there are no prior submissions, the version is 1."""
         git_forge = models.GitForge.objects.get(pk=1)
-        merge_request = mock.Mock(iid=42)
+        merge_request = mock.Mock(iid=42, target_branch="master")
 
-        version, in_reply_to = gitlab2email._reroll(git_forge, merge_request)
+        state = gitlab2email._bridging_state(git_forge, merge_request)
 
-        self.assertEqual(1, version)
-        self.assertIsNone(in_reply_to)
+        self.assertEqual(1, state.version)
+        self.assertIsNone(state.in_reply_to)
+        self.assertEqual(frozenset(), state.bridged_commits)
 
     def test_missing_series_version(self):
         """Assert if there the series_version is null the version is 1."""
         git_forge = models.GitForge.objects.get(pk=1)
-        merge_request = mock.Mock(iid=42)
+        merge_request = mock.Mock(iid=42, target_branch="master")
         submission = pw_models.Submission.objects.first()
         models.BridgedSubmission.objects.create(
             git_forge=git_forge, merge_request=42, submission=submission
         )
 
-        version, in_reply_to = gitlab2email._reroll(git_forge, merge_request)
+        state = gitlab2email._bridging_state(git_forge, merge_request)
 
-        self.assertEqual(1, version)
-        self.assertEqual(submission.msgid, in_reply_to)
+        self.assertEqual(1, state.version)
+        self.assertEqual(submission.msgid, state.in_reply_to)
 
     def test_v2_submission(self):
         """Assert the series version is +1 the previous version."""
         git_forge = models.GitForge.objects.get(pk=1)
-        merge_request = mock.Mock(iid=42)
+        merge_request = mock.Mock(iid=42, target_branch="master")
         submission = pw_models.Submission.objects.first()
         models.BridgedSubmission.objects.create(
             git_forge=git_forge,
@@ -103,15 +215,15 @@ class RerollTests(BaseTestCase):
             series_version=1,
         )
 
-        version, in_reply_to = gitlab2email._reroll(git_forge, merge_request)
+        state = gitlab2email._bridging_state(git_forge, merge_request)
 
-        self.assertEqual(2, version)
-        self.assertEqual(submission.msgid, in_reply_to)
+        self.assertEqual(2, state.version)
+        self.assertEqual(submission.msgid, state.in_reply_to)
 
     def test_v3_submission(self):
         """Assert the highest series version is selected as the reply_to."""
         git_forge = models.GitForge.objects.get(pk=1)
-        merge_request = mock.Mock(iid=42)
+        merge_request = mock.Mock(iid=42, target_branch="master")
         submission1 = pw_models.Submission.objects.get(pk=1)
         submission2 = pw_models.Submission.objects.get(pk=2)
         models.BridgedSubmission.objects.create(
@@ -127,15 +239,198 @@ class RerollTests(BaseTestCase):
             series_version=2,
         )
 
-        version, in_reply_to = gitlab2email._reroll(git_forge, merge_request)
+        state = gitlab2email._bridging_state(git_forge, merge_request)
+
+        self.assertEqual(3, state.version)
+        self.assertEqual(submission2.msgid, state.in_reply_to)
+
+    def test_bridged_commits(self):
+        """Assert every bridged commit is included in the state."""
+        git_forge = models.GitForge.objects.get(pk=1)
+        merge_request = mock.Mock(iid=42, target_branch="master")
+        for pk, commit in ((1, None), (2, "abc123")):
+            models.BridgedSubmission.objects.create(
+                git_forge=git_forge,
+                merge_request=42,
+                submission=pw_models.Submission.objects.get(pk=pk),
+                commit=commit,
+                series_version=1,
+            )
+
+        # The target branch comes from the routing module's cache
+        routing.routes()
+        with self.assertNumQueries(1):
+            state = gitlab2email._bridging_state(git_forge, merge_request)
+
+        self.assertEqual(frozenset(["abc123"]), state.bridged_commits)
+        self.assertIsNone(state.partial)
+
+    def test_partial_series(self):
+        """Assert a series with fewer patches than announced is partial."""
+        git_forge = models.GitForge.objects.get(pk=1)
+        merge_request = mock.Mock(iid=42, target_branch="master")
+        cover_letter = pw_models.Submission.objects.get(pk=1)
+        for pk, commit, subject in (
+            (1, None, "[PATCHv2 0/3] A series"),
+            (2, "abc123", "[PATCHv2 1/3] Commit 0"),
+        ):
+            models.BridgedSubmission.objects.create(
+                git_forge=git_forge,
+                merge_request=42,
+                submission=pw_models.Submission.objects.get(pk=pk),
+                commit=commit,
+                series_version=2,
+                subject=subject,
+            )
+
+        state = gitlab2email._bridging_state(git_forge, merge_request)
+
+        self.assertEqual(
+            gitlab2email.PartialSeries(
+                version=2,
+                msgid=cover_letter.msgid,
+                total=3,
+                commits=frozenset(["abc123"]),
+            ),
+            state.partial,
+        )
+
+    def test_branch(self):
+        """Assert the target branch is included in the state."""
+        git_forge = models.GitForge.objects.get(pk=1)
 
-        self.assertEqual(3, version)
-        self.assertEqual(submission2.msgid, in_reply_to)
+        state = gitlab2email._bridging_state(
+            git_forge, mock.Mock(iid=42, target_branch="master")
+        )
+        missing_state = gitlab2email._bridging_state(
+            git_forge, mock.Mock(iid=42, target_branch="missing")
+        )
+
+        self.assertEqual(models.Branch.objects.get(pk=1), state.branch)
+        self.assertIsNone(missing_state.branch)
 
     def test_prior_ccs(self):
         """Assert all Ccs from prior bridged submissions are collected as Ccs."""
 
 
+class CcResolverTests(SimpleTestCase):
+    """Tests for the :class:`gitlab2email.CcResolver` class."""
+
+    def setUp(self):
+        self.merge_request = mock.Mock(
+            description="A series\n\nCc: Reviewer <reviewer@example.com>\n",
+            labels=["Cc: list@example.com", "Some label"],
+        )
+
+    def test_merge_request_ccs(self):
+        """Assert Ccs come from the description and labels."""
+        resolver = gitlab2email.CcResolver(self.merge_request)
+
+        self.assertEqual(
+            ["list@example.com", "reviewer@example.com"], resolver.merge_request_ccs
+        )
+
+    def test_commit_ccs(self):
+        """Assert commit Ccs include the author, trailers, and merge request Ccs."""
+        resolver = gitlab2email.CcResolver(self.merge_request)
+        commit = mock.Mock(
+            author_email="author@example.com",
+            message=(
+                "A commit\n\n"
+                "Reviewed-by: Someone <someone@example.com>\n"
+                "Signed-off-by: Author <author@example.com>\n"
+                "Acked-by: Ignored <ignored@example.com>\n"
+            ),
+        )
+
+        self.assertEqual(
+            [
+                "author@example.com",
+                "list@example.com",
+                "reviewer@example.com",
+                "someone@example.com",
+            ],
+            resolver.commit(commit),
+        )
+
+    def test_series_ccs(self):
+        """Assert the series Ccs include the Ccs of every commit."""
+        resolver = gitlab2email.CcResolver(self.merge_request)
+        for i in range(3):
+            resolver.commit(
+                mock.Mock(author_email=f"author{i}@example.com", message="A commit")
+            )
+
+        self.assertEqual(
+            [
+                "author0@example.com",
+                "author1@example.com",
+                "author2@example.com",
+                "list@example.com",
+                "reviewer@example.com",
+            ],
+            resolver.series_ccs,
+        )
+
+    @override_settings(PATCHLAB_CC_FILTER=r"@example.com$")
+    def test_filtered(self):
+        """Assert addresses that don't match the Cc filter are dropped."""
+        resolver = gitlab2email.CcResolver(self.merge_request)
+        commit = mock.Mock(author_email="author@example.org", message="A commit")
+
+        self.assertEqual(
+            ["list@example.com", "reviewer@example.com"], resolver.commit(commit)
+        )
+        self.assertEqual(
+            ["list@example.com", "reviewer@example.com"], resolver.series_ccs
+        )
+
+
+class CountCommitsTests(BaseTestCase):
+    """Tests for the :func:`gitlab2email._count_commits` function."""
+
+    def test_pagination_total(self):
+        """Assert the pagination total is used and the commits aren't iterated."""
+        commits = mock.MagicMock(total="1000")
+        merge_request = mock.Mock()
+        merge_request.commits.return_value = commits
+
+        num_commits, _ = gitlab2email._count_commits(merge_request)
+
+        self.assertEqual(1000, num_commits)
+        commits.__iter__.assert_not_called()
+
+    @override_settings(PATCHLAB_MAX_EMAILS=2)
+    def test_no_pagination_total(self):
+        """Assert small series are counted when GitLab doesn't provide a total."""
+        merge_request = mock.Mock()
+        merge_request.commits.return_value = [mock.Mock() for _ in range(2)]
+
+        num_commits, commits = gitlab2email._count_commits(merge_request)
+
+        self.assertEqual(2, num_commits)
+        self.assertEqual(2, len(commits))
+
+    @override_settings(PATCHLAB_MAX_EMAILS=2)
+    def test_no_pagination_total_too_large(self):
+        """Assert commits beyond the most that can be emailed aren't fetched."""
+        fetched = []
+
+        def commits():
+            for i in range(1000):
+                fetched.append(i)
+                yield mock.Mock()
+
+        merge_request = mock.Mock()
+        merge_request.commits.return_value = commits()
+
+        num_commits, commits = gitlab2email._count_commits(merge_request)
+
+        self.assertIsNone(num_commits)
+        self.assertEqual(3, len(commits))
+        self.assertEqual(3, len(fetched))
+
+
 @mock.patch(
     "patchlab.gitlab2email.email_utils.formatdate",
     mock.Mock(return_value="Mon, 04 Nov 2019 23:00:00 -0000"),
@@ -176,8 +471,8 @@ class PrepareEmailsTests(BaseTestCase):
         project = gitlab.projects.get(1)
         merge_request = project.mergerequests.get(1)
 
-        emails = gitlab2email._prepare_emails(
-            gitlab, self.forge, project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(gitlab, self.forge, project, merge_request)
         )
 
         self.assertEqual(1, len(emails))
@@ -196,8 +491,8 @@ class PrepareEmailsTests(BaseTestCase):
         project = gitlab.projects.get(1)
         merge_request = project.mergerequests.get(1)
 
-        emails = gitlab2email._prepare_emails(
-            gitlab, self.forge, project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(gitlab, self.forge, project, merge_request)
         )
 
         self.assertEqual(1, len(emails))
@@ -219,8 +514,8 @@ class PrepareEmailsTests(BaseTestCase):
         project = gitlab.projects.get(1)
         merge_request = project.mergerequests.get(1)
 
-        emails = gitlab2email._prepare_emails(
-            gitlab, self.forge, project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(gitlab, self.forge, project, merge_request)
         )
 
         self.assertEqual(1, len(emails))
@@ -234,8 +529,8 @@ class PrepareEmailsTests(BaseTestCase):
         project = gitlab.projects.get(1)
         merge_request = project.mergerequests.get(1)
 
-        emails = gitlab2email._prepare_emails(
-            gitlab, self.forge, project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(gitlab, self.forge, project, merge_request)
         )
 
         self.assertEqual(0, len(emails))
@@ -255,8 +550,8 @@ class PrepareEmailsTests(BaseTestCase):
         project = gitlab.projects.get(1)
         merge_request = project.mergerequests.get(1)
 
-        emails = gitlab2email._prepare_emails(
-            gitlab, self.forge, project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(gitlab, self.forge, project, merge_request)
         )
 
         self.assertEqual(1, len(emails))
@@ -281,8 +576,8 @@ class PrepareEmailsTests(BaseTestCase):
         project = gitlab.projects.get(1)
         merge_request = project.mergerequests.get(2)
 
-        emails = gitlab2email._prepare_emails(
-            gitlab, self.forge, project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(gitlab, self.forge, project, merge_request)
         )
 
         self.assertEqual(3, len(emails))
@@ -302,8 +597,8 @@ class PrepareEmailsTests(BaseTestCase):
         project = gitlab.projects.get(1)
         merge_request = project.mergerequests.get(2)
 
-        emails = gitlab2email._prepare_emails(
-            gitlab, self.forge, project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(gitlab, self.forge, project, merge_request)
         )
 
         self.assertEqual(1, len(emails))
@@ -321,8 +616,8 @@ class PrepareEmailsTests(BaseTestCase):
         project = gitlab.projects.get(1)
         merge_request = project.mergerequests.get(1)
 
-        emails = gitlab2email._prepare_emails(
-            gitlab, self.forge, project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(gitlab, self.forge, project, merge_request)
         )
 
         self.assertEqual(1, len(emails[0].message()["Subject"].splitlines()))
@@ -338,8 +633,8 @@ class PrepareEmailsTests(BaseTestCase):
         project = gitlab.projects.get(1)
         merge_request = project.mergerequests.get(2)
 
-        emails = gitlab2email._prepare_emails(
-            gitlab, self.forge, project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(gitlab, self.forge, project, merge_request)
         )
 
         self.assertEqual(3, len(emails))
@@ -357,14 +652,137 @@ class PrepareEmailsTests(BaseTestCase):
         project = gitlab.projects.get(1)
         merge_request = project.mergerequests.get(2)
 
-        emails = gitlab2email._prepare_emails(
-            gitlab, self.forge, project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(gitlab, self.forge, project, merge_request)
         )
 
         self.assertTrue(len(merge_request.description.splitlines()[0]) > 72)
         for line in emails[0].message().get_payload().splitlines():
             self.assertTrue(len(line) < 73)
 
+    def _series(self):
+        project = mock.Mock(web_url="https://gitlab/root/kernel")
+        commits = [
+            mock.Mock(
+                id=str(i),
+                title=f"Commit {i}",
+                message=f"Commit {i}\n\nCc: reviewer{i}@example.com\n",
+                author_email="jcline@redhat.com",
+            )
+            for i in range(3)
+        ]
+        merge_request = mock.Mock(
+            iid=42,
+            target_branch="internal",
+            author={"username": "root"},
+            description="A series",
+            title="A series",
+            labels=[],
+            web_url="https://gitlab/root/kernel/merge_requests/42",
+        )
+        merge_request.commits.return_value = commits
+        return project, merge_request
+
+    @mock.patch("patchlab.gitlab2email.requests.Session")
+    def test_cover_letter_before_patches(self, mock_session):
+        """
+        Assert the cover letter is ready, with every patch's Ccs, before any
+        patch is downloaded, and each download thread has its own session.
+        """
+        gitlab = mock.Mock()
+        mock_session.return_value.get.return_value.text = (
+            "From: Jeremy Cline <jcline@redhat.com>\n\nA patch"
+        )
+        project, merge_request = self._series()
+
+        emails = gitlab2email._prepare_emails(
+            gitlab, self.forge, project, merge_request
+        )
+        cover_letter = next(emails)
+
+        mock_session.return_value.get.assert_not_called()
+        self.assertEqual(
+            [
+                "jcline@redhat.com",
+                "reviewer0@example.com",
+                "reviewer1@example.com",
+                "reviewer2@example.com",
+            ],
+            cover_letter.cc,
+        )
+        self.assertEqual(3, len(list(emails)))
+        gitlab.session.get.assert_not_called()
+        mock_session.return_value.close.assert_called()
+
+    @override_settings(PATCHLAB_PATCH_PREFETCH=0)
+    def test_resume_partial_series(self):
+        """
+        Assert a partly sent series is finished as the same version, replying
+        to its cover letter, rather than being sent again as a new version.
+        """
+        gitlab = mock.Mock()
+        gitlab.session.get.return_value.text = (
+            "From: Jeremy Cline <jcline@redhat.com>\n\nA patch"
+        )
+        project, merge_request = self._series()
+        state = gitlab2email.BridgingState(
+            version=3,
+            in_reply_to="<cover@example.com>",
+            bridged_commits=frozenset(["2"]),
+            branch=self.branch,
+            partial=gitlab2email.PartialSeries(
+                version=2,
+                msgid="<cover@example.com>",
+                total=3,
+                commits=frozenset(["2"]),
+            ),
+        )
+
+        emails = list(
+            gitlab2email._prepare_emails(
+                gitlab, self.forge, project, merge_request, state
+            )
+        )
+
+        self.assertEqual(
+            ["[TEST PATCHv2 2/3] Commit 1", "[TEST PATCHv2 3/3] Commit 0"],
+            [email.subject for email in emails],
+        )
+        for email in emails:
+            self.assertEqual("<cover@example.com>", email.extra_headers["In-Reply-To"])
+            self.assertEqual(2, email.extra_headers["X-Patchlab-Series-Version"])
+        self.assertEqual(2, gitlab.session.get.call_count)
+
+    @override_settings(PATCHLAB_PATCH_PREFETCH=0)
+    def test_changed_partial_series(self):
+        """Assert a partly sent series isn't resumed if the commits changed."""
+        gitlab = mock.Mock()
+        gitlab.session.get.return_value.text = (
+            "From: Jeremy Cline <jcline@redhat.com>\n\nA patch"
+        )
+        project, merge_request = self._series()
+        state = gitlab2email.BridgingState(
+            version=3,
+            in_reply_to="<cover@example.com>",
+            bridged_commits=frozenset(["abc123"]),
+            branch=self.branch,
+            partial=gitlab2email.PartialSeries(
+                version=2,
+                msgid="<cover@example.com>",
+                total=3,
+                commits=frozenset(["abc123"]),
+            ),
+        )
+
+        emails = list(
+            gitlab2email._prepare_emails(
+                gitlab, self.forge, project, merge_request, state
+            )
+        )
+
+        self.assertEqual(4, len(emails))
+        self.assertEqual("[TEST PATCHv3 0/3] A series", emails[0].subject)
+
 
 @mock.patch(
     "patchlab.gitlab2email.email_utils.formatdate",
@@ -402,8 +820,10 @@ class RecordBridgingTests(BaseTestCase):
         self.project.save()
         project = self.gitlab.projects.get(1)
         merge_request = project.mergerequests.get(1)
-        emails = gitlab2email._prepare_emails(
-            self.gitlab, self.forge, self.project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(
+                self.gitlab, self.forge, self.project, merge_request
+            )
         )
 
         self.assertRaises(
@@ -417,8 +837,10 @@ class RecordBridgingTests(BaseTestCase):
     def test_multi_patch_series(self):
         project = self.gitlab.projects.get(1)
         merge_request = project.mergerequests.get(2)
-        emails = gitlab2email._prepare_emails(
-            self.gitlab, self.forge, self.project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(
+                self.gitlab, self.forge, self.project, merge_request
+            )
         )
         initial_patch_count = pw_models.Patch.objects.count()
         initial_cover_letter_count = pw_models.CoverLetter.objects.count()
@@ -435,8 +857,10 @@ class RecordBridgingTests(BaseTestCase):
     def test_single_patch_series(self):
         project = self.gitlab.projects.get(1)
         merge_request = project.mergerequests.get(1)
-        emails = gitlab2email._prepare_emails(
-            self.gitlab, self.forge, self.project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(
+                self.gitlab, self.forge, self.project, merge_request
+            )
         )
         initial_patch_count = pw_models.Patch.objects.count()
         initial_cover_letter_count = pw_models.CoverLetter.objects.count()
@@ -450,12 +874,33 @@ class RecordBridgingTests(BaseTestCase):
             initial_cover_letter_count, pw_models.CoverLetter.objects.count()
         )
 
+    def test_stale_routing(self):
+        """Assert the Git forge is loaded if the routing table doesn't know it."""
+        project = self.gitlab.projects.get(1)
+        merge_request = project.mergerequests.get(1)
+        emails = list(
+            gitlab2email._prepare_emails(
+                self.gitlab, self.forge, self.project, merge_request
+            )
+        )
+
+        with mock.patch(
+            "patchlab.gitlab2email.routing.project_git_forge", return_value=None
+        ):
+            bridged_submission = gitlab2email._record_bridging(
+                self.forge.project.listid, 1, emails[0]
+            )
+
+        self.assertEqual(self.forge, bridged_submission.git_forge)
+
     def test_duplicate_patches(self):
         """Assert if the same emails are provided to _record_bridging it raises an exception."""
         project = self.gitlab.projects.get(1)
         merge_request = project.mergerequests.get(1)
-        emails = gitlab2email._prepare_emails(
-            self.gitlab, self.forge, self.project, merge_request
+        emails = list(
+            gitlab2email._prepare_emails(
+                self.gitlab, self.forge, self.project, merge_request
+            )
         )
 
         for email in emails:
@@ -537,6 +982,11 @@ class EmailCommentTests(BaseTestCase):
 
         self.assertEqual(1, len(mail.outbox))
         self.assertEqual(expected_body, mail.outbox[0].body)
+        self.assertEqual(submission.msgid, mail.outbox[0].extra_headers["In-Reply-To"])
+        subject = message_from_string(submission.headers)["Subject"]
+        self.assertEqual(
+            "Re: " + " ".join(subject.splitlines()), mail.outbox[0].subject
+        )
 
     def test_comment_on_commit_email(self):
         """Assert comments bridged MRs are emailed."""
@@ -587,3 +1037,112 @@ class EmailCommentTests(BaseTestCase):
 
         self.assertEqual(1, len(mail.outbox))
         self.assertEqual(expected_body, mail.outbox[0].body)
+
+    @override_settings(PATCHLAB_COMMENT_DIGEST_DELAY=60)
+    def test_digest_scheduled_once(self):
+        """Assert only the first comment waiting on a thread needs a digest."""
+        submission = pw_models.Submission.objects.first()
+        models.BridgedSubmission.objects.create(
+            git_forge=self.forge, merge_request=42, submission=submission
+        )
+
+        scheduled = [
+            gitlab2email.buffer_comment(
+                self.gitlab,
+                self.forge.forge_id,
+                payload["user"],
+                payload["object_attributes"],
+                42,
+            )
+            for payload in (self.comment_on_mr_payload, self.comment_on_mr_payload)
+        ]
+
+        self.assertEqual([True, False], scheduled)
+        self.assertEqual(2, models.PendingComment.objects.count())
+
+    @override_settings(PATCHLAB_COMMENT_DIGEST_DELAY=60)
+    def test_digest_waits_for_quiet_period(self):
+        """Assert digests aren't sent while comments are still arriving."""
+        submission = pw_models.Submission.objects.first()
+        models.BridgedSubmission.objects.create(
+            git_forge=self.forge, merge_request=42, submission=submission
+        )
+
+        gitlab2email.buffer_comment(
+            self.gitlab,
+            self.forge.forge_id,
+            self.comment_on_mr_payload["user"],
+            self.comment_on_mr_payload["object_attributes"],
+            42,
+        )
+        wait = gitlab2email.email_comment_digest(self.gitlab, self.forge.forge_id, 42)
+
+        self.assertTrue(0 < wait <= 60)
+        self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(1, models.PendingComment.objects.count())
+
+    @override_settings(PATCHLAB_COMMENT_DIGEST_DELAY=60)
+    def test_digest_sent(self):
+        """Assert buffered comments are sent as one email once the thread is quiet."""
+        submission = pw_models.Submission.objects.first()
+        models.BridgedSubmission.objects.create(
+            git_forge=self.forge, merge_request=42, submission=submission
+        )
+        for payload in (self.comment_on_mr_payload, self.inline_code_comment_payload):
+            gitlab2email.buffer_comment(
+                self.gitlab,
+                self.forge.forge_id,
+                payload["user"],
+                payload["object_attributes"],
+                42,
+            )
+        models.PendingComment.objects.update(
+            received=timezone.now() - datetime.timedelta(minutes=5)
+        )
+        expected_body = (
+            "From: Administrator on gitlab\n"
+            "https://gitlab/root/patchlab_test/merge_requests/1#note_2\n\n"
+            "Not great, not terrible.\n"
+            "\n"
+            "From: Administrator on gitlab\n"
+            "https://gitlab/root/patchlab_test/merge_requests/1#note_3\n\n"
+            "This change in particular, I don't like it.\n"
+        )
+
+        wait = gitlab2email.email_comment_digest(self.gitlab, self.forge.forge_id, 42)
+
+        self.assertIsNone(wait)
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual(expected_body, mail.outbox[0].body)
+        self.assertEqual(0, models.PendingComment.objects.count())
+
+    @override_settings(PATCHLAB_COMMENT_DIGEST_DELAY=60)
+    def test_digest_several_authors(self):
+        """Assert digests of comments by several people have a valid From address."""
+        submission = pw_models.Submission.objects.first()
+        models.BridgedSubmission.objects.create(
+            git_forge=self.forge, merge_request=42, submission=submission
+        )
+        other_user = dict(self.inline_code_comment_payload["user"], name="Doe, Jane")
+        for user, payload in (
+            (self.comment_on_mr_payload["user"], self.comment_on_mr_payload),
+            (other_user, self.inline_code_comment_payload),
+        ):
+            gitlab2email.buffer_comment(
+                self.gitlab,
+                self.forge.forge_id,
+                user,
+                payload["object_attributes"],
+                42,
+            )
+        models.PendingComment.objects.update(
+            received=timezone.now() - datetime.timedelta(minutes=5)
+        )
+
+        gitlab2email.email_comment_digest(self.gitlab, self.forge.forge_id, 42)
+
+        self.assertEqual(1, len(mail.outbox))
+        self.assertEqual(
+            '"Email Bridge on behalf of Administrator, Doe, Jane" <bridge@example.com>',
+            mail.outbox[0].message()["From"],
+        )
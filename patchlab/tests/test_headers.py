@@ -0,0 +1,58 @@
+from django.test import SimpleTestCase
+
+from patchlab import headers
+
+HEADERS = """Content-Type: text/plain; charset="utf-8"
+MIME-Version: 1.0
+Subject: [TEST PATCH 1/2] Bring balance to the equals signs
+From: Jeremy Cline <jcline@redhat.com>
+Message-ID: <4@localhost.localdomain>
+X-Patchlab-Merge-Request: https://gitlab/root/kernel/merge_requests/1
+x-patchlab-commit: a958a0dff5e3c433eb99bc5f18cbcfad77433b0d
+"""
+
+
+class ParseTests(SimpleTestCase):
+    """Tests for :func:`patchlab.headers.parse`."""
+
+    def setUp(self):
+        headers.parse.cache_clear()
+
+    def test_parse(self):
+        """Assert the Subject is parsed."""
+        parsed = headers.parse(HEADERS)
+
+        self.assertEqual(
+            "[TEST PATCH 1/2] Bring balance to the equals signs", parsed.subject
+        )
+
+    def test_missing(self):
+        """Assert a missing Subject is None."""
+        parsed = headers.parse("From: Jeremy Cline <jcline@redhat.com>\n")
+
+        self.assertIsNone(parsed.subject)
+
+    def test_cached(self):
+        """Assert the same headers are only parsed once."""
+        first = headers.parse(HEADERS)
+
+        self.assertIs(first, headers.parse("".join(HEADERS)))
+        self.assertEqual(1, headers.parse.cache_info().misses)
+
+
+class HasHeaderTests(SimpleTestCase):
+    """Tests for :func:`patchlab.headers.has_header`."""
+
+    def test_has_header(self):
+        """Assert headers are found anywhere in the headers."""
+        self.assertTrue(headers.has_header(HEADERS, "Content-Type"))
+        self.assertTrue(headers.has_header(HEADERS, "X-Patchlab-Merge-Request"))
+        self.assertFalse(headers.has_header(HEADERS, "X-Patchlab-Comment"))
+
+    def test_header_in_value(self):
+        """Assert header names within other headers' values don't count."""
+        self.assertFalse(
+            headers.has_header(
+                "Subject: Drop X-Patchlab-Comment: support\n", "X-Patchlab-Comment"
+            )
+        )
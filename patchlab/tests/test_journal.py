@@ -0,0 +1,95 @@
+from io import StringIO
+from unittest import mock
+import glob
+import json
+import os
+import tempfile
+
+from django import http
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from patchlab import journal
+
+
+class JournalTests(SimpleTestCase):
+    """Tests for :mod:`patchlab.journal`."""
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.journal_dir = tmpdir.name
+        settings = override_settings(PATCHLAB_WEBHOOK_JOURNAL_DIR=self.journal_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(journal.close)
+
+    def _record(self, body):
+        request = RequestFactory().post(
+            "/patchlab/gitlab/",
+            data=json.dumps(body),
+            content_type="application/json",
+            HTTP_X_GITLAB_TOKEN="change this",
+            HTTP_X_GITLAB_EVENT="Note Hook",
+        )
+        journal.record(request)
+
+    def test_record(self):
+        """Assert web hooks are journaled without their secret token."""
+        self._record({"object_kind": "note"})
+        journal.close()
+
+        paths = glob.glob(os.path.join(self.journal_dir, "*.jsonl"))
+        entries = journal.read(paths)
+
+        self.assertEqual(1, len(entries))
+        self.assertEqual({"X-Gitlab-Event": "Note Hook"}, entries[0]["headers"])
+        self.assertEqual({"object_kind": "note"}, json.loads(entries[0]["body"]))
+
+    @override_settings(PATCHLAB_WEBHOOK_JOURNAL_DIR=None)
+    def test_disabled(self):
+        """Assert nothing is written if no journal directory is configured."""
+        self._record({"object_kind": "note"})
+        journal.close()
+
+        self.assertEqual([], os.listdir(self.journal_dir))
+
+    @override_settings(PATCHLAB_WEBHOOK_JOURNAL_MAX_BYTES=100)
+    def test_rotate(self):
+        """Assert full journal files are compressed and entries can be read back."""
+        for note in range(5):
+            self._record({"object_kind": "note", "note": "x" * 100, "id": note})
+        journal.close()
+
+        compressed = glob.glob(os.path.join(self.journal_dir, "*.gz"))
+        entries = journal.read(glob.glob(os.path.join(self.journal_dir, "*")))
+
+        self.assertNotEqual([], compressed)
+        self.assertEqual(
+            list(range(5)), [json.loads(entry["body"])["id"] for entry in entries]
+        )
+
+    def test_replay(self):
+        """Assert the replay_webhooks command feeds journaled web hooks to handlers."""
+        self._record({"object_kind": "note", "id": 1})
+        self._record({"object_kind": "note", "id": 2})
+        journal.close()
+        handler = mock.Mock(return_value=http.HttpResponse("Success!"))
+        stdout = StringIO()
+
+        with mock.patch.dict("patchlab.views.gitlab.WEBHOOKS", {"Note Hook": handler}):
+            call_command(
+                "replay_webhooks",
+                *glob.glob(os.path.join(self.journal_dir, "*")),
+                speed=0,
+                stdout=stdout,
+            )
+
+        self.assertEqual(
+            [
+                mock.call({"object_kind": "note", "id": 1}),
+                mock.call({"object_kind": "note", "id": 2}),
+            ],
+            handler.call_args_list,
+        )
+        self.assertIn("Replayed 2 web hooks", stdout.getvalue())
@@ -44,3 +44,34 @@ class BranchTests(BaseTestCase):
         submission = pw_models.Submission.objects.first()
 
         self.assertEqual("master", self.forge.branch(submission))
+
+
+class BridgedSubmissionTests(BaseTestCase):
+    def test_threading_headers_copied(self):
+        """Assert the Message-ID and Subject are copied from the submission on save."""
+        submission = pw_models.Submission.objects.get(pk=1)
+        headers = email.message_from_string(submission.headers)
+
+        bridged_submission = models.BridgedSubmission.objects.create(
+            git_forge=models.GitForge.objects.get(pk=1),
+            submission=submission,
+            merge_request=1,
+        )
+
+        self.assertEqual(submission.msgid, bridged_submission.msgid)
+        self.assertEqual(
+            " ".join(headers["Subject"].splitlines()), bridged_submission.subject
+        )
+
+    def test_threading_headers_provided(self):
+        """Assert provided threading headers are not overwritten."""
+        bridged_submission = models.BridgedSubmission.objects.create(
+            git_forge=models.GitForge.objects.get(pk=1),
+            submission=pw_models.Submission.objects.get(pk=1),
+            merge_request=1,
+            msgid="<1@example.com>",
+            subject="A subject",
+        )
+
+        self.assertEqual("<1@example.com>", bridged_submission.msgid)
+        self.assertEqual("A subject", bridged_submission.subject)
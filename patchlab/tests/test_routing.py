@@ -0,0 +1,196 @@
+from unittest import mock
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+from patchwork import models as pw_models
+
+from patchlab import models, routing
+from . import BaseTestCase
+
+
+class IsRoutableTests(BaseTestCase):
+    """Tests for :func:`patchlab.routing.is_routable`."""
+
+    def test_configured(self):
+        """Assert configured projects and branches are routable."""
+        self.assertTrue(routing.is_routable("gitlab", 1))
+        self.assertTrue(routing.is_routable("gitlab", 1, "master"))
+
+    def test_unknown_project(self):
+        """Assert projects without a git forge aren't routable."""
+        self.assertFalse(routing.is_routable("gitlab", 2))
+        self.assertFalse(routing.is_routable("example.com", 1))
+
+    def test_unknown_branch(self):
+        """Assert branches that aren't configured aren't routable."""
+        self.assertFalse(routing.is_routable("gitlab", 1, "stable"))
+
+    def test_cached(self):
+        """Assert the routing table is only loaded once."""
+        routing.is_routable("gitlab", 1)
+
+        with self.assertNumQueries(0):
+            routing.is_routable("gitlab", 1, "master")
+
+    def test_invalidated_on_save(self):
+        """Assert new branches are routable as soon as they're saved."""
+        self.assertFalse(routing.is_routable("gitlab", 1, "stable"))
+
+        models.Branch.objects.create(git_forge_id=1, name="stable")
+
+        self.assertTrue(routing.is_routable("gitlab", 1, "stable"))
+
+    def test_invalidated_on_delete(self):
+        """Assert deleted git forges stop being routable."""
+        self.assertTrue(routing.is_routable("gitlab", 1))
+
+        models.GitForge.objects.get(pk=1).delete()
+
+        self.assertFalse(routing.is_routable("gitlab", 1))
+
+
+class ConfigurationTests(BaseTestCase):
+    """Tests for the Git forge, branch, and project lookups in :mod:`patchlab.routing`."""
+
+    def test_git_forge(self):
+        """Assert Git forges are found by address, primary key, and project."""
+        git_forge = routing.git_forge("gitlab", 1)
+
+        self.assertEqual(models.GitForge.objects.get(pk=1), git_forge)
+        self.assertIs(git_forge, routing.git_forge_by_id(1))
+        self.assertIs(git_forge, routing.project_git_forge(git_forge.project_id))
+        self.assertIsNone(routing.git_forge("gitlab", 2))
+        self.assertIsNone(routing.git_forge_by_id(2))
+
+    def test_branch(self):
+        """Assert branches are found by name."""
+        self.assertEqual(models.Branch.objects.get(pk=1), routing.branch(1, "master"))
+        self.assertIsNone(routing.branch(1, "stable"))
+
+    def test_cached(self):
+        """Assert Git forges, their projects, and branches come from memory."""
+        routing.git_forge("gitlab", 1)
+
+        with self.assertNumQueries(0):
+            routing.git_forge("gitlab", 1).project.listemail
+            routing.branch(1, "master").git_forge.host
+
+    def test_invalidated_on_project_save(self):
+        """Assert project changes are picked up as soon as they're saved."""
+        project = routing.git_forge("gitlab", 1).project
+        pw_models.Project.objects.filter(pk=project.pk).update(
+            listemail="new@example.com"
+        )
+        pw_models.Project.objects.get(pk=project.pk).save()
+
+        self.assertEqual(
+            "new@example.com", routing.git_forge("gitlab", 1).project.listemail
+        )
+
+    def test_invalidated_by_other_process(self):
+        """Assert changes announced through the cache are picked up in time."""
+        routing.git_forge("gitlab", 1)
+        # Saved without signals, as if by another process
+        models.Branch.objects.bulk_create(
+            [models.Branch(git_forge_id=1, name="stable")]
+        )
+        self.assertIsNone(routing.branch(1, "stable"))
+
+        cache.incr(routing.VERSION_KEY)
+        self.assertIsNone(routing.branch(1, "stable"))
+
+        later = time.monotonic() + settings.PATCHLAB_ROUTING_VERSION_CHECK_INTERVAL
+        with mock.patch("patchlab.routing.time.monotonic", return_value=later):
+            self.assertEqual("stable", routing.branch(1, "stable").name)
+
+    def test_version_checked_periodically(self):
+        """Assert lookups within the check interval don't ask the cache."""
+        routing.git_forge("gitlab", 1)
+
+        with mock.patch("patchlab.routing.cache") as mock_cache:
+            routing.git_forge("gitlab", 1)
+            routing.branch(1, "master")
+
+        mock_cache.get.assert_not_called()
+
+    def test_version_bumped_on_commit(self):
+        """Assert other processes are only told about committed changes."""
+        version = cache.get(routing.VERSION_KEY)
+
+        with mock.patch("patchlab.routing.transaction.on_commit") as mock_on_commit:
+            models.Branch.objects.create(git_forge_id=1, name="stable")
+        self.assertEqual(version, cache.get(routing.VERSION_KEY))
+
+        mock_on_commit.call_args[0][0]()
+        self.assertNotEqual(version, cache.get(routing.VERSION_KEY))
+
+
+class BranchRouterTests(BaseTestCase):
+    """Tests for :class:`patchlab.routing.BranchRouter`."""
+
+    def test_order(self):
+        """Assert the first rule to match wins, even if a later one matches earlier."""
+        router = routing.BranchRouter(
+            [(r"^Does Not Match$", "nope"), ("FEATURE", "feature"), ("TEST", "test")]
+        )
+
+        self.assertEqual("feature", router.match("[TEST FEATURE PATCH] A change"))
+        self.assertEqual("test", router.match("[test PATCH] A change"))
+        self.assertIsNone(router.match("[PATCH] A change"))
+
+    def test_uncombinable(self):
+        """Assert rules that can't be combined keep their place in the order."""
+        router = routing.BranchRouter(
+            [
+                (r"(?P<tag>BUGFIX)", "bugfix"),
+                (r"(STABLE)-\1", "stable"),
+                ("FEATURE", "feature"),
+                ("", "master"),
+            ]
+        )
+
+        self.assertEqual("bugfix", router.match("[FEATURE BUGFIX] A fix"))
+        self.assertEqual("stable", router.match("[FEATURE STABLE-stable] A fix"))
+        self.assertEqual("feature", router.match("[FEATURE] A change"))
+        self.assertEqual("master", router.match("[PATCH] A change"))
+
+    def test_cached(self):
+        """Assert a forge's router is only built once."""
+        routing.branch_router(1)
+
+        with self.assertNumQueries(0):
+            routing.branch_router(1)
+
+    def test_invalidated_on_save(self):
+        """Assert branch rules are picked up as soon as they're saved."""
+        self.assertEqual("master", routing.branch_router(1).match("[STABLE] A fix"))
+
+        models.Branch.objects.filter(name="master").update(subject_match="FEATURE")
+        models.Branch.objects.create(git_forge_id=1, name="stable")
+
+        self.assertEqual("stable", routing.branch_router(1).match("[STABLE] A fix"))
+
+    def test_reloaded_while_building(self):
+        """Assert a router built from a since-dropped configuration isn't reused."""
+        build = routing.BranchRouter
+
+        def change_branches(rules):
+            models.Branch.objects.filter(name="master").update(subject_match="FEATURE")
+            models.Branch.objects.create(git_forge_id=1, name="stable")
+            return build(rules)
+
+        with mock.patch("patchlab.routing.BranchRouter", side_effect=change_branches):
+            self.assertEqual("master", routing.branch_router(1).match("[STABLE] A fix"))
+
+        self.assertEqual("stable", routing.branch_router(1).match("[STABLE] A fix"))
+
+
+class IsBotTests(BaseTestCase):
+    """Tests for :func:`patchlab.routing.is_bot`."""
+
+    @override_settings(PATCHLAB_GITLAB_BOT_USERNAMES=["patchlab"])
+    def test_bot(self):
+        self.assertTrue(routing.is_bot("patchlab"))
+        self.assertFalse(routing.is_bot("jcline"))
@@ -0,0 +1,179 @@
+import datetime
+from unittest import mock
+
+from django.test import override_settings
+from django.utils import timezone
+from patchwork import models as pw_models
+
+from patchlab import models, scheduler, tasks
+from . import BaseTestCase
+
+
+@override_settings(PATCHLAB_FAIR_SHARE_LIMIT=2)
+@mock.patch("patchlab.scheduler.transaction.on_commit", lambda callback: callback())
+@mock.patch("patchlab.scheduler._publish")
+class ScheduleTests(BaseTestCase):
+    """Tests for :mod:`patchlab.scheduler`."""
+
+    def setUp(self):
+        super().setUp()
+        project = pw_models.Project.objects.create(
+            linkname="ark",
+            name="ARK",
+            listid="kernel.lists.fedoraproject.org",
+            listemail="kernel@lists.fedoraproject.org",
+        )
+        self.other_forge = models.GitForge.objects.create(
+            project=project, host="gitlab.example.com", forge_id=1
+        )
+
+    def _sent(self, mock_publish):
+        return [
+            (item.git_forge_id, item.task, item.args)
+            for call in mock_publish.call_args_list
+            for item in call[0][0]
+        ]
+
+    def test_limit(self, mock_publish):
+        """Assert a Git forge never has more than the limit of tasks started."""
+        for series_id in range(3):
+            scheduler.submit(tasks.open_merge_request, (series_id,), 1, size=1)
+
+        self.assertEqual(
+            [
+                (1, tasks.open_merge_request.name, "[0]"),
+                (1, tasks.open_merge_request.name, "[1]"),
+            ],
+            self._sent(mock_publish),
+        )
+        self.assertEqual(
+            1, models.WorkItem.objects.filter(started__isnull=True).count()
+        )
+
+    def test_smallest_first(self, mock_publish):
+        """Assert comments and small series are sent before large series."""
+        with transaction_mock():
+            scheduler.submit(tasks.open_merge_request, (1,), 1, size=20)
+            scheduler.submit(tasks.open_merge_request, (2,), 1, size=3)
+            scheduler.submit(tasks.submit_gitlab_comment, (3,), 1)
+
+        scheduler.schedule()
+
+        self.assertEqual(
+            [
+                (1, tasks.submit_gitlab_comment.name, "[3]"),
+                (1, tasks.open_merge_request.name, "[2]"),
+            ],
+            self._sent(mock_publish),
+        )
+
+    @override_settings(PATCHLAB_FAIR_SHARE_MAX_WAIT=60)
+    def test_max_wait(self, mock_publish):
+        """Assert tasks that have waited too long go before smaller ones."""
+        with transaction_mock():
+            scheduler.submit(tasks.open_merge_request, (1,), 1, size=20)
+            scheduler.submit(tasks.open_merge_request, (2,), 1, size=10)
+            scheduler.submit(tasks.submit_gitlab_comment, (3,), 1)
+        models.WorkItem.objects.filter(args__in=["[1]", "[2]"]).update(
+            created=timezone.now() - datetime.timedelta(seconds=61)
+        )
+        models.WorkItem.objects.filter(args="[1]").update(
+            created=timezone.now() - datetime.timedelta(seconds=120)
+        )
+
+        scheduler.schedule()
+
+        self.assertEqual(
+            [
+                (1, tasks.open_merge_request.name, "[1]"),
+                (1, tasks.open_merge_request.name, "[2]"),
+            ],
+            self._sent(mock_publish),
+        )
+
+    def test_round_robin(self, mock_publish):
+        """Assert Git forges take turns, starting with the longest waiting."""
+        with transaction_mock():
+            for series_id in range(3):
+                scheduler.submit(tasks.open_merge_request, (series_id,), 1)
+            scheduler.submit(tasks.open_merge_request, (3,), self.other_forge.pk)
+
+        scheduler.schedule()
+
+        self.assertEqual(
+            [
+                (1, tasks.open_merge_request.name, "[0]"),
+                (self.other_forge.pk, tasks.open_merge_request.name, "[3]"),
+                (1, tasks.open_merge_request.name, "[1]"),
+            ],
+            self._sent(mock_publish),
+        )
+
+    def test_finish(self, mock_publish):
+        """Assert the next task is sent when one finishes."""
+        for series_id in range(3):
+            scheduler.submit(tasks.open_merge_request, (series_id,), 1)
+        finished = models.WorkItem.objects.get(args="[0]")
+        mock_publish.reset_mock()
+
+        tasks.finish_work(finished.pk)
+
+        self.assertFalse(models.WorkItem.objects.filter(pk=finished.pk).exists())
+        self.assertEqual(
+            [(1, tasks.open_merge_request.name, "[2]")], self._sent(mock_publish)
+        )
+
+    @override_settings(PATCHLAB_FAIR_SHARE_TIMEOUT=60)
+    def test_lost(self, mock_publish):
+        """Assert tasks that never finished stop counting against the limit."""
+        for series_id in range(3):
+            scheduler.submit(tasks.open_merge_request, (series_id,), 1)
+        models.WorkItem.objects.filter(started__isnull=False).update(
+            started=timezone.now() - datetime.timedelta(seconds=61)
+        )
+        mock_publish.reset_mock()
+
+        scheduler.schedule()
+
+        self.assertEqual(1, models.WorkItem.objects.count())
+        self.assertEqual(
+            [(1, tasks.open_merge_request.name, "[2]")], self._sent(mock_publish)
+        )
+
+
+@override_settings(PATCHLAB_FAIR_SHARE_LIMIT=1)
+@mock.patch("patchlab.scheduler.transaction.on_commit", lambda callback: callback())
+class PublishTests(BaseTestCase):
+    """Tests for sending the tasks :mod:`patchlab.scheduler` starts."""
+
+    @mock.patch("patchlab.scheduler.current_app")
+    def test_linked(self, mock_app):
+        """Assert tasks are sent with a callback for when they finish."""
+        scheduler.submit(tasks.open_merge_request, (1,), 1)
+
+        item = models.WorkItem.objects.get()
+        mock_app.tasks[
+            tasks.open_merge_request.name
+        ].apply_async.assert_called_once_with(
+            [1],
+            producer=mock.ANY,
+            link=tasks.finish_work.si(item.pk),
+            link_error=tasks.finish_work.si(item.pk),
+        )
+        self.assertIsNotNone(item.started)
+
+    @mock.patch("patchlab.scheduler.current_app")
+    def test_failed(self, mock_app):
+        """Assert tasks that couldn't be sent wait for the next run."""
+        mock_app.tasks[tasks.open_merge_request.name].apply_async.side_effect = (
+            Exception("Boom")
+        )
+
+        scheduler.submit(tasks.open_merge_request, (1,), 1)
+
+        self.assertIsNone(models.WorkItem.objects.get().started)
+
+
+def transaction_mock():
+    """Hold back scheduling until the block exits, as if it were a transaction."""
+    return mock.patch("patchlab.scheduler.transaction.on_commit", lambda callback: None)
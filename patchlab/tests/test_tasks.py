@@ -0,0 +1,129 @@
+from email import message_from_string
+from unittest import mock
+
+from django.core.cache import cache
+from patchwork import models as pw_models
+from patchwork.parser import parse_mail
+
+from patchlab import gitlab2email, models, tasks
+from . import BaseTestCase
+
+
+@mock.patch("patchlab.tasks.merge_request_hook.apply_async")
+class DispatchMergeRequestTests(BaseTestCase):
+    """Tests for :func:`patchlab.tasks.dispatch_merge_request`."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.snapshot = gitlab2email.MergeRequestSnapshot(iid=2, sha="abc123")
+
+    def test_duplicate_revision(self, mock_apply_async):
+        """Assert a merge request revision is only queued once."""
+        self.assertTrue(tasks.dispatch_merge_request("gitlab", 1, 2, self.snapshot))
+        self.assertFalse(tasks.dispatch_merge_request("gitlab", 1, 2, self.snapshot))
+
+        mock_apply_async.assert_called_once_with(
+            ("gitlab", 1, 2, self.snapshot._asdict())
+        )
+
+    def test_new_revision(self, mock_apply_async):
+        """Assert new revisions of a merge request are queued."""
+        self.assertTrue(tasks.dispatch_merge_request("gitlab", 1, 2, self.snapshot))
+        self.assertTrue(
+            tasks.dispatch_merge_request(
+                "gitlab", 1, 2, self.snapshot._replace(sha="def456")
+            )
+        )
+
+        self.assertEqual(2, mock_apply_async.call_count)
+
+    def test_queue_failure(self, mock_apply_async):
+        """Assert a revision that failed to queue can be queued again."""
+        mock_apply_async.side_effect = [ValueError("broker down"), None]
+
+        self.assertRaises(
+            ValueError, tasks.dispatch_merge_request, "gitlab", 1, 2, self.snapshot
+        )
+        self.assertTrue(tasks.dispatch_merge_request("gitlab", 1, 2, self.snapshot))
+
+
+@mock.patch("patchlab.tasks.gitlab_module.Gitlab.from_config", mock.Mock())
+@mock.patch("patchlab.tasks.gitlab2email.email_merge_request")
+class MergeRequestHookTests(BaseTestCase):
+    """Tests for :func:`patchlab.tasks.merge_request_hook`."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_lock_released(self, mock_email_merge_request):
+        """Assert the merge request lock is released after bridging."""
+        tasks.merge_request_hook("gitlab", 1, 2)
+        tasks.merge_request_hook("gitlab", 1, 2)
+
+        self.assertEqual(2, mock_email_merge_request.call_count)
+
+    def test_locked(self, mock_email_merge_request):
+        """Assert a merge request being bridged by another worker is retried."""
+        with tasks._merge_request_lock("gitlab", 1, 2):
+            with mock.patch("patchlab.tasks.merge_request_hook.retry") as mock_retry:
+                mock_retry.return_value = ValueError("retry")
+                self.assertRaises(ValueError, tasks.merge_request_hook, "gitlab", 1, 2)
+
+        mock_email_merge_request.assert_not_called()
+        mock_retry.assert_called_once_with(throw=False, countdown=60, max_retries=None)
+
+    def test_revision_requeued(self, mock_email_merge_request):
+        """Assert a revision can be queued again once a task has handled it."""
+        snapshot = gitlab2email.MergeRequestSnapshot(
+            iid=2, sha="abc123", pipeline_status="failed"
+        )
+        with mock.patch("patchlab.tasks.merge_request_hook.apply_async"):
+            self.assertTrue(tasks.dispatch_merge_request("gitlab", 1, 2, snapshot))
+            tasks.merge_request_hook("gitlab", 1, 2, snapshot._asdict())
+
+            self.assertTrue(
+                tasks.dispatch_merge_request(
+                    "gitlab", 1, 2, snapshot._replace(pipeline_status="success")
+                )
+            )
+
+
+@mock.patch("patchlab.events.dispatch")
+class ReconcileImportTests(BaseTestCase):
+    """Tests for :func:`patchlab.tasks.reconcile_import`."""
+
+    def test_bridged_series(self, mock_dispatch):
+        """Assert series that came from GitLab aren't sent back to it."""
+        with mock.patch("patchlab.events.dispatch_series") as mock_dispatch_series:
+            tasks.reconcile_import(0, [])
+
+        mock_dispatch_series.assert_not_called()
+
+    def test_comments(self, mock_dispatch):
+        """Assert comments imported on bridged submissions are dispatched."""
+        comment = (
+            "Subject: Re: [TEST PATCH] Bring balance to the equals signs\n"
+            "From: Jeremy Cline <jcline@redhat.com>\n"
+            "To: patchlab@patchlab.example.com\n"
+            "Date: Mon, 04 Nov 2019 23:00:00 -0000\n"
+            "Message-ID: <6@localhost.localdomain>\n"
+            "In-Reply-To: <4@localhost.localdomain>\n"
+            "List-Id: patchlab.example.com\n\n"
+            "Acked-by: Jeremy Cline <jcline@redhat.com>\n"
+        )
+        parse_mail(message_from_string(comment), "patchlab.example.com")
+        comment = pw_models.Comment.objects.get()
+        models.BridgedSubmission.objects.create(
+            git_forge=models.GitForge.objects.get(pk=1),
+            submission=comment.submission,
+            merge_request=2,
+        )
+        mock_dispatch.reset_mock()
+
+        tasks.reconcile_import(0, [comment.id])
+
+        mock_dispatch.assert_called_once_with(
+            tasks.submit_gitlab_comment, (comment.id,)
+        )
@@ -0,0 +1,49 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+from unittest import mock
+
+from django.db import DatabaseError, transaction
+
+from patchlab import transactions
+from . import BaseTestCase
+
+
+class OnCommitCallbacksTests(BaseTestCase):
+    """Tests for :func:`patchlab.transactions.on_commit_callbacks`."""
+
+    def test_layout(self):
+        """
+        Assert the callbacks are found with the installed Django version.
+
+        If this fails, Django has changed how it stores commit callbacks and
+        :data:`transactions.SUPPORTED_DJANGO_VERSIONS` needs updating.
+        """
+        outer, inner = mock.Mock(), mock.Mock()
+        transaction.on_commit(outer)
+        with transaction.atomic():
+            transaction.on_commit(inner)
+
+            self.assertEqual([outer, inner], transactions.on_commit_callbacks())
+            self.assertEqual([inner], transactions.on_commit_callbacks(innermost=True))
+
+    def test_rolled_back(self):
+        """Assert callbacks of a rolled back savepoint aren't found."""
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                transaction.on_commit(mock.Mock())
+                raise DatabaseError("Boom")
+
+        self.assertEqual([], transactions.on_commit_callbacks())
+
+    @mock.patch("patchlab.transactions.django.VERSION", (99, 0, 0, "final", 0))
+    def test_unsupported_version(self):
+        """Assert no callbacks are found with an unknown Django version."""
+        transaction.on_commit(mock.Mock())
+
+        self.assertEqual([], transactions.on_commit_callbacks())
+
+    def test_unexpected_layout(self):
+        """Assert no callbacks are found if an entry isn't laid out as expected."""
+        with mock.patch.object(
+            transaction.get_connection(), "run_on_commit", [mock.Mock()]
+        ):
+            self.assertEqual([], transactions.on_commit_callbacks())
@@ -0,0 +1,162 @@
+from unittest import mock
+import json
+
+from asgiref.sync import async_to_sync
+from django import http
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from patchlab.views import gitlab as views
+from . import BaseTestCase
+
+MERGE_REQUEST_HOOK = {
+    "object_kind": "merge_request",
+    "object_attributes": {
+        "action": "open",
+        "iid": 2,
+        "target_branch": "master",
+        "description": "A very long description",
+        "last_commit": {"id": "abc123", "message": "A commit"},
+    },
+    "labels": [{"id": 1, "title": "Do Not Email"}],
+    "changes": {"description": {"previous": "", "current": "A very long description"}},
+    "project": {"id": 1, "web_url": "https://gitlab/root/kernel"},
+}
+
+
+class WebHookAsyncTests(SimpleTestCase):
+    """Tests for :func:`patchlab.views.gitlab.web_hook_async`."""
+
+    def setUp(self):
+        views._queue = None
+        self.handler = mock.Mock(return_value=http.HttpResponse("Success!"))
+        patcher = mock.patch.dict(views.WEBHOOKS, {"Merge Request Hook": self.handler})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, token="change this"):
+        request = RequestFactory().post(
+            "/patchlab/gitlab/async/",
+            data=json.dumps(MERGE_REQUEST_HOOK),
+            content_type="application/json",
+            HTTP_X_GITLAB_TOKEN=token,
+            HTTP_X_GITLAB_EVENT="Merge Request Hook",
+        )
+        return views.web_hook_async(request)
+
+    def test_accepted(self):
+        """Assert web hooks are handed to their handler with a slimmed payload."""
+
+        async def post():
+            response = await self._post()
+            await views._handoff_queue().join()
+            return response
+
+        response = async_to_sync(post)()
+
+        self.assertEqual(202, response.status_code)
+        self.handler.assert_called_once_with(
+            {
+                "object_attributes": {
+                    "action": "open",
+                    "iid": 2,
+                    "target_branch": "master",
+                    "last_commit": {"id": "abc123"},
+                },
+                "labels": [{"title": "Do Not Email"}],
+                "project": {"id": 1, "web_url": "https://gitlab/root/kernel"},
+            }
+        )
+
+    def test_invalid_token(self):
+        """Assert the web hook secret is checked."""
+        response = async_to_sync(self._post)(token="wrong")
+
+        self.assertEqual(403, response.status_code)
+        self.handler.assert_not_called()
+
+    @override_settings(PATCHLAB_WEBHOOK_QUEUE_SIZE=1)
+    def test_queue_full(self):
+        """Assert events are rejected, with a warning, when the queue is full."""
+
+        async def post_twice():
+            # Nothing is handled until the test yields to the event loop
+            first = await self._post()
+            second = await self._post()
+            await views._handoff_queue().join()
+            return first, second
+
+        with mock.patch("patchlab.views.gitlab._log") as mock_log:
+            first, second = async_to_sync(post_twice)()
+
+        self.assertEqual(202, first.status_code)
+        self.assertEqual(429, second.status_code)
+        self.assertNotIn("Retry-After", second)
+        mock_log.warning.assert_called_once_with(
+            "Web hook queue is full; dropping %s for project %s",
+            "Merge Request Hook",
+            1,
+        )
+        self.assertEqual(1, self.handler.call_count)
+
+
+@mock.patch("patchlab.views.gitlab.dispatch_merge_request")
+@mock.patch("patchlab.views.gitlab.email_comment")
+class RoutingTests(BaseTestCase):
+    """Tests for the web hooks rejected by :mod:`patchlab.routing`."""
+
+    def _note(self, noteable_type="MergeRequest", username="jcline"):
+        return {
+            "object_kind": "note",
+            "user": {"name": "Jeremy Cline", "username": username},
+            "project": {"id": 1, "web_url": "https://gitlab/root/kernel"},
+            "object_attributes": {
+                "id": 2,
+                "note": "Looks good",
+                "noteable_type": noteable_type,
+                "project_id": 1,
+                "url": "https://gitlab/root/kernel/merge_requests/2#note_2",
+            },
+            "merge_request": {"iid": 2, "target_branch": "master"},
+        }
+
+    def test_routable_note(self, mock_email_comment, mock_dispatch):
+        """Assert notes on a configured merge request are dispatched."""
+        response = views.comment(self._note())
+
+        self.assertEqual(b"Success!", response.content)
+        mock_email_comment.apply_async.assert_called_once()
+
+    def test_note_on_issue(self, mock_email_comment, mock_dispatch):
+        """Assert notes on issues are dropped without queuing a task."""
+        response = views.comment(self._note(noteable_type="Issue"))
+
+        self.assertEqual(200, response.status_code)
+        mock_email_comment.apply_async.assert_not_called()
+
+    @override_settings(PATCHLAB_GITLAB_BOT_USERNAMES=["patchlab-bot"])
+    def test_note_by_bot(self, mock_email_comment, mock_dispatch):
+        """Assert notes posted by the bridge are dropped without queuing a task."""
+        response = views.comment(self._note(username="patchlab-bot"))
+
+        self.assertEqual(200, response.status_code)
+        mock_email_comment.apply_async.assert_not_called()
+
+    def test_note_on_unconfigured_branch(self, mock_email_comment, mock_dispatch):
+        """Assert notes on merge requests for other branches are dropped."""
+        payload = self._note()
+        payload["merge_request"]["target_branch"] = "stable"
+
+        response = views.comment(payload)
+
+        self.assertEqual(200, response.status_code)
+        mock_email_comment.apply_async.assert_not_called()
+
+    def test_merge_request_unconfigured_branch(self, mock_email_comment, mock_dispatch):
+        """Assert merge requests for branches that aren't bridged are dropped."""
+        payload = json.loads(json.dumps(MERGE_REQUEST_HOOK))
+        payload["object_attributes"]["target_branch"] = "stable"
+
+        response = views.merge_request(payload)
+
+        self.assertEqual(200, response.status_code)
+        mock_dispatch.assert_not_called()
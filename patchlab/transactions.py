@@ -0,0 +1,83 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+"""
+Look up the callbacks waiting for the current transaction to commit.
+
+Django has no public API for this, so it's read from the connection's
+``run_on_commit`` list, where each entry starts with the set of savepoint IDs
+that were open when the callback was registered, followed by the callback.
+That has been the layout since Django 2.0; with any Django version it hasn't
+been checked against, or if the layout doesn't look right, no callbacks are
+found and callers register new ones as if none were waiting. Patchlab keeps
+working, but every dispatched task and scheduled run then has its own
+callback.
+"""
+import logging
+import typing
+
+import django
+from django.db import transaction
+
+_log = logging.getLogger(__name__)
+
+#: The Django versions whose ``run_on_commit`` layout is known, from the first
+#: up to, but not including, the last.
+SUPPORTED_DJANGO_VERSIONS = ((2, 0), (6, 1))
+
+_warned = False
+
+
+def on_commit_callbacks(innermost: bool = False) -> typing.List[typing.Callable]:
+    """
+    Get the callbacks waiting for the current transaction to commit.
+
+    Every callback that's still registered will run if the work done since
+    has committed, since rolling a savepoint back discards the callbacks
+    registered in it.
+
+    Args:
+        innermost: Only include callbacks registered in the innermost open
+            savepoint, which are the ones that are discarded along with work
+            done now if that savepoint is rolled back.
+
+    Returns:
+        The callbacks, in the order they were registered. The list is empty
+        outside a transaction, or if the callbacks can't be looked up with
+        this version of Django.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block or not _supported():
+        return []
+
+    savepoint_ids = set(connection.savepoint_ids)
+    callbacks = []
+    for entry in connection.run_on_commit:
+        if not (
+            isinstance(entry, tuple)
+            and len(entry) >= 2
+            and isinstance(entry[0], set)
+            and callable(entry[1])
+        ):
+            _warn(f"an entry is laid out unexpectedly: {entry!r}")
+            return []
+        if not innermost or entry[0] == savepoint_ids:
+            callbacks.append(entry[1])
+    return callbacks
+
+
+def _supported() -> bool:
+    oldest, newest = SUPPORTED_DJANGO_VERSIONS
+    if oldest <= django.VERSION[:2] < newest:
+        return True
+    _warn(f"Django {django.get_version()} hasn't been checked")
+    return False
+
+
+def _warn(reason: str) -> None:
+    global _warned
+    if not _warned:
+        _warned = True
+        _log.warning(
+            "Unable to look up commit callbacks, as %s; each task will be "
+            "dispatched with its own callback",
+            reason,
+        )
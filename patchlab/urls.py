@@ -23,4 +23,7 @@ from . import views
 #: a header. Each path is available underneath the parent ``patchlab/`` path.
 gitlab_webhook = path("gitlab/", views.gitlab.web_hook)
 
-urlpatterns = [gitlab_webhook]
+#: The asynchronous endpoint for Gitlab web hooks, for use under ASGI.
+gitlab_webhook_async = path("gitlab/async/", views.gitlab.web_hook_async)
+
+urlpatterns = [gitlab_webhook, gitlab_webhook_async]
@@ -1,14 +1,19 @@
 # SPDX-License-Identifier: GPL-2.0-or-later
 """Web hooks for bridging GitLab into email."""
+import asyncio
 import json
-import urllib
 import logging
+import typing
+import urllib
 
+from asgiref.sync import sync_to_async
 from django import http
 from django.conf import settings
 from django.views.decorators import csrf, http as http_decorators
 
-from patchlab.tasks import email_comment, merge_request_hook
+from patchlab import journal, routing, scheduler
+from patchlab.gitlab2email import MergeRequestSnapshot
+from patchlab.tasks import dispatch_merge_request, email_comment
 
 _log = logging.getLogger(__name__)
 
@@ -22,33 +27,152 @@ def web_hook(request: http.HttpRequest) -> http.HttpResponse:
     This is responsible for checking the authenticity of the request and
     dispatching it to the proper function based on the X-Gitlab-Event header.
     """
+    error = _authenticate(request)
+    if error:
+        return error
+
     try:
-        secret = request.headers["X-Gitlab-Token"]
-    except KeyError:
-        return http.HttpResponseForbidden("Permission denied: missing web hook token")
+        payload = json.loads(request.body)
+    except json.JSONDecodeError:
+        return http.HttpResponseBadRequest("JSON body required in POST")
 
-    if secret != settings.PATCHLAB_GITLAB_WEBHOOK_SECRET:
-        return http.HttpResponseForbidden("Permission denied: invalid web hook token")
+    handler = _handler(request)
+    if handler is None:
+        return http.HttpResponseBadRequest("No web hook handler for request")
+
+    journal.record(request)
+
+    return handler(payload)
+
+
+async def web_hook_async(request: http.HttpRequest) -> http.HttpResponse:
+    """
+    Asynchronous web hook handler for GitLab, for use under ASGI.
+
+    This accepts the same web hooks as :func:`web_hook`, but rather than
+    queuing Celery tasks while GitLab waits, it places the event on a bounded
+    in-process queue and responds with 202 Accepted. The whole body is
+    decoded, but only the parts of the payload the handlers use are kept on
+    the queue, so large fields don't wait in memory. If the queue is full
+    because the broker has fallen behind, it responds with 429 Too Many
+    Requests rather than letting the web hook time out. GitLab doesn't retry
+    failed web hooks, so the event is dropped; it's logged as a warning and,
+    if the journal is enabled, can be replayed from it with the
+    ``replay_webhooks`` command.
+
+    Events still in the queue are lost if the process exits, so a web hook
+    that is accepted is not guaranteed to be handled.
+    """
+    if request.method != "POST":
+        return http.HttpResponseNotAllowed(["POST"])
+
+    error = _authenticate(request)
+    if error:
+        return error
 
     try:
-        payload = json.loads(request.body, encoding=request.encoding)
+        payload = json.loads(request.body)
     except json.JSONDecodeError:
         return http.HttpResponseBadRequest("JSON body required in POST")
 
+    handler = _handler(request)
+    if handler is None:
+        return http.HttpResponseBadRequest("No web hook handler for request")
+
+    journal.record(request)
+
+    payload = _slim(payload, PAYLOAD_FIELDS[request.headers["X-Gitlab-Event"]])
     try:
-        handler = WEBHOOKS[request.headers["X-Gitlab-Event"]]
-        _log.info(
-            "Handling web hook request with the '%s' handler",
+        _handoff_queue().put_nowait((handler, payload))
+    except asyncio.QueueFull:
+        _log.warning(
+            "Web hook queue is full; dropping %s for project %s",
             request.headers["X-Gitlab-Event"],
+            payload.get("project", {}).get("id"),
         )
+        return http.HttpResponse("Too many web hooks queued", status=429)
+
+    return http.HttpResponse("Accepted", status=202)
+
+
+web_hook_async.csrf_exempt = True
+
+
+def _authenticate(request: http.HttpRequest) -> typing.Optional[http.HttpResponse]:
+    """Check the web hook's secret token, returning an error response if it's bad."""
+    try:
+        secret = request.headers["X-Gitlab-Token"]
+    except KeyError:
+        return http.HttpResponseForbidden("Permission denied: missing web hook token")
+
+    if secret != settings.PATCHLAB_GITLAB_WEBHOOK_SECRET:
+        return http.HttpResponseForbidden("Permission denied: invalid web hook token")
+
+    return None
+
+
+def _handler(request: http.HttpRequest) -> typing.Optional[typing.Callable]:
+    """Find the web hook handler for the request's X-Gitlab-Event header."""
+    event = request.headers.get("X-Gitlab-Event")
+    try:
+        handler = WEBHOOKS[event]
+        _log.info("Handling web hook request with the '%s' handler", event)
     except KeyError:
         _log.error(
             "No web hook handler for '%s' events; Adjust your web hooks on GitLab",
-            request.headers["X-Gitlab-Event"],
+            event,
         )
-        return http.HttpResponseBadRequest("No web hook handler for request")
+        return None
+    return handler
 
-    return handler(payload)
+
+def _slim(value, fields):
+    """
+    Copy only the given fields of a JSON value.
+
+    Args:
+        value: The decoded JSON value.
+        fields: A dictionary of the keys to keep, mapped to the fields to keep
+            of their values, or None to keep a value whole. Lists are slimmed
+            element by element.
+    """
+    if fields is None or value is None:
+        return value
+    if isinstance(value, list):
+        return [_slim(item, fields) for item in value]
+    return {key: _slim(value[key], fields[key]) for key in fields if key in value}
+
+
+_queue = None
+
+
+def _handoff_queue() -> asyncio.Queue:
+    """
+    Get the queue of web hooks waiting to be handled in this event loop.
+
+    The queue is created on first use along with a task that feeds the queued
+    web hooks to their handlers in a thread, one at a time.
+    """
+    global _queue
+
+    loop = asyncio.get_event_loop()
+    if _queue is None or _queue[0] is not loop:
+        queue = asyncio.Queue(maxsize=settings.PATCHLAB_WEBHOOK_QUEUE_SIZE)
+        _queue = (loop, queue, loop.create_task(_drain(queue)))
+    return _queue[1]
+
+
+async def _drain(queue: asyncio.Queue) -> None:
+    """Hand queued web hooks to their handlers."""
+    while True:
+        handler, payload = await queue.get()
+        try:
+            response = await sync_to_async(handler)(payload)
+            _log.info("Handled queued web hook: %s", response.content.decode())
+        except Exception:
+            _log.exception("Failed to handle queued web hook")
+        finally:
+            queue.task_done()
 
 
 def merge_request(payload: dict) -> http.HttpResponse:
@@ -87,8 +211,14 @@ def merge_request(payload: dict) -> http.HttpResponse:
 
     project_id = payload["project"]["id"]
     merge_id = payload["object_attributes"]["iid"]
+    snapshot = MergeRequestSnapshot.from_merge_request_hook(payload)
     host = urllib.parse.urlsplit(payload["project"]["web_url"]).hostname
-    merge_request_hook.apply_async((host, project_id, merge_id))
+    if not routing.is_routable(host, project_id, snapshot.target_branch):
+        return http.HttpResponse(
+            "Skipping event as the project or branch isn't bridged"
+        )
+    if not dispatch_merge_request(host, project_id, merge_id, snapshot):
+        return http.HttpResponse("Skipping event as this revision is already queued")
     return http.HttpResponse("Success!")
 
 
@@ -119,9 +249,15 @@ def pipeline(payload: dict) -> http.HttpResponse:
     project_id = payload["project"]["id"]
     merge_id = payload["merge_request"]["iid"]
     host = urllib.parse.urlsplit(payload["project"]["web_url"]).hostname
+    snapshot = MergeRequestSnapshot.from_pipeline_hook(payload)
+    if not routing.is_routable(host, project_id, snapshot.target_branch):
+        return http.HttpResponse(
+            "Skipping event as the project or branch isn't bridged"
+        )
 
     _log.info("Dispatching task to email merge request for pipeline")
-    merge_request_hook.apply_async((host, project_id, merge_id))
+    if not dispatch_merge_request(host, project_id, merge_id, snapshot):
+        return http.HttpResponse("Skipping event as this revision is already queued")
     return http.HttpResponse("Success!")
 
 
@@ -134,15 +270,32 @@ def comment(payload: dict) -> http.HttpResponse:
     https://docs.gitlab.com/ce/user/project/integrations/webhooks.html
     """
     project_id = payload["object_attributes"]["project_id"]
-    if payload["object_attributes"]["noteable_type"] == "MergeRequest":
+    noteable_type = payload["object_attributes"]["noteable_type"]
+    if noteable_type not in ("MergeRequest", "Commit"):
+        _log.info("Ignoring comment web hook on a %s", noteable_type)
+        return http.HttpResponse(
+            f"Skipping event as comments on a {noteable_type} aren't bridged"
+        )
+    if routing.is_bot(payload["user"]["username"]):
+        return http.HttpResponse("Skipping event as it was posted by the bridge")
+
+    target_branch = None
+    if noteable_type == "MergeRequest":
         merge_id = payload["merge_request"]["iid"]
+        target_branch = payload["merge_request"].get("target_branch")
     else:
         merge_id = None
     host = urllib.parse.urlsplit(payload["project"]["web_url"]).hostname
+    if not routing.is_routable(host, project_id, target_branch):
+        return http.HttpResponse(
+            "Skipping event as the project or branch isn't bridged"
+        )
 
-    email_comment.apply_async(
-        (host, project_id, payload["user"], payload["object_attributes"], merge_id,)
-    )
+    args = (host, project_id, payload["user"], payload["object_attributes"], merge_id)
+    if settings.PATCHLAB_FAIR_SHARE_LIMIT:
+        scheduler.submit(email_comment, args, routing.git_forge(host, project_id).pk)
+    else:
+        email_comment.apply_async(args)
     return http.HttpResponse("Success!")
 
 
@@ -161,3 +314,40 @@ WEBHOOKS = {
     "Note Hook": comment,
     "Pipeline Hook": pipeline,
 }
+
+#: The parts of each web hook's payload used by its handler in :data:`WEBHOOKS`.
+#: :func:`web_hook_async` decodes the whole payload but only queues these, as
+#: GitLab includes things like the full list of changes, which can be quite
+#: large, in its payloads.
+PAYLOAD_FIELDS = {
+    "Merge Request Hook": {
+        "object_attributes": {
+            "action": None,
+            "oldrev": None,
+            "iid": None,
+            "target_branch": None,
+            "work_in_progress": None,
+            "merge_status": None,
+            "last_commit": {"id": None},
+        },
+        "labels": {"title": None},
+        "project": {"id": None, "web_url": None},
+    },
+    "Note Hook": {
+        "object_attributes": {
+            "project_id": None,
+            "noteable_type": None,
+            "note": None,
+            "url": None,
+            "commit_id": None,
+        },
+        "merge_request": {"iid": None, "target_branch": None},
+        "user": {"name": None, "username": None},
+        "project": {"web_url": None},
+    },
+    "Pipeline Hook": {
+        "object_attributes": {"status": None, "source": None, "sha": None},
+        "merge_request": {"iid": None, "target_branch": None, "merge_status": None},
+        "project": {"id": None, "web_url": None},
+    },
+}